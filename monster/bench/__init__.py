@@ -0,0 +1 @@
+"""Fake infrastructure for benchmarking builds without real servers."""
@@ -0,0 +1,132 @@
+"""In-memory stand-in for the Chef server REST API."""
+import BaseHTTPServer
+import json
+import logging
+import SocketServer
+import threading
+import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class FakeChefServer(object):
+    """Serves the chef objects monster reads and writes (nodes,
+    environments, clients, roles and so on) from memory over HTTP. Requests
+    are not authenticated, and searches only support ANDed key:value terms.
+    """
+    def __init__(self, host="127.0.0.1", port=0):
+        """
+        :param port: port to listen on; any free port by default
+        :type port: int
+        """
+        self.objects = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _HTTPServer((host, port), _Handler)
+        self._server.chef = self
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://{0}:{1}".format(*self._server.server_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="fake-chef-server")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, method, path, body):
+        """Applies a request to the stored objects.
+        :return: status code and response body
+        :rtype: tuple
+        """
+        url = urlparse.urlparse(path)
+        parts = [part for part in url.path.split('/') if part]
+        with self._lock:
+            self.requests += 1
+            if not parts:
+                return 404, {'error': ["Not found"]}
+            if parts[0] == 'search' and len(parts) == 2:
+                query = urlparse.parse_qs(url.query).get('q', ['*:*'])[0]
+                return 200, self._search(parts[1], query)
+            collection = self.objects.setdefault(parts[0], {})
+            if len(parts) == 1:
+                if method == 'GET':
+                    return 200, {name: "{0}/{1}/{2}".format(self.url,
+                                                            parts[0], name)
+                                 for name in collection}
+                if method == 'POST':
+                    name = body.get('name') or body.get('clientname')
+                    if name in collection:
+                        return 409, {'error': ["Conflict"]}
+                    collection[name] = body
+                    return 201, {'uri': "{0}/{1}/{2}".format(
+                        self.url, parts[0], name)}
+            else:
+                name = '/'.join(parts[1:])
+                if name not in collection:
+                    return 404, {'error': ["Not found"]}
+                if method == 'GET':
+                    return 200, collection[name]
+                if method == 'PUT':
+                    collection[name] = body
+                    return 200, body
+                if method == 'DELETE':
+                    return 200, collection.pop(name)
+            return 405, {'error': ["Method not allowed"]}
+
+    def _search(self, index, query):
+        terms = [term.split(':', 1) for term in query.split(' AND ')
+                 if term and term != '*:*']
+        rows = [obj for obj in self.objects.get(index, {}).values()
+                if all(_matches(obj, key, value) for key, value in terms)]
+        return {'rows': rows, 'start': 0, 'total': len(rows)}
+
+
+def _matches(obj, key, value):
+    candidates = [obj] + [obj.get(precedence) or {} for precedence
+                          in ('automatic', 'override', 'normal', 'default')]
+    for candidate in candidates:
+        if key in candidate:
+            return value == '*' or str(candidate[key]) == value
+    return False
+
+
+class _HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self._respond()
+
+    def do_PUT(self):
+        self._respond()
+
+    def do_DELETE(self):
+        self._respond()
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        status, response = self.server.chef.handle(
+            self.command, self.path, json.loads(body) if body else None)
+        payload = json.dumps(response)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
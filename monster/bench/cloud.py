@@ -0,0 +1,148 @@
+"""In-process stand-ins for the nova and neutron clients."""
+import itertools
+import threading
+import time
+import uuid
+
+
+class FakeCloud(object):
+    """Compute and network clients over shared in-memory state. Each new
+    server is given the next loopback address, added to the fake SSH
+    server, and becomes ACTIVE once boot_time seconds have passed.
+    """
+    def __init__(self, ssh_server, flavors, images, networks=(),
+                 boot_time=0.0):
+        """
+        :type ssh_server: monster.bench.ssh.FakeSSHServer
+        :param flavors: names of the flavors offered
+        :type flavors: iterable (str)
+        :param images: names of the images offered
+        :type images: iterable (str)
+        :param networks: labels of the networks that already exist
+        :type networks: iterable (str)
+        :param boot_time: seconds a server takes to become ACTIVE
+        :type boot_time: float
+        """
+        self.ssh_server = ssh_server
+        self.boot_time = boot_time
+        self.requests = 0
+        self.servers = {}
+        self.networks = {}
+        for label in networks:
+            network = _Resource(id=str(uuid.uuid4()), label=label)
+            self.networks[network.id] = network
+        self._addresses = ("127.0.{0}.{1}".format(high, low)
+                           for high, low in itertools.product(
+                               range(0, 255), range(2, 255)))
+        self._lock = threading.Lock()
+        self.compute = _Compute(self, flavors, images)
+        self.neutron = _Networks(self)
+
+    def request(self):
+        with self._lock:
+            self.requests += 1
+
+    def create_server(self, name, image, flavor):
+        with self._lock:
+            address = next(self._addresses)
+        self.ssh_server.add_host(address)
+        server = FakeServer(self, name, address, image, flavor)
+        with self._lock:
+            self.servers[server.id] = server
+        return server
+
+
+class FakeServer(object):
+    def __init__(self, cloud, name, address, image, flavor):
+        self.cloud = cloud
+        self.id = str(uuid.uuid4())
+        self.name = name
+        self.accessIPv4 = address
+        self.image = image
+        self.flavor = flavor
+        self.adminPass = uuid.uuid4().hex
+        self.created = time.time()
+
+    @property
+    def status(self):
+        if time.time() - self.created < self.cloud.boot_time:
+            return "BUILD"
+        return "ACTIVE"
+
+    @property
+    def progress(self):
+        if not self.cloud.boot_time:
+            return 100
+        elapsed = time.time() - self.created
+        return min(100, int(elapsed / self.cloud.boot_time * 100))
+
+    def update(self, name=None):
+        self.cloud.request()
+        if name:
+            self.name = name
+
+    def delete(self):
+        self.cloud.request()
+        self.cloud.servers.pop(self.id, None)
+
+
+class _Resource(object):
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class _Compute(object):
+    def __init__(self, cloud, flavors, images):
+        self.servers = _Servers(cloud)
+        self.flavors = _Listing(cloud, [_Resource(id=str(uuid.uuid4()),
+                                                  name=name)
+                                        for name in flavors])
+        self.images = _Listing(cloud, [_Resource(id=str(uuid.uuid4()),
+                                                 name=name)
+                                       for name in images])
+
+
+class _Listing(object):
+    def __init__(self, cloud, items):
+        self.cloud = cloud
+        self.items = items
+
+    def list(self):
+        self.cloud.request()
+        return list(self.items)
+
+
+class _Servers(object):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def create(self, name, image, flavor, nics=None):
+        self.cloud.request()
+        return self.cloud.create_server(name, image, flavor)
+
+    def list(self, detailed=True):
+        self.cloud.request()
+        return self.cloud.servers.values()
+
+    def get(self, server_id):
+        self.cloud.request()
+        return self.cloud.servers[server_id]
+
+    def delete(self, server_id):
+        self.cloud.request()
+        self.cloud.servers.pop(server_id, None)
+
+
+class _Networks(object):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def list(self):
+        self.cloud.request()
+        return self.cloud.networks.values()
+
+    def create(self, label, cidr=None):
+        self.cloud.request()
+        network = _Resource(id=str(uuid.uuid4()), label=label, cidr=cidr)
+        self.cloud.networks[network.id] = network
+        return network
@@ -0,0 +1,225 @@
+"""Runs a full deployment build against fake infrastructure: nova and
+neutron clients answered in-process, a local SSH server standing in for
+every node, two in-memory chef servers (the workstation's and the one the
+build installs) and a fake redis. Only monster's own work and the latency
+configured for the fakes is measured.
+"""
+import copy
+import logging
+import os
+import shutil
+import socket
+import StringIO
+import sys
+import tempfile
+import time
+
+import paramiko
+import redis
+
+import monster.active as active
+import monster.db as db
+from monster.bench.chef_server import FakeChefServer
+from monster.bench.cloud import FakeCloud
+from monster.bench.ssh import FakeSSHServer
+
+logger = logging.getLogger(__name__)
+
+# provisioner name the harness registers for its fake cloud
+PROVISIONER = 'bench'
+
+
+class Harness(object):
+    """Fake infrastructure for one or more benchmark builds."""
+    def __init__(self, latency=0.0, boot_time=0.0,
+                 config="pubcloud-neutron.yaml"):
+        """
+        :param latency: seconds each SSH command takes to run
+        :type latency: float
+        :param boot_time: seconds each server takes to become ACTIVE
+        :type boot_time: float
+        :param config: name of the config file to build with
+        :type config: str
+        """
+        self.latency = latency
+        self.boot_time = boot_time
+        self.config_name = config
+        self.directory = None
+        self.local_chef = None
+        self.remote_chef = None
+        self.ssh_server = None
+        self.cloud = None
+        self._started = False
+        self._previous_pool = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Starts the fake servers and loads a config pointing at them.
+        The fake redis replaces the process's connection pool, including
+        that of monster.db_iface if it has already been imported, until
+        the harness is stopped.
+        """
+        try:
+            import fakeredis
+        except ImportError:
+            raise Exception("The bench harness needs fakeredis; install "
+                            "monster[bench]")
+        self._previous_pool = db.set_pool(redis.ConnectionPool(
+            connection_class=fakeredis.FakeConnection,
+            server=fakeredis.FakeServer()))
+        self._started = True
+        _rebind_database()
+        self.directory = tempfile.mkdtemp(prefix="monster-bench-")
+        key = paramiko.RSAKey.generate(2048)
+        pem = StringIO.StringIO()
+        key.write_private_key(pem)
+        key_path = os.path.join(self.directory, "admin.pem")
+        with open(key_path, 'w') as f:
+            f.write(pem.getvalue())
+
+        self.local_chef = FakeChefServer()
+        self.local_chef.start()
+        self.remote_chef = FakeChefServer()
+        self.remote_chef.start()
+        # the knife secret is where pychef starts looking for .chef/knife.rb
+        os.mkdir(os.path.join(self.directory, ".chef"))
+        with open(os.path.join(self.directory, ".chef", "knife.rb"),
+                  'w') as f:
+            f.write('node_name "admin"\n'
+                    'client_key "{0}"\n'
+                    'chef_server_url "{1}"\n'.format(key_path,
+                                                     self.local_chef.url))
+        secret_path = os.path.join(self.directory, "secret.yaml")
+        with open(secret_path, 'w') as f:
+            f.write("chef:\n    knife: {0}\n".format(self.directory))
+
+        self.ssh_server = FakeSSHServer(_free_port(), latency=self.latency)
+        self.ssh_server.script(r"cat ~/\.chef/admin\.pem", pem.getvalue())
+        self.ssh_server.script(r"^date", lambda ip, command: time.strftime(
+            "%a %b %d %H:%M:%S UTC %Y", time.gmtime()) + "\n")
+        self.ssh_server.script(r"^uname -r", "3.2.0-60-virtual\n")
+
+        self._load_config(secret_path)
+        self.cloud = FakeCloud(
+            self.ssh_server,
+            flavors=active.config[PROVISIONER]['flavors'].values(),
+            images=active.config[PROVISIONER]['images'].values(),
+            networks=active.config[PROVISIONER]['networks'],
+            boot_time=self.boot_time)
+
+        import monster.bench.provisioner as provisioner
+        import monster.provisioners.util as provisioners_util
+        provisioner.cloud = self.cloud
+        provisioners_util.PROVISIONERS[PROVISIONER] = provisioner.__name__
+
+    def stop(self):
+        for server in (self.ssh_server, self.local_chef, self.remote_chef):
+            if server is not None:
+                server.stop()
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        if self._started:
+            db.set_pool(self._previous_pool)
+            _rebind_database()
+            self._started = False
+
+    def build(self, name, nodes=6, template="ubuntu-ha-neutron",
+              branch="v4.2.1"):
+        """Builds a deployment of a template, with compute nodes added to
+        make up the requested number of nodes.
+        :param name: name of the deployment
+        :type name: str
+        :param nodes: number of nodes to build
+        :type nodes: int
+        :param template: name of the template to build
+        :type template: str
+        :param branch: branch whose templates file to read
+        :type branch: str
+        :rtype: monster.deployments.rpcs.deployment.Deployment
+        """
+        import monster.data.data as data
+        import monster.deployments.rpcs.deployment as rpcs
+
+        active.template = copy.deepcopy(data.read_template(branch, template))
+        features = active.template['features']
+        if features.get('glance') == 'cf':
+            # cloud files is not faked, so images are stored locally
+            features['glance'] = 'default'
+        specs = active.template['nodes']
+        specs.extend([['compute']] * max(0, nodes - len(specs)))
+        active.build_args = {'name': name, 'template': template,
+                             'branch': branch, 'config': self.config_name,
+                             'provisioner': PROVISIONER,
+                             'orchestrator': "chef", 'dry': False,
+                             'destroy_on_failure': False}
+        active.node_names = set()
+        deployment = rpcs.Deployment(name)
+        deployment.build()
+        return deployment
+
+    def counts(self):
+        """Returns how many requests each fake has served.
+        :rtype: dict
+        """
+        return {'ssh connections': self.ssh_server.connections,
+                'ssh commands': len(self.ssh_server.commands),
+                'chef requests (workstation)': self.local_chef.requests,
+                'chef requests (chef server)': self.remote_chef.requests,
+                'cloud api requests': self.cloud.requests}
+
+    def _load_config(self, secret_path):
+        import monster.data.data as data
+
+        config = data.read_config(self.config_name, secret_path)
+        config[PROVISIONER] = copy.deepcopy(config['rackspace'])
+        config['ssh'] = dict(config.get('ssh') or {},
+                             port=self.ssh_server.port)
+        config['chef']['server']['remote_url'] = self.remote_chef.url
+        active.config = config
+
+
+def run(name="bench", nodes=6, template="ubuntu-ha-neutron",
+        branch="v4.2.1", latency=0.0, boot_time=0.0):
+    """Builds a deployment against fake infrastructure and reports how
+    long it took and how much work it did.
+    :rtype: str
+    """
+    with Harness(latency=latency, boot_time=boot_time) as harness:
+        import monster.db_iface as database
+        from monster.utils.timing import report
+
+        start = time.time()
+        harness.build(name, nodes, template, branch)
+        elapsed = time.time() - start
+        lines = ["Built {0} nodes of {1} ({2}) in {3:.2f}s".format(
+            nodes, template, branch, elapsed), ""]
+        lines.extend("{0:>30}: {1}".format(label, count)
+                     for label, count in sorted(harness.counts().items()))
+        lines.extend(["", report(database.fetch_profile(name))])
+        return "\n".join(lines)
+
+
+def _rebind_database():
+    """Points monster.db_iface's client, which is made when it is imported,
+    at the process's current connection pool."""
+    db_iface = sys.modules.get('monster.db_iface')
+    if db_iface is not None:
+        db_iface.db = db.get_connection()
+
+
+def _free_port():
+    """Returns a port that nothing on the loopback interface listens on.
+    :rtype: int
+    """
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+    finally:
+        probe.close()
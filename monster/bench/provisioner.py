@@ -0,0 +1,26 @@
+import monster.provisioners.openstack.provisioner as openstack
+
+# the fake cloud servers are provisioned in, set by the harness
+cloud = None
+
+
+class Provisioner(openstack.Provisioner):
+    """Provisions chef nodes in the harness's fake cloud, preparing them as
+    the rackspace provisioner does."""
+    def __init__(self):
+        self.creds = None
+
+    def __str__(self):
+        return 'bench'
+
+    @property
+    def compute_client(self):
+        return cloud.compute
+
+    @property
+    def neutron(self):
+        return cloud.neutron
+
+    def post_provision(self, node):
+        node.mkswap(size=2)
+        node.initial_update()
@@ -0,0 +1,24 @@
+#! /usr/bin/env python
+"""Command-line interface for benchmarking builds against fake
+infrastructure."""
+
+import argh
+
+from monster.bench.harness import run as run_bench
+from monster.logger import logger as monster_logger
+
+
+def bench(nodes=6, template="ubuntu-ha-neutron", branch="v4.2.1",
+          latency=0.0, boot_time=0.0, name="bench", log_level="WARN"):
+    """Build a deployment against fake servers and report its timings."""
+    monster_logger.Logger(log_level=log_level).logger_setup()
+    return run_bench(name=name, nodes=nodes, template=template,
+                     branch=branch, latency=latency, boot_time=boot_time)
+
+
+def run():
+    argh.dispatch_command(bench)
+
+
+if __name__ == "__main__":
+    run()
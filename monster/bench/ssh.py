@@ -0,0 +1,139 @@
+"""Local SSH server standing in for the nodes of a fake deployment."""
+import logging
+import re
+import socket
+import threading
+import time
+
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+
+class FakeSSHServer(object):
+    """Accepts any password on each host address it is given, records the
+    commands run and answers them from a script of (pattern, output, exit
+    status) rules; commands matching no rule succeed with no output.
+    """
+    def __init__(self, port, latency=0.0, host_key=None):
+        """
+        :param port: port to listen on at each host address
+        :type port: int
+        :param latency: seconds each command takes to run
+        :type latency: float
+        :param host_key: key the server identifies itself with
+        :type host_key: paramiko.PKey
+        """
+        self.port = port
+        self.latency = latency
+        self.host_key = host_key or paramiko.RSAKey.generate(2048)
+        self.commands = []
+        self.connections = 0
+        self._rules = []
+        self._listeners = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def script(self, pattern, output="", exit_status=0):
+        """Answers commands matching a pattern; later rules take precedence.
+        :param pattern: regular expression searched for in commands
+        :type pattern: str
+        :param output: stdout of matching commands, or a function of the
+        host address and command returning it
+        :type output: str or function
+        :type exit_status: int
+        """
+        with self._lock:
+            self._rules.insert(0, (re.compile(pattern), output, exit_status))
+
+    def add_host(self, ip):
+        """Starts accepting connections on an address, such as 127.0.0.2.
+        :type ip: str
+        """
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((ip, self.port))
+        listener.listen(100)
+        with self._lock:
+            self._listeners[ip] = listener
+        thread = threading.Thread(target=self._accept, args=(ip, listener),
+                                  name="fake-ssh-{0}".format(ip))
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            listeners, self._listeners = self._listeners.values(), {}
+        for listener in listeners:
+            listener.close()
+
+    def respond(self, ip, command):
+        """Returns the output and exit status scripted for a command.
+        :rtype: tuple
+        """
+        with self._lock:
+            self.commands.append((ip, command))
+            rules = list(self._rules)
+        for pattern, output, exit_status in rules:
+            if pattern.search(command):
+                if callable(output):
+                    output = output(ip, command)
+                return output, exit_status
+        return "", 0
+
+    def _accept(self, ip, listener):
+        while not self._stopped.is_set():
+            try:
+                client, _ = listener.accept()
+            except socket.error:
+                return
+            with self._lock:
+                self.connections += 1
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            try:
+                transport.start_server(server=_Session(self, ip))
+            except (paramiko.SSHException, EOFError, socket.error) as e:
+                logger.debug("Fake SSH negotiation failed: {0}".format(e))
+
+
+class _Session(paramiko.ServerInterface):
+    def __init__(self, server, ip):
+        self.server = server
+        self.ip = ip
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        thread = threading.Thread(target=self._run, args=(channel, command))
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def _run(self, channel, command):
+        output, exit_status = self.server.respond(self.ip, command)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        try:
+            if output:
+                channel.sendall(output)
+            channel.send_exit_status(exit_status)
+            # closing before the client has seen its exec request accepted
+            # fails the request, so wait for the end of its input first
+            channel.settimeout(60)
+            while channel.recv(1024):
+                pass
+        except (paramiko.SSHException, EOFError, socket.error):
+            pass
+        finally:
+            channel.close()
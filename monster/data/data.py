@@ -1,16 +1,31 @@
+import cPickle
+import errno
+import hashlib
 import logging
+import os
 import pkg_resources
+import shutil
+import urllib
 
 from collections import defaultdict
 from os import path
 from sys import exit
 from yaml import load
 
+try:
+    from yaml import CSafeLoader as Loader
+except ImportError:
+    from yaml import SafeLoader as Loader
+
 import monster.db_iface as database
 from monster import active
 
 logger = logging.getLogger(__name__)
 
+# parsed configs and templates, named for the path and sha1 of the file they
+# came from; only the entry of each file's latest contents is kept
+CACHE_DIR = path.join(path.dirname(__file__), '.cache')
+
 
 def load_deployment(name):
     """Loads the deployment from the database.
@@ -21,9 +36,11 @@ def load_deployment(name):
 
 def load_config(name):
     try:
-        active.config = fetch_config(name)
-        active.template = fetch_template(name)
-        active.build_args = database.fetch_build_args(name)
+        context = database.load_build_context(name)
+        active.config = read_config(context['config'], context['secret'])
+        active.template = read_template(context['branch'],
+                                        context['template'])
+        active.build_args = context['build_args']
     except IOError as exc:
         logger.error("Ensure correct deployment name: {0}".format(exc))
         exit(1)
@@ -34,8 +51,9 @@ def load_only_secrets(secret_path):
 
 
 def fetch_secrets(secret):
+    # secrets are not written to the parse cache
     with open(_secret_path(secret), 'r') as f:
-        secrets = load(f.read())
+        secrets = load(f.read(), Loader=Loader)
     return secrets
 
 
@@ -44,9 +62,15 @@ def fetch_config(name):
     :param name: name of your deployment
     """
     config, secret = database.fetch_config_params(name)
+    return read_config(config, secret)
 
-    with open(_config_path(config), 'r') as f:
-        config = defaultdict(None, load(f.read()))
+
+def read_config(config, secret):
+    """Returns a dictionary with a config file and secrets loaded in it.
+    :param config: name of the config file
+    :param secret: path of the secrets file
+    """
+    config = defaultdict(None, parse_yaml(_config_path(config)))
 
     config['secrets'] = fetch_secrets(secret)
     return config
@@ -57,11 +81,96 @@ def fetch_template(name):
     :param name of deployment
     """
     branch, template = database.fetch_template_params(name)
+    return read_template(branch, template)
+
+
+def read_template(branch, template):
+    """Returns a dictionary with a template loaded in it.
+    :param branch: branch whose templates file to read
+    :param template: name of the template in the file
+    """
+    return parse_yaml(_template_path(branch), key=template)
+
+
+def parse_yaml(file_path, key=None):
+    """Returns a parsed YAML file, or one of its top-level keys. Files are
+    only parsed the first time they are read with given contents; after
+    that each top-level key is loaded on its own from the parse cache.
+    :param file_path: path of the file
+    :type file_path: str
+    :param key: top-level key to return
+    :type key: str
+    """
+    with open(file_path, 'r') as f:
+        content = f.read()
+    entry = path.join(CACHE_DIR, "{0}-{1}".format(
+        _cache_prefix(file_path), hashlib.sha1(content).hexdigest()))
+    cache_file = _cache_file(entry, key)
+    try:
+        with open(cache_file, 'rb') as f:
+            return cPickle.load(f)
+    except (IOError, EOFError, cPickle.UnpicklingError):
+        pass
+
+    parsed = load(content, Loader=Loader)
+    _write_cache(entry, parsed)
+    return parsed if key is None else parsed[key]
+
+
+def _cache_prefix(file_path):
+    """Returns the start of the names of a file's cache entries, which tells
+    apart files of the same name, such as configs/default.yaml and
+    templates/default.yaml.
+    :rtype: str
+    """
+    file_path = path.abspath(file_path)
+    return "{0}-{1}".format(path.basename(file_path),
+                            hashlib.sha1(file_path).hexdigest()[:8])
 
-    with open(_template_path(branch), 'r') as f:
-        template = load(f.read())[template]
 
-    return template
+def _cache_file(entry, key=None):
+    if key is None:
+        return path.join(entry, "__all__.pickle")
+    return path.join(entry, "{0}.pickle".format(urllib.quote(key, safe='')))
+
+
+def _write_cache(entry, parsed):
+    """Writes a parsed file, and each of its top-level keys, to the parse
+    cache; the cache is skipped if the package data is not writable."""
+    values = {None: parsed}
+    if isinstance(parsed, dict):
+        values.update((key, value) for key, value in parsed.items()
+                      if isinstance(key, basestring))
+    try:
+        os.makedirs(entry)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            logger.debug("Not caching parsed {0}: {1}".format(entry, e))
+            return
+    try:
+        for key, value in values.items():
+            cache_file = _cache_file(entry, key)
+            temp_file = "{0}.{1}.tmp".format(cache_file, os.getpid())
+            with open(temp_file, 'wb') as f:
+                cPickle.dump(value, f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(temp_file, cache_file)
+    except (IOError, OSError) as e:
+        logger.debug("Not caching parsed {0}: {1}".format(entry, e))
+        return
+    _remove_stale(entry)
+
+
+def _remove_stale(entry):
+    """Removes the cache entries of a file's earlier contents."""
+    name = path.basename(entry)
+    prefix = name.rsplit("-", 1)[0] + "-"
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return
+    for other in names:
+        if other.startswith(prefix) and other != name:
+            shutil.rmtree(path.join(CACHE_DIR, other), ignore_errors=True)
 
 
 def _config_path(config):
@@ -1,38 +1,133 @@
-import subprocess
 import logging
+import os
+import subprocess
+import threading
+import time
+
 import redis
 
 logger = logging.getLogger(__name__)
 
+# seconds to wait for a redis server started by start_db to accept
+# connections
+START_TIMEOUT = 10
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def connection_settings():
+    """Returns where to find redis, as set by the MONSTER_REDIS_HOST,
+    MONSTER_REDIS_PORT, MONSTER_REDIS_DB and MONSTER_REDIS_SOCKET
+    environment variables; a unix socket takes precedence over host/port.
+    :rtype: dict
+    """
+    return {'host': os.environ.get('MONSTER_REDIS_HOST', 'localhost'),
+            'port': int(os.environ.get('MONSTER_REDIS_PORT', 6379)),
+            'db': int(os.environ.get('MONSTER_REDIS_DB', 0)),
+            'socket': os.environ.get('MONSTER_REDIS_SOCKET')}
+
 
 def start_db():
+    """Starts a local redis server in the background.
+    :return: whether redis-server could be run
+    :rtype: bool
+    """
+    settings = connection_settings()
     logger.debug("Attempting to start db.")
-    subprocess.call("redis-server")
+    cmd = ["redis-server", "--daemonize", "yes"]
+    if settings['socket']:
+        cmd.extend(["--unixsocket", settings['socket']])
+    else:
+        cmd.extend(["--port", str(settings['port'])])
+    try:
+        return subprocess.call(cmd) == 0
+    except OSError as e:
+        logger.error("Unable to run redis-server: {0}".format(e))
+        return False
 
 
 def ping_db():
     logger.debug("Pinging redis...")
-    ping = "redis-cli -p 6379 ping".split()
-    if subprocess.check_output(ping) == "PONG\n":
-        logger.debug("Redis responded normally.")
-    else:
+    try:
+        get_connection().ping()
+    except redis.RedisError as e:
         logger.debug("Redis did not respond normally.")
-        raise AssertionError()
+        raise AssertionError(str(e))
+    logger.debug("Redis responded normally.")
 
 
 def get_connection():
-    """:rtype: redis.StrictRedis """
-    return db
+    """Returns a client sharing the process's connection pool; no
+    connection is made until the client is first used.
+    :rtype: redis.StrictRedis
+    """
+    return redis.StrictRedis(connection_pool=get_pool())
 
-try:
-    ping_db()
-except:
-    logger.warning("Database not responding normally to pings.")
-    try:
-        start_db()
-        ping_db()
-    except:
-        logger.exception("Database still not responsive.  Exiting.")
 
+def set_pool(pool):
+    """Replaces the process's connection pool, e.g. with one to a fake redis
+    server. Clients made before the call, such as monster.db_iface's, keep
+    using the previous pool until they are replaced.
+    :type pool: redis.ConnectionPool
+    :return: the replaced pool, if one had been made
+    :rtype: redis.ConnectionPool
+    """
+    global _pool
+    with _pool_lock:
+        previous, _pool = _pool, pool
+    return previous
+
+
+def get_pool():
+    """:rtype: redis.ConnectionPool"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            settings = connection_settings()
+            if settings['socket']:
+                _pool = _ConnectionPool(
+                    connection_class=redis.UnixDomainSocketConnection,
+                    path=settings['socket'], db=settings['db'])
+            else:
+                _pool = _ConnectionPool(host=settings['host'],
+                                        port=settings['port'],
+                                        db=settings['db'])
+        return _pool
+
+
+class _ConnectionPool(redis.ConnectionPool):
+    """Connection pool that starts a local redis server the first time it
+    is unable to connect."""
+    def __init__(self, *args, **kwargs):
+        super(_ConnectionPool, self).__init__(*args, **kwargs)
+        self._checked = False
+        self._check_lock = threading.Lock()
+
+    def make_connection(self):
+        connection = super(_ConnectionPool, self).make_connection()
+        with self._check_lock:
+            if not self._checked:
+                self._ensure_running(connection)
+                self._checked = True
+        return connection
 
-db = redis.StrictRedis(host='localhost', port=6379, db=0)
+    def _ensure_running(self, connection):
+        try:
+            connection.connect()
+            return
+        except redis.ConnectionError:
+            logger.warning("Database not responding normally to pings.")
+        if self.connection_kwargs.get('host', 'localhost') not in (
+                'localhost', '127.0.0.1'):
+            return
+        if not start_db():
+            return
+        deadline = time.time() + START_TIMEOUT
+        while time.time() < deadline:
+            try:
+                connection.connect()
+                return
+            except redis.ConnectionError:
+                time.sleep(0.2)
+        logger.error("Database still not responsive.")
@@ -1,19 +1,82 @@
 import inspect
+import json
 import logging
+import time
 
-import dill as pickle
 from decorator import decorator
 
 import monster.db as database
+import monster.utils.records as records
 
 
 logger = logging.getLogger(__name__)
 db = database.get_connection()
 
+# set of the names of every stored deployment
+DEPLOYMENT_INDEX = "monster:deployments"
+
+
+# field of the build args hash that deployments were once pickled into
+LEGACY_FIELD = "deployment-obj"
+
+
+def summary_key(name):
+    """Key of the hash summarizing a stored deployment.
+    :type name: str
+    :rtype: str
+    """
+    return "{0}:summary".format(name)
+
+
+def deployment_key(name):
+    """Key of a stored deployment's own record.
+    :type name: str
+    :rtype: str
+    """
+    return "{0}:deployment".format(name)
+
+
+def nodes_key(name):
+    """Key of the hash of a stored deployment's node records.
+    :type name: str
+    :rtype: str
+    """
+    return "{0}:nodes".format(name)
+
+
+def features_key(name):
+    """Key of a stored deployment's features record.
+    :type name: str
+    :rtype: str
+    """
+    return "{0}:features".format(name)
+
+
+def checkpoints_key(name):
+    """Key of the set of a deployment's completed build steps.
+    :type name: str
+    :rtype: str
+    """
+    return "{0}:checkpoints".format(name)
+
+
+def profile_key(name):
+    """Key of a deployment's build timings.
+    :type name: str
+    :rtype: str
+    """
+    return "{0}:profile".format(name)
+
 
 def remove_key(build_name):
     logger.info("Removing %s from redis..." % build_name)
-    db.delete(build_name)
+    pipe = db.pipeline()
+    pipe.delete(build_name, deployment_key(build_name),
+                nodes_key(build_name), features_key(build_name),
+                summary_key(build_name), checkpoints_key(build_name),
+                profile_key(build_name))
+    pipe.srem(DEPLOYMENT_INDEX, build_name)
+    pipe.execute()
     logger.info("Redis no longer has a %s key." % build_name)
 
 
@@ -38,23 +101,155 @@ def ping_db():
 
 
 def store(deployment):
-    return db.hset(deployment.name, "deployment-obj", pickle.dumps(deployment))
+    """Stores a deployment as separate records for the deployment, each of
+    its nodes and its features, along with its summary and its entry in the
+    deployment index.
+    :type deployment: monster.deployments.base.Deployment
+    """
+    name = deployment.name
+    pipe = db.pipeline()
+    pipe.set(deployment_key(name), records.deployment_record(deployment))
+    pipe.delete(nodes_key(name))
+    if deployment.nodes:
+        pipe.hmset(nodes_key(name),
+                   {node.name: records.node_record(deployment, node)
+                    for node in deployment.nodes})
+    pipe.set(features_key(name), records.features_record(deployment))
+    pipe.hdel(name, LEGACY_FIELD)
+    pipe.sadd(DEPLOYMENT_INDEX, name)
+    _summarize(pipe, deployment)
+    return pipe.execute()[0]
+
+
+def add_checkpoint(name, step):
+    """Records that a deployment's build step has completed.
+    :param name: name of the deployment
+    :type name: str
+    :param step: name of the build step
+    :type step: str
+    """
+    db.sadd(checkpoints_key(name), step)
+
+
+def fetch_checkpoints(name):
+    """Returns the build steps a deployment has completed.
+    :type name: str
+    :rtype: set (str)
+    """
+    return db.smembers(checkpoints_key(name))
+
+
+def clear_checkpoints(name):
+    db.delete(checkpoints_key(name))
+
+
+def store_profile(name, profile):
+    """Stores a deployment's build timings.
+    :type name: str
+    :param profile: spans and critical path, see monster.utils.timing
+    :type profile: dict
+    """
+    db.set(profile_key(name), json.dumps(profile))
+
+
+def fetch_profile(name):
+    """Returns a deployment's build timings.
+    :type name: str
+    :rtype: dict
+    """
+    profile = db.get(profile_key(name))
+    if profile is None:
+        raise Exception("No build timings are stored for {0}".format(name))
+    return json.loads(profile)
+
+
+def _summarize(pipe, deployment):
+    now = int(time.time())
+    summary = {'status': deployment.status,
+               'branch': deployment.branch,
+               'product': deployment.product,
+               'os_name': deployment.os_name,
+               'provisioner': deployment.provisioner_name,
+               'nodes': len(deployment.nodes),
+               'updated': now}
+    pipe.hmset(summary_key(deployment.name), summary)
+    pipe.hsetnx(summary_key(deployment.name), 'created', now)
 
 
 def list_deployments():
-    temp = {}
-    for key in db.keys():
-        if 'deployment-obj' in db.hgetall(key):
-            temp[key] = pickle.loads(db.hget(key, "deployment-obj"))
-    return temp
+    """Returns the summary of every stored deployment, without loading the
+    deployments themselves.
+    :return: summary hashes keyed by deployment name
+    :rtype: dict
+    """
+    if not db.exists(DEPLOYMENT_INDEX):
+        _index_deployments()
+    names = sorted(db.smembers(DEPLOYMENT_INDEX))
+    pipe = db.pipeline()
+    for name in names:
+        pipe.hgetall(summary_key(name))
+    return dict(zip(names, pipe.execute()))
+
+
+def _index_deployments():
+    """Builds the deployment index for deployments stored before there was
+    one, by scanning for their keys; their summaries fill in when they are
+    next stored.
+    """
+    logger.info("Indexing stored deployments...")
+    suffix = deployment_key("")
+    names = set(key[:-len(suffix)]
+                for key in db.scan_iter(match="*" + suffix, count=1000))
+    hashes = [key for key in db.scan_iter(count=1000)
+              if db.type(key) == "hash"]
+    pipe = db.pipeline()
+    for key in hashes:
+        pipe.hexists(key, LEGACY_FIELD)
+    names.update(key for key, stored in zip(hashes, pipe.execute())
+                 if stored)
+    if names:
+        db.sadd(DEPLOYMENT_INDEX, *names)
 
 
 def fetch_deployment(name):
-    deployment = pickle.loads(db.hget(name, "deployment-obj"))
-    assert deployment != {}
+    """Loads a stored deployment. Deployments stored as a single pickle by
+    earlier versions are converted to records as they are loaded.
+    :type name: str
+    :rtype: monster.deployments.base.Deployment
+    """
+    pipe = db.pipeline()
+    pipe.get(deployment_key(name))
+    pipe.hgetall(nodes_key(name))
+    pipe.get(features_key(name))
+    deployment, nodes, features = pipe.execute()
+    if deployment:
+        return records.load_deployment(deployment, nodes, features)
+
+    legacy = db.hget(name, LEGACY_FIELD)
+    if not legacy:
+        raise Exception("No deployment named {0} is stored".format(name))
+    import dill as pickle
+    logger.info("Converting stored deployment {0} to records".format(name))
+    deployment = pickle.loads(legacy)
+    store(deployment)
     return deployment
 
 
+def fetch_node(name, node_name):
+    """Returns a stored node's record without loading its deployment.
+    :param name: name of the deployment
+    :type name: str
+    :param node_name: name of the node
+    :type node_name: str
+    :return: the record, whose 'state' holds the node's attributes
+    :rtype: dict
+    """
+    record = db.hget(nodes_key(name), node_name)
+    if record is None:
+        return None
+    return records.loads(record)
+
+
 def fetch_config_params(name):
     config, secret = db.hmget(name, ['config', 'secret'])
     return config, secret
@@ -67,3 +262,17 @@ def fetch_template_params(name):
 
 def fetch_build_args(name):
     return db.hgetall(name)
+
+
+def load_build_context(name):
+    """Returns everything needed to load a deployment's configuration,
+    read in a single round trip.
+    :type name: str
+    :return: config, secret, branch and template names, and the build args
+    :rtype: dict
+    """
+    build_args = db.hgetall(name)
+    context = {key: build_args.get(key)
+               for key in ('config', 'secret', 'branch', 'template')}
+    context['build_args'] = build_args
+    return context
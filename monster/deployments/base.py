@@ -1,14 +1,16 @@
 import types
 import logging
-
-import tmuxp
+from functools import partial
 
 import monster.features.deployment.features as deployment_features
 import monster.active as active
 import monster.threading_iface as threading
 import monster.db_iface as database
+import monster.utils.timing as timing
 from monster.orchestrator.util import get_orchestrator
 from monster.utils.retrofit import Retrofit
+from monster.utils.scheduler import Scheduler
+from monster.utils.access import ssh_pool
 from monster.utils.introspection import module_classes
 from monster.provisioners.util import get_provisioner
 
@@ -45,36 +47,121 @@ class Deployment(object):
 
         return "\n".join([output, features, nodes])
 
-    def build(self):
-        """Runs build steps for node's features."""
+    def build(self, resume=False):
+        """Runs build steps for the deployment's and nodes' features,
+        overlapping steps that do not depend on one another. The deployment
+        is stored before the first step and again with each step's
+        checkpoint as it completes, so that a failed or killed build can be
+        resumed with the state its completed steps set up.
+        :param resume: skip the steps completed by an earlier build
+        :type resume: bool
+        """
         logger.info("Building deployment object for {}".format(self.name))
-        logger.debug("Deployment step: update environment")
-        self.update_environment()
-        logger.debug("Deployment step: pre-configure")
-        self.pre_configure()
-        logger.debug("Deployment step: build nodes")
-        self.build_nodes()
-        logger.debug("Deployment step: post-configure")
-        self.post_configure()
-        self.status = "post-build"
+        if resume:
+            completed = database.fetch_checkpoints(self.name)
+        else:
+            completed = set()
+            database.clear_checkpoints(self.name)
+        database.store(self)
+
+        def checkpoint(task):
+            # stored before the checkpoint, so that a resumed build never
+            # skips a step whose state, e.g. controller numbers, was lost
+            database.store(self)
+            database.add_checkpoint(self.name, task.name)
+
+        schedule = self.build_schedule()
+        try:
+            with timing.span('build', 'deployment'):
+                schedule.run(completed, checkpoint)
+            self.status = "post-build"
+        except Exception:
+            self.status = "build failed"
+            raise
+        finally:
+            # also on KeyboardInterrupt, which is not an Exception
+            database.store(self)
+            self.store_profile(schedule)
+        logger.info("Build critical path:\n{0}"
+                    .format(schedule.critical_path_report()))
 
         logger.info(self)
-        database.store(self)
+
+    def store_profile(self, schedule):
+        """Stores the timings recorded in this process, from provisioning
+        through the build, along with the build's critical path.
+        :type schedule: monster.utils.scheduler.Scheduler
+        """
+        critical_path = [{'name': task.name, 'duration': task.duration}
+                         for task in schedule.critical_path()]
+        database.store_profile(self.name, {'spans': timing.spans(),
+                                           'critical_path': critical_path})
+
+    def build_schedule(self):
+        """Returns the deployment's build steps and their dependencies.
+        Each node's steps run in order and wait on the steps of other nodes
+        that its features declare dependencies on; the environment is
+        updated before any node is pre-configured, and the deployment is
+        post-configured once every node is built.
+        :rtype: monster.utils.scheduler.Scheduler
+        """
+        schedule = Scheduler(
+            max_workers=threading.max_workers(len(self.nodes) + 1))
+        update_env = schedule.add(self._task_name(self, 'update_environment'),
+                                  self.update_environment)
+        pre_configure = schedule.add(self._task_name(self, 'pre_configure'),
+                                     self.pre_configure, [update_env.name])
+
+        for node in self.nodes:
+            previous = None
+            for step in node.build_steps:
+                requires = [self._task_name(dependency, dependency_step)
+                            for dependency, dependency_step
+                            in node.dependencies(step)]
+                if previous:
+                    requires.append(previous)
+                if step == 'pre_configure':
+                    requires.append(pre_configure.name)
+                previous = schedule.add(self._task_name(node, step),
+                                        partial(self.build_node_step, node,
+                                                step),
+                                        requires).name
+
+        schedule.add(self._task_name(self, 'post_configure'),
+                     self.post_configure,
+                     [self._task_name(node, node.build_steps[-1])
+                      for node in self.nodes])
+        return schedule
+
+    def build_node_step(self, node, step):
+        """Runs a single build step on a node.
+        :type node: monster.nodes.base.Node
+        :param step: name of one of the node's build steps
+        :type step: str
+        """
+        with timing.span(step, 'step', node.name):
+            getattr(node, step)()
+        if step == node.build_steps[-1]:
+            node.status = "done"
 
     def update(self):
         """Updates a deployment's nodes, both via package managers and any
         orchestration system in play, such as by running chef-client."""
-        for node in self.nodes:
-            node.update_packages()
+        logger.info('Updating Distribution Packages')
+        self.run_on(self.nodes, lambda node: node.os.update_dist_cmd())
 
     def update_environment(self):
-        """Preconfigures node for each feature."""
+        """Preconfigures node for each feature, saving the environment once
+        all features have updated it."""
         logger.info("Updating environment with deployment features...")
         self.status = "Loading environment..."
-        for feature in self.features:
-            logger.debug("Deployment feature {feature}: updating environment!"
-                         .format(feature=feature))
-            feature.update_environment()
+        with self.environment.batch():
+            for feature in self.features:
+                logger.debug("Deployment feature {feature}: updating "
+                             "environment!".format(feature=feature))
+                with timing.span("{0}.update_environment".format(feature),
+                                 'feature'):
+                    feature.update_environment()
         self.status = "Environment ready!"
 
     def pre_configure(self):
@@ -83,16 +170,8 @@ class Deployment(object):
         for feature in self.features:
             logger.debug("Deployment feature: pre-configure: {feature}"
                          .format(feature=feature))
-            feature.pre_configure()
-
-    def build_nodes(self):
-        """Builds each node."""
-        logger.info("Building controllers...")
-        for node in self.controllers:
-            node.build()
-        logger.info("Building the rest of the nodes.")
-        threading.execute(node.build for node in self.misc_nodes)
-        self.status = "Nodes built!"
+            with timing.span("{0}.pre_configure".format(feature), 'feature'):
+                feature.pre_configure()
 
     def post_configure(self):
         """Post configures node for each feature."""
@@ -100,7 +179,8 @@ class Deployment(object):
         for feature in self.features:
             logger.debug("Deployment feature: post-configure: {}"
                          .format(feature))
-            feature.post_configure()
+            with timing.span("{0}.post_configure".format(feature), 'feature'):
+                feature.post_configure()
 
     def destroy(self):
         """Destroys an OpenStack deployment."""
@@ -108,6 +188,7 @@ class Deployment(object):
         logger.info("Destroying deployment: {}".format(self.name))
         for node in self.nodes:
             self.provisioner.destroy_node(node)
+            ssh_pool.close(node.ipaddress)
         database.remove_key(self.name)
         self.status = "Destroyed!"
 
@@ -116,8 +197,54 @@ class Deployment(object):
         for feature in self.features:
             feature.archive()
 
-        for node in self.nodes:
-            node.archive()
+        threading.execute(node.archive for node in self.nodes)
+
+    def run_on(self, nodes, cmd, concurrency=None, fail_fast=True,
+               attempts=3):
+        """Runs a command on several nodes concurrently, on the threads
+        shared by all remote commands.
+        :param nodes: role name or iterable of nodes to run the command on
+        :type nodes: str or iterable (monster.nodes.base.Node)
+        :param cmd: command to run, or a function returning the command for
+        a given node
+        :type cmd: str or function
+        :param concurrency: number of nodes to run on at once; defaults to
+        all of them
+        :type concurrency: int
+        :param fail_fast: raise on the first failure, stopping the commands
+        still running; otherwise failures are collected in the results
+        :type fail_fast: bool
+        :param attempts: number of times to try the command on each node
+        :type attempts: int
+        :return: run_cmd result for each node, keyed by node name
+        :rtype: dict
+        """
+        if isinstance(nodes, basestring):
+            nodes = self.nodes_with_role(nodes)
+        nodes = list(nodes)
+        if not nodes:
+            return {}
+        commands = {node.name: cmd(node) if callable(cmd) else cmd
+                    for node in nodes}
+        timeout = threading.task_timeout()
+
+        def run(node, stop):
+            return node.run_cmd(commands[node.name], attempts=attempts,
+                                timeout=timeout, stop=stop)
+
+        # nodes beyond the concurrency are only submitted as others finish,
+        # so a failure stops them before their command is ever run
+        results = threading.gather(
+            [threading.Task(partial(run, node), name=node.name, start=False)
+             for node in nodes], fail_fast=fail_fast,
+            concurrency=concurrency)
+
+        for name, result in results.items():
+            if isinstance(result, Exception):
+                results[name] = {'success': False, 'return': None,
+                                 'exception': result,
+                                 'command': commands[name]}
+        return results
 
     def nodes_with_role(self, feature_name):
         """Returns nodes that have a specified role."""
@@ -150,6 +277,7 @@ class Deployment(object):
 
     def tmux(self):
         """Creates an new tmux session with an window for each node."""
+        import tmuxp
         server = tmuxp.Server()
         session = server.new_session(session_name=self.name)
         cmd = ("sshpass -p {1} ssh -o UserKnownHostsFile=/dev/null "
@@ -203,12 +331,23 @@ class Deployment(object):
     def computes(self):
         return self.nodes_with_role('compute')
 
+    @property
+    def controllers_and_computes(self):
+        """Returns the deployment's controllers followed by its computes.
+        :rtype: list (monster.nodes.base.Node)
+        """
+        return list(self.controllers) + list(self.computes)
+
     @property
     def misc_nodes(self):
         return [node for node in self.nodes
                 if not node.has_feature('chefserver')
                 and not node.has_feature('controller')]
 
+    @staticmethod
+    def _task_name(entity, step):
+        return "{0}:{1}".format(entity.name, step)
+
     def retrofit(self, branch, ovs_bridge, lx_bridge, iface,
                  old_port_to_delete=None):
         """Retrofit the deployment."""
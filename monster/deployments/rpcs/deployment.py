@@ -3,8 +3,6 @@ import logging
 import os
 import webbrowser
 
-import pyrabbit.api as rabbit
-
 import monster.active as active
 import monster.threading_iface as threading
 import monster.clients.openstack as openstack
@@ -41,9 +39,14 @@ class Deployment(base.Deployment):
 
     def acquire_nodes(self, specs):
         active.node_names = set(self.node_names)
-        func_list = [partial(self.provisioner.build_node, self, spec)
+        provisioner = self.provisioner
+        provisioner.reserve_nodes(self, specs)
+        func_list = [partial(provisioner.build_node, self, spec)
                      for spec in specs]
-        nodes = threading.execute(func_list)
+        try:
+            nodes = threading.execute(func_list)
+        finally:
+            provisioner.release_reservations(self)
         assert nodes is not None
         nodes.sort(key=lambda node: node.name)
         return nodes
@@ -58,16 +61,17 @@ class Deployment(base.Deployment):
         threading.execute(node.build for node in additional_nodes)
         self.update()
 
-    def build_nodes(self):
-        base.logger.info("Building chef nodes...")
-        for node in self.chefservers:
-            node.build()
-        super(Deployment, self).build_nodes()
-
     def update(self):
         super(Deployment, self).update()
-        for node in self.nodes_without_role('chefserver'):
-            node.run_cmd('chef-client')
+        # HA controllers set up their cluster in turn, so they converge one
+        # at a time, in order, before the other nodes all converge at once
+        controllers = sorted(
+            self.controllers,
+            key=lambda node: node.feature('controller').number)
+        for controller in controllers:
+            controller.run_cmd('chef-client')
+        self.run_on([node for node in self.nodes_without_role('chefserver')
+                     if not node.has_feature('controller')], 'chef-client')
 
     def upgrade(self, branch_name):
         """Upgrades the deployment."""
@@ -84,8 +88,9 @@ class Deployment(base.Deployment):
 
     def update_environment(self):
         """Saves deployment for restore after update environment."""
-        super(Deployment, self).update_environment()
-        self.save_to_environment()
+        with self.environment.batch():
+            super(Deployment, self).update_environment()
+            self.save_to_environment()
 
     def save_to_environment(self):
         """Save deployment restore attributes to chef environment."""
@@ -131,6 +136,7 @@ class Deployment(base.Deployment):
     @property
     def rabbitmq_mgmt_client(self):
         """Return rabbitmq management client."""
+        import pyrabbit.api as rabbit
         if self.environment.is_high_availability:
             ip = self.environment.rabbit_mq_queue_ip
         else:
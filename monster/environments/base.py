@@ -1,15 +1,43 @@
 import logging
+import threading
+from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
+# number of batch() blocks each thread has open, keyed by id of environment;
+# saves from other threads, such as concurrent node steps, are not deferred
+_batches = threading.local()
 
-class Environment(dict):
 
+class Environment(dict):
     def __init__(self, name, description=""):
         super(Environment, self).__init__()
         self.name = name
         self.description = description
 
+    @contextmanager
+    def batch(self):
+        """Defers saves made inside the block to a single save when the
+        outermost block exits without an exception. Blocks may be nested.
+        """
+        depths = _batch_depths()
+        key = id(self)
+        depths[key] = depths.get(key, 0) + 1
+        try:
+            yield self
+        finally:
+            depths[key] -= 1
+            if not depths[key]:
+                del depths[key]
+        if key not in depths:
+            self.save()
+
+    @property
+    def batching(self):
+        """Whether this thread's saves are currently being deferred by
+        batch()."""
+        return id(self) in _batch_depths()
+
     @property
     def _local_env(self):
         raise NotImplementedError()
@@ -65,3 +93,11 @@ class Environment(dict):
     @property
     def rabbit_mq_queue_ip(self):
         raise NotImplementedError()
+
+
+def _batch_depths():
+    """:rtype: dict"""
+    depths = getattr(_batches, 'depths', None)
+    if depths is None:
+        depths = _batches.depths = {}
+    return depths
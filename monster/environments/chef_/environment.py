@@ -1,10 +1,40 @@
+import copy
+import threading
+
 import monster.environments.base as base
+import monster.utils.metrics as metrics
 import chef
 
 logger = base.logger
 
+_apis = {}
+_apis_lock = threading.Lock()
+
+
+def chef_api(**kwargs):
+    """Returns the process's ChefAPI for a chef server and client, creating
+    it on first use, so its key is only parsed once.
+    :param kwargs: ChefAPI arguments: url, key, client and so on
+    :rtype: chef.ChefAPI
+    """
+    api_key = tuple(sorted(kwargs.items()))
+    with _apis_lock:
+        if api_key not in _apis:
+            _apis[api_key] = TimedChefAPI(**kwargs)
+        return _apis[api_key]
+
+
+class TimedChefAPI(chef.ChefAPI):
+    """ChefAPI that records the latency of its requests."""
+    def request(self, method, path, headers={}, data=None):
+        with metrics.timer('chef_api_seconds', method=method):
+            return super(TimedChefAPI, self).request(method, path, headers,
+                                                     data)
+
 
 class Environment(base.Environment):
+    # attributes as of the last save, to skip saves that change nothing
+    _saved_state = None
 
     def __init__(self, name, local_api, description="",
                  default_attributes=None, override_attributes=None,
@@ -35,6 +65,14 @@ class Environment(base.Environment):
         }
         return str(chef_dict)
 
+    def __getstate__(self):
+        """(Excludes save bookkeeping, which is only valid in-process.)"""
+        return {attr: value for attr, value in self.__dict__.items()
+                if not attr.startswith('_')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
     def add_override_attr(self, key, value):
         self.override_attributes[key] = value
         self.save()
@@ -52,9 +90,19 @@ class Environment(base.Environment):
         self.save()
 
     def save(self):
+        """Saves the environment to the local and remote chef servers,
+        unless inside batch() or nothing has changed since the last save."""
+        if self.batching:
+            return
+        state = self._state
+        if state == self._saved_state:
+            logger.debug("Environment {0} unchanged; not saving"
+                         .format(self.name))
+            return
         env = self._local_env
         self._update_env_with_local_object_info(env)
-        self.save_env_to_local_and_to_remote(env)
+        if self.save_env_to_local_and_to_remote(env):
+            self._saved_state = state
 
     def save_remote_to_local(self):
         if self.remote_api:
@@ -64,19 +112,34 @@ class Environment(base.Environment):
             self.save()
 
     def save_env_to_local_and_to_remote(self, env):
+        """Saves an environment to the local and remote chef servers; a
+        failure to save it remotely is logged.
+        :return: whether it was saved to both
+        :rtype: bool
+        """
         env.save(self.local_api)
         if self.remote_api:
             try:
                 env.save(self.remote_api)
             except Exception as e:
                 logger.error("Remote env error:{0}".format(e))
+                return False
+        return True
 
     def _update_env_with_local_object_info(self, env):
         for attr in self.__dict__:
-            setattr(env, attr, self.__dict__[attr])
+            if not attr.startswith('_'):
+                setattr(env, attr, self.__dict__[attr])
+
+    @property
+    def _state(self):
+        return copy.deepcopy({attr: value
+                              for attr, value in self.__dict__.items()
+                              if not attr.startswith('_')})
 
     def destroy(self):
         self._local_env.delete()
+        self._saved_state = None
 
     @property
     def _local_env(self):
@@ -95,13 +158,13 @@ class Environment(base.Environment):
     @property
     def remote_api(self):
         if 'remote_chef' in self.override_attributes:
-            return chef.ChefAPI(**self.override_attributes['remote_chef'])
+            return chef_api(**self.override_attributes['remote_chef'])
         else:
             return None
 
     @property
     def local_api(self):
-        return chef.ChefAPI(**self.local_api_dict)
+        return chef_api(**self.local_api_dict)
 
     @property
     def deployment_attributes(self):
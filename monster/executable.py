@@ -3,26 +3,23 @@
 
 import sys
 import argh
-import IPython
 
+import monster.active as active
 import monster.db_iface as database
-import monster.deployments.rpcs.deployment as rpcs
 from monster.data import data
 from monster.logger import logger as monster_logger
-from monster.utils.access import get_file, run_cmd
 from monster.utils.color import Color
-from monster.tests.ha import HATest
-from monster.tests.cloudcafe import CloudCafe
-from monster.tests.tempest_neutron import TempestNeutron
-from monster.tests.tempest_quantum import TempestQuantum
 from monster.utils.safe_build import cleanup_on_failure
-from monster.utils.status import check_monster_status
+
+# Subcommands import what only they need when they run, so that commands
+# such as "deployment list" start without loading every client library.
 
 
 logger = monster_logger.Logger().logger_setup()
 
 
 def status(secrets="secret.yaml"):
+    from monster.utils.status import check_monster_status
     logger.setLevel(20)
     data.load_only_secrets(secrets)
     try:
@@ -39,8 +36,9 @@ def rpcs_build(
         name, template="ubuntu-default", branch="master",
         config="pubcloud-neutron.yaml", provisioner="rackspace",
         orchestrator="chef", secret="secret.yaml", dry=False, log=None,
-        destroy_on_failure=False):
+        destroy_on_failure=False, max_workers=None):
     """Build a Rackspace Private Cloud deployment."""
+    import monster.deployments.rpcs.deployment as rpcs
     data.load_config(name)
     deployment = rpcs.Deployment(name)
     with cleanup_on_failure(deployment):
@@ -48,6 +46,24 @@ def rpcs_build(
     return deployment
 
 
+def profile(name):
+    """Show how long each phase of a deployment's build took."""
+    from monster.utils.timing import report
+    return report(database.fetch_profile(name))
+
+
+def resume(name, destroy_on_failure=False, max_workers=None):
+    """Resume a failed build, skipping the steps that already completed."""
+    data.load_config(name)
+    active.build_args['destroy_on_failure'] = destroy_on_failure
+    if max_workers:
+        active.build_args['max_workers'] = max_workers
+    deployment = data.load_deployment(name)
+    with cleanup_on_failure(deployment):
+        deployment.build(resume=True)
+    return deployment
+
+
 @database.store_build_params
 def devstack(name, template="ubuntu-default", branch="master",
              config="pubcloud-neutron.yaml", provisioner="rackspace",
@@ -59,6 +75,9 @@ def devstack(name, template="ubuntu-default", branch="master",
 
 def tempest(name, iterations=1):
     """Test an OpenStack deployment."""
+    from monster.tests.tempest_neutron import TempestNeutron
+    from monster.tests.tempest_quantum import TempestQuantum
+    from monster.utils.access import get_file, run_cmd
     data.load_config(name)
     deployment = data.load_deployment(name)
     branch = TempestQuantum.tempest_branch(deployment.branch)
@@ -85,6 +104,8 @@ def tempest(name, iterations=1):
 
 def ha(name, iterations=1, progress=False):
     """Test an OpenStack deployment."""
+    from monster.tests.ha import HATest
+    from monster.utils.access import get_file, run_cmd
     data.load_config(name)
     deployment = data.load_deployment(name)
     test_object = HATest(deployment, progress)
@@ -177,29 +198,42 @@ def show(name):
 
 def explore(name):
     """Explore a deployment in IPython."""
+    import IPython
     data.load_config(name)
     deployment = data.load_deployment(name)
     IPython.embed()
 
 
 @argh.named("list")
-def list_deployments():
+def list_deployments(verbose=False):
     """Lists all deployments"""
     deployments = database.list_deployments()
-    return '\n'.join(sorted(deployment for deployment in deployments))
+    if not verbose:
+        return '\n'.join(sorted(deployment for deployment in deployments))
+    line = "{0:<30} {1:<20} {2:<12} {3:<10} {4:>5}"
+    lines = [line.format("name", "status", "branch", "product", "nodes")]
+    for name, summary in sorted(deployments.items()):
+        lines.append(line.format(name, summary.get('status', ''),
+                                 summary.get('branch', ''),
+                                 summary.get('product', ''),
+                                 summary.get('nodes', '')))
+    return '\n'.join(lines)
 
 
 def cloudcafe(cmd, name, network=None):
     """Run CloudCafe test suite against a deployment."""
+    from monster.tests.cloudcafe import CloudCafe
     deployment = data.load_deployment(name)
     data.load_config(name)
     CloudCafe(deployment).config(cmd, network_name=network)
 
 
 def add_nodes(name, compute_nodes=0, controller_nodes=0, cinder_nodes=0,
-              request=None):
+              request=None, max_workers=None):
     """Add a node (or nodes) to an existing deployment."""
     data.load_config(name)
+    if max_workers:
+        active.build_args['max_workers'] = max_workers
     deployment = data.load_deployment(name)
     node_request = request or list([['compute']] * compute_nodes +
                                    [['controller']] * controller_nodes +
@@ -208,12 +242,25 @@ def add_nodes(name, compute_nodes=0, controller_nodes=0, cinder_nodes=0,
     database.store(deployment)
 
 
+def refill(config="pubcloud-neutron.yaml", secret="secret.yaml"):
+    """Top up the Rackspace warm pools to their configured sizes."""
+    import monster.provisioners.rackspace.warm_pool as warm_pool
+    from monster.provisioners.util import get_provisioner
+    active.config = data.read_config(config, secret)
+    added = warm_pool.refill_all(get_provisioner('rackspace'))
+    return "\n".join("{0}: added {1}".format(key, count)
+                     for key, count in sorted(added.items()))
+
+
 def run():
     parser = argh.ArghParser()
     subparsers = parser.add_subparsers()
 
     subparsers.add_parser('status').set_defaults(function=status)
 
+    pool_parser = subparsers.add_parser('warm-pool')
+    pool_parser.add_commands([refill])
+
     deployment_parser = subparsers.add_parser('deployment')
 
     deployment_parser.add_commands([devstack, rpcs_build],
@@ -224,9 +271,9 @@ def run():
                                    namespace='test',
                                    title="Test-related commands")
 
-    deployment_parser.add_commands([list_deployments, show, update, upgrade,
-                                    retrofit, add_nodes, destroy, openrc,
-                                    horizon, tmux, explore])
+    deployment_parser.add_commands([list_deployments, show, profile, resume,
+                                    update, upgrade, retrofit, add_nodes,
+                                    destroy, openrc, horizon, tmux, explore])
 
     parser.dispatch()
 
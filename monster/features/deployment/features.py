@@ -76,21 +76,13 @@ class Neutron(deployment_.Feature):
         logger.info("### Beginning of Networking Block ###")
         logger.info("### Building OVS Bridge and Ports on network nodes ###")
 
-        for controller in self.deployment.controllers:
-            command = self.iface_bb_cmd(controller.vmnet_iface)
-            logger.debug("Running {0} on {1}".format(command, controller.name))
-            try:
-                controller.run_cmd(command, attempts=2)
-            except Exception:
-                logger.warning("Failed to build bridge on " + controller.name)
-
-        for compute in self.deployment.computes:
-            command = self.iface_bb_cmd(compute.vmnet_iface)
-            logger.debug("Running {0} on {1}".format(command, compute.name))
-            try:
-                compute.run_cmd(command, attempts=2)
-            except Exception:
-                logger.warning("Failed to build bridge on " + compute.name)
+        results = self.deployment.run_on(
+            self.deployment.controllers_and_computes,
+            lambda node: self.iface_bb_cmd(node.vmnet_iface),
+            fail_fast=False, attempts=2)
+        for name, result in results.items():
+            if not result['success']:
+                logger.warning("Failed to build bridge on " + name)
 
         logger.info("### End of Networking Block ###")
 
@@ -101,13 +93,9 @@ class Neutron(deployment_.Feature):
     def clear_bridge_iface(self):
         """Clears configured interface for Neutron use."""
 
-        for controller in self.deployment.controllers:
-            iface = controller.vmnet_iface
-            controller.run_cmd(self.iface_cb_cmd(iface))
-
-        for compute in self.deployment.computes:
-            iface = compute.vmnet_iface
-            compute.run_cmd(self.iface_cb_cmd(iface))
+        self.deployment.run_on(
+            self.deployment.controllers_and_computes,
+            lambda node: self.iface_cb_cmd(node.vmnet_iface))
 
     def iface_cb_cmd(self, iface):
         logger.info("Using iface: {}".format(iface))
@@ -1,3 +1,4 @@
+from itertools import takewhile
 from weakref import proxy
 
 import monster.active as active
@@ -31,6 +32,31 @@ class Feature(base.Feature):
     def upgrade(self):
         pass
 
+    def dependencies(self, step):
+        """Returns the build steps of other nodes that must complete before
+        this feature's node may start the given build step. Nodes other
+        than chef servers and controllers apply after the controllers are
+        built, as their chef runs search for what the controllers publish.
+        :param step: name of one of the node's build steps
+        :type step: str
+        :rtype: list ((monster.nodes.base.Node, str))
+        """
+        if step == 'apply_feature' and not (
+                self.node.has_feature('controller') or
+                self.node.has_feature('chefserver')):
+            return [(controller, 'post_configure')
+                    for controller in self.node.deployment.controllers]
+        return []
+
+    def preceding(self, feature_name):
+        """Returns the deployment's nodes with the given feature that come
+        before this feature's node.
+        :rtype: list (monster.nodes.base.Node)
+        """
+        return list(takewhile(lambda node: node.name != self.node.name,
+                              self.node.deployment.nodes_with_role(
+                                  feature_name)))
+
     def set_run_list(self):
         """Sets the nodes run list based on the feature."""
 
@@ -72,6 +72,9 @@ class ChefServer(node.Feature):
         """Upgrades the Chef Server Cookbooks."""
         self._upgrade_cookbooks()
 
+    def dependencies(self, step):
+        return []
+
     def destroy(self):
         pass
 
@@ -123,10 +126,12 @@ class ChefServer(node.Feature):
 
     def _set_up_remote(self):
         """Sets up and saves a remote api and dict to the environment."""
+        url = actv.config['chef']['server'].get('remote_url',
+                                                "https://{ip}:443")
         remote_chef = {
             "client": "admin",
             "key": self._get_admin_pem(),
-            "url": "https://{0}:443".format(self.node.ipaddress)
+            "url": url.format(ip=self.node.ipaddress)
         }
         env = self.node.environment
         env.add_override_attr('remote_chef', remote_chef)
@@ -190,6 +195,20 @@ class Controller(node.Feature):
             self.number = 1
             self.set_run_list()
 
+    def dependencies(self, step):
+        """Controllers are numbered in the order they are pre-configured, so
+        each waits for the ones before it to apply first; it then waits for
+        them to finish building before applying, as controller2's apply
+        re-runs chef on controller1.
+        """
+        if step == 'pre_configure':
+            return [(controller, 'apply_feature')
+                    for controller in self.preceding('controller')]
+        if step == 'apply_feature':
+            return [(controller, 'post_configure')
+                    for controller in self.preceding('controller')]
+        return []
+
     def apply_feature(self):
         """Run chef client on controller1 after controller2's completes."""
         self.node.deployment.has_controller = True
@@ -306,6 +325,15 @@ class Orchestration(node.Feature):
             self.number = 1
             self.set_run_list()
 
+    def dependencies(self, step):
+        """Orchestration nodes are numbered in the order they are
+        pre-configured, so each waits for the ones before it to apply."""
+        dependencies = super(Orchestration, self).dependencies(step)
+        if step == 'pre_configure':
+            dependencies.extend((node, 'apply_feature')
+                                for node in self.preceding('orchestration'))
+        return dependencies
+
     def apply_feature(self):
         self.node.deployment.has_orch_master = True
 
@@ -342,7 +370,10 @@ class Remote(node.Feature):
             "knife bootstrap {node} -u root -P {password} --bootstrap-version "
             "{version}".format(node=self.node.ipaddress,
                                password=self.node.password,
-                               version=client_version))
+                               version=client_version),
+            label="knife bootstrap")
+        # the bootstrap's chef-client run saved the node itself
+        self.node.refresh()
         self.node.save()
 
 
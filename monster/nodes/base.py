@@ -1,5 +1,6 @@
 """Provides classes of nodes (server entities)"""
 import logging
+import os
 import time
 
 from weakref import proxy
@@ -8,8 +9,12 @@ from lazy import lazy
 import monster.features.node.features as node_features
 import monster.nodes.util as node_util
 import monster.active as active
+import monster.threading_iface as threading
+import monster.utils.metrics as metrics
+import monster.utils.timing as timing
 
-from monster.utils.access import scp_from, scp_to, ssh_cmd
+from monster.utils.access import (scp_from, scp_to, ssh_cmd,
+                                  DEFAULT_TAIL_LINES)
 from monster.utils.introspection import module_classes
 
 
@@ -20,6 +25,9 @@ class Node(object):
     """An individual computation entity to deploy a part OpenStack onto.
     Provides server-related functions.
     """
+    build_steps = ['prepare', 'pre_configure', 'apply_feature',
+                   'post_configure']
+
     def __init__(self, name, ip, user, password, deployment, uuid=None):
         self.ipaddress = ip
         self.uuid = uuid
@@ -45,8 +53,11 @@ class Node(object):
     def __setitem__(self, item, value):
         raise NotImplementedError()
 
-    def run_cmd(self, cmd, user=None, password=None, attempts=3):
-        """Runs a command on the node.
+    def run_cmd(self, cmd, user=None, password=None, attempts=3,
+                on_line=None, timeout=None, stop=None, label=None):
+        """Runs a command on the node. The output is streamed to the log and
+        to the node's log file in the ssh log_dir, if configured, with the
+        last ssh tail_lines lines of it kept in the result.
         :param cmd: command to run on the node
         :type cmd: str
         :param user: user to run the command as
@@ -55,23 +66,73 @@ class Node(object):
         :type password:: str
         :param attempts: number of times
         :type attempts: int
+        :param on_line: called with ('stdout' or 'stderr', line) for each
+        line of output as it is received
+        :type on_line: function
+        :param timeout: seconds each attempt may run for
+        :type timeout: int
+        :param stop: event that stops the command when set
+        :type stop: threading.Event
+        :param label: name of the command in the build's profile
+        :type label: str
         :rtype: dict
         """
         user = user or self.user
         password = password or self.password
+        ssh_config = (active.config or {}).get('ssh') or {}
 
         for attempt in range(attempts):
             result = ssh_cmd(self.ipaddress, cmd, user, password,
-                             hostname=self.name)
+                             hostname=self.name, on_line=on_line,
+                             tail=ssh_config.get('tail_lines',
+                                                DEFAULT_TAIL_LINES),
+                             log_file=self.log_file, timeout=timeout,
+                             stop=stop, label=label)
             if result['success']:
                 break
             else:
+                metrics.increment('run_cmd_retries')
                 time.sleep(0.5)
         else:
+            metrics.increment('run_cmd_failures')
             raise Exception("Failed to run '{command}' after {n} attempts"
                             .format(command=cmd, n=attempts))
         return result
 
+    def run_async(self, cmd, user=None, password=None, attempts=3,
+                  on_line=None, timeout=None):
+        """Starts a command on the node without waiting for it. Commands
+        share one large pool of threads, so a process can run them on many
+        nodes at once; wait for them with monster.threading_iface.gather.
+        :param cmd: command to run on the node
+        :type cmd: str
+        :param timeout: seconds each attempt may run for
+        :type timeout: int
+        :return: task whose result is that of run_cmd, named for the node
+        :rtype: monster.threading_iface.Task
+        """
+        return threading.submit(
+            lambda stop: self.run_cmd(cmd, user, password, attempts,
+                                      on_line=on_line, timeout=timeout,
+                                      stop=stop),
+            name=self.name)
+
+    @property
+    def log_file(self):
+        """Path of the file the node's command output is written to, if an
+        ssh log_dir is configured.
+        :rtype: str
+        """
+        log_dir = ((active.config or {}).get('ssh') or {}).get('log_dir')
+        if not log_dir:
+            return None
+        try:
+            os.makedirs(log_dir)
+        except OSError:
+            if not os.path.isdir(log_dir):
+                raise
+        return os.path.join(log_dir, "{0}.log".format(self.name))
+
     def scp_to(self, local_path, user=None, password=None, remote_path=""):
         """Sends a file to the node.
         :param user: user to run the command as
@@ -91,9 +152,10 @@ class Node(object):
         return scp_from(self.ipaddress, remote_path, local_path,
                         user=user, password=password)
 
-    def pre_configure(self):
-        """Preconfigures node for each feature."""
-        self.status = "pre-configure"
+    def prepare(self):
+        """Updates the node's packages; unlike the other build steps, this
+        does not depend on the rest of the deployment."""
+        self.status = "prepare"
 
         logger.info("Updating node dist / packages")
         if 'rackspace' in str(self.provisioner):
@@ -103,6 +165,11 @@ class Node(object):
 
         self.update_packages(dist_upgrade)
 
+    def pre_configure(self):
+        """Preconfigures node for each feature."""
+        self.status = "pre-configure"
+        self['in_use'] = self.feature_names
+
         for feature in self.features:
             log = "Node feature: pre-configure: {}".format(feature)
             logger.debug(log)
@@ -143,12 +210,21 @@ class Node(object):
 
     def build(self):
         """Runs build steps for node's features."""
-        self['in_use'] = self.feature_names
-        self.pre_configure()
-        self.apply_feature()
-        self.post_configure()
+        for step in self.build_steps:
+            with timing.span(step, 'step', self.name):
+                getattr(self, step)()
         self.status = "done"
 
+    def dependencies(self, step):
+        """Returns the build steps of other nodes that must complete before
+        this node may start the given build step.
+        :param step: name of one of the node's build steps
+        :type step: str
+        :rtype: list ((monster.nodes.base.Node, str))
+        """
+        return [dependency for feature in self.features
+                for dependency in feature.dependencies(step)]
+
     def upgrade(self):
         """Upgrades node based on features."""
         for feature in self.features:
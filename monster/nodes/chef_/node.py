@@ -3,9 +3,14 @@ import logging
 
 import monster.active as active
 import monster.nodes.base as base
+import monster.utils.timing as timing
+from monster.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# chef nodes fetched from the local chef server, keyed by server and name
+chef_nodes = TTLCache(ttl=300)
+
 
 class Node(base.Node):
     """Wraps a Chef node.
@@ -37,13 +42,24 @@ class Node(base.Node):
         node.chef_environment = self.environment.name
         node.save()
 
-    def build(self):
-        """Builds the node."""
+    def pre_configure(self):
+        """Clears the run list before features add to it."""
         self.clear_run_list()
-        super(Node, self).build()
+        super(Node, self).pre_configure()
+
+    def dependencies(self, step):
+        """Nodes other than the chef server wait for it to be set up before
+        pre-configuring, as they are bootstrapped to it."""
+        dependencies = super(Node, self).dependencies(step)
+        if step == 'pre_configure' and not self.has_feature('chefserver'):
+            dependencies.extend((chefserver, 'apply_feature') for chefserver
+                                in self.deployment.nodes_with_role(
+                                    'chefserver'))
+        return dependencies
 
     def destroy(self):
         self.local_node.delete()
+        self.refresh()
         self.client.delete()
         super(Node, self).destroy()
 
@@ -78,6 +94,7 @@ class Node(base.Node):
         logger.debug("Saving chef_node:{0}".format(self.name))
         node = node or self.local_node
         node.save(self.local_api)
+        chef_nodes.set(self._cache_key, node)
         if self.remote_api:
             node.save(self.remote_api)
 
@@ -88,6 +105,7 @@ class Node(base.Node):
         if self.remote_api:
             node = node or self.remote_node
             node.save(self.local_api)
+            self.refresh()
 
     def get_run_list(self):
         return self.local_node.run_list
@@ -114,6 +132,15 @@ class Node(base.Node):
         node.run_list = []
         node.save()
 
+    def run_cmd(self, cmd, *args, **kwargs):
+        """Runs a command on the node, refreshing the cached chef node
+        after commands that run chef-client, as it saves the node."""
+        try:
+            return super(Node, self).run_cmd(cmd, *args, **kwargs)
+        finally:
+            if _runs_chef_client(cmd):
+                self.refresh()
+
     def run(self, times=1, debug=True, accept_failure=True):
         cmd = active.config['chef']['client']['run_cmd']
         for i in xrange(times):
@@ -121,18 +148,28 @@ class Node(base.Node):
                 time = self.run_cmd("date +%F_%T")['return'].rstrip()
                 log_file = '{0}-client-run.log'.format(time)
                 cmd = '{0} -l debug -L "/opt/chef/{1}"'.format(cmd, log_file)
-            chef_run = self.run_cmd(cmd)
+            with timing.span('chef-client', 'chef', self.name):
+                chef_run = self.run_cmd(cmd)
             self.save_locally()
             if not chef_run['success'] and not accept_failure:
                 raise Exception("Chef client failure")
 
+    def refresh(self):
+        """Drops the cached chef node, so that it is fetched again the next
+        time it is read; needed whenever something other than this object,
+        such as a chef-client run, changes it."""
+        chef_nodes.invalidate(self._cache_key)
+
     @property
     def client(self):
         return chef.Client(self.name, self.local_api)
 
     @property
     def local_node(self):
-        return chef.Node(self.name, self.local_api)
+        """Chef node on the local chef server, fetched once and cached until
+        it is refreshed."""
+        return chef_nodes.get(self._cache_key,
+                              lambda: chef.Node(self.name, self.local_api))
 
     @property
     def remote_node(self):
@@ -145,3 +182,17 @@ class Node(base.Node):
     @property
     def remote_api(self):
         return self.environment.remote_api
+
+    @property
+    def _cache_key(self):
+        return self.local_api.url, self.name
+
+
+def _runs_chef_client(cmd):
+    """Returns whether a command runs chef-client.
+    :type cmd: str
+    :rtype: bool
+    """
+    client = (((active.config or {}).get('chef') or {}).get('client') or
+              {}).get('run_cmd') or "chef-client"
+    return "chef-client" in cmd or client in cmd
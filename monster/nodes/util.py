@@ -1,37 +1,168 @@
 import logging
+import threading
 import time
 import chef
 import monster.active as active
+import monster.db as database
+from monster.utils.cache import TTLCache
 
 
 logger = logging.getLogger(__name__)
 
+# results of cached node searches, keyed by chef server and query
+search_results = TTLCache(ttl=60)
 
-def node_search(query, environment=None, tries=10):
-    """Performs a node search query on the chef server.
+# seconds a pool node stays locked after being claimed, covering the time
+# the chef search index takes to show it is no longer free
+CLAIM_TTL = 600
+
+_apis = {}
+_apis_lock = threading.Lock()
+
+
+def search_api(environment=None):
+    """Returns the chef API to search with: the environment's, or else the
+    one configured by knife.rb, which is only loaded once per process.
+    :type environment: monster.environments.chef_.environment.Environment
+    :rtype: chef.ChefAPI
+    """
+    if environment:
+        return environment.local_api
+    knife = active.config['secrets'].get('chef', {}).get('knife')
+    with _apis_lock:
+        if knife not in _apis:
+            if knife:
+                logger.debug("Using knife.rb found at {}".format(knife))
+                _apis[knife] = chef.autoconfigure(knife)
+            else:
+                _apis[knife] = chef.autoconfigure()
+        return _apis[knife]
+
+
+def node_search(query, environment=None, tries=10, max_wait=120,
+                cached=False):
+    """Performs a node search query on the chef server. Empty results are
+    retried with an increasing delay, as newly registered nodes take a
+    while to be indexed.
     :param query: search query to request
     :type query: string
     :param environment: Environment the query should be
     :type environment: monster.environments.chef.environment.Environment
-    :rtype: Iterator (chef.Node)
+    :param tries: most number of times to run the query
+    :type tries: int
+    :param max_wait: most number of seconds to spend waiting between tries
+    :type max_wait: int
+    :param cached: reuse the results of a recent identical search; the
+    nodes are then shared with other callers, see invalidate_search
+    :type cached: bool
+    :rtype: list (chef.Node)
     """
-    if environment:
-        api = environment.local_api
+    api = search_api(environment)
+    if cached:
+        return search_results.get(
+            (api.url, query),
+            lambda: _search(api, query, tries, max_wait))
+    return _search(api, query, tries, max_wait)
+
+
+def invalidate_search(query=None, environment=None):
+    """Drops cached search results so that they are fetched again.
+    :param query: search query to drop; defaults to every query
+    :type query: string
+    """
+    if query is None:
+        search_results.invalidate()
     else:
+        search_results.invalidate((search_api(environment).url, query))
+
+
+def claim_nodes(query, count, environment_name, is_free):
+    """Claims free pool nodes for an environment in a single pass over one
+    search. Each candidate is locked in redis and then re-read from the chef
+    server before it is claimed, so that concurrent builds, in this process
+    or another, never claim the same node. If fewer than count nodes can
+    be claimed, those that were are released and an exception is raised.
+    :param query: search query matching the pool's nodes
+    :type query: string
+    :param count: number of nodes to claim
+    :type count: int
+    :param environment_name: chef environment to move claimed nodes to
+    :type environment_name: string
+    :param is_free: function telling whether a node may be claimed
+    :type is_free: function
+    :rtype: list (chef.Node)
+    """
+    db = database.get_connection()
+    claimed = []
+    try:
+        for candidate in node_search(query, cached=True):
+            if len(claimed) == count:
+                break
+            if not is_free(candidate):
+                continue
+            lock = _claim_key(candidate.name)
+            if not db.set(lock, environment_name, nx=True, ex=CLAIM_TTL):
+                continue
+            node = chef.Node(candidate.name, api=candidate.api)
+            if not is_free(node):
+                db.delete(lock)
+                continue
+            node.chef_environment = environment_name
+            node['in_use'] = "provisioning"
+            node.save()
+            claimed.append(node)
+        if len(claimed) < count:
+            raise Exception("Only {0} of {1} nodes matching {2} are free"
+                            .format(len(claimed), count, query))
+    except Exception:
+        release_nodes(claimed)
+        invalidate_search(query)
+        raise
+    logger.info("Claimed nodes: {0}"
+                .format(", ".join(node.name for node in claimed)))
+    return claimed
+
+
+def release_nodes(nodes):
+    """Returns claimed nodes to their pool.
+    :type nodes: list (chef.Node)
+    """
+    for node in nodes:
         try:
-            api = chef.autoconfigure(
-                active.config['secrets']['chef']['knife'])
-            logger.debug("Using knife.rb found at {}".format(
-                active.config['secrets']['chef']['knife']))
-        except KeyError:
-            api = chef.autoconfigure()
-
-    search = None
-    while not search and tries > 0:
-        search = chef.Search("node", api=api).query(query)
-        time.sleep(10)
-        tries -= 1
-    return (n.object for n in search)
+            node.chef_environment = "_default"
+            node['in_use'] = 0
+            node.save()
+            release_claim(node.name)
+        except Exception as e:
+            logger.error("Unable to release {0}: {1}".format(node.name, e))
+
+
+def release_claim(node_name):
+    """Drops the lock taken on a node by claim_nodes, so that it may be
+    claimed again once it is back in its pool.
+    :type node_name: string
+    """
+    database.get_connection().delete(_claim_key(node_name))
+
+
+def _claim_key(node_name):
+    return "claim:{0}".format(node_name)
+
+
+def _search(api, query, tries, max_wait):
+    deadline = time.time() + max_wait
+    delay = 1
+    for attempt in xrange(tries):
+        results = [row.object for row in
+                   chef.Search("node", q=query, api=api)]
+        remaining = deadline - time.time()
+        if results or attempt == tries - 1 or remaining <= 0:
+            return results
+        logger.debug("No nodes found for {0}; searching again in {1}s"
+                     .format(query, delay))
+        time.sleep(min(delay, remaining))
+        delay *= 2
+    return []
 
 
 class OS(object):
@@ -1,12 +1,16 @@
+import importlib
 import logging
 
-import monster.orchestrator.chef_.orchestrator as chef_orchestrator
-
 logger = logging.getLogger(__name__)
 
+# modules of the orchestrators, which are only imported when first used
+ORCHESTRATORS = {'chef': 'monster.orchestrator.chef_.orchestrator'}
+
 
 def get_orchestrator(orchestrator_name):
-    if orchestrator_name == "chef":
-        return chef_orchestrator.Orchestrator()
-    else:
+    try:
+        module_name = ORCHESTRATORS[orchestrator_name]
+    except KeyError:
         logger.exception("Orchestrator %s not found." % orchestrator_name)
+    else:
+        return importlib.import_module(module_name).Orchestrator()
@@ -1,5 +1,7 @@
 import logging
 
+import monster.utils.timing as timing
+
 logger = logging.getLogger(__name__)
 
 
@@ -9,13 +11,32 @@ class Provisioner(object):
     """
 
     def build_node(self, deployment, specs):
-        node = self.provision_node(deployment, specs)
-        self.post_provision(node)
+        with timing.span('provision_node', 'provision') as span:
+            node = self.provision_node(deployment, specs)
+            span.node = node.name
+        with timing.span('post_provision', 'provision', node.name):
+            self.post_provision(node)
         return node
 
     def __repr__(self):
         return self.__class__.__name__.lower()
 
+    def reserve_nodes(self, deployment, specs):
+        """Allocates nodes for several specs at once, before provision_node
+        is called for each of them.
+        :param deployment: Deployment to provision for
+        :type deployment: Deployment
+        :type specs: list
+        """
+        pass
+
+    def release_reservations(self, deployment):
+        """Frees nodes allocated by reserve_nodes that were not provisioned.
+        :param deployment: Deployment to provision for
+        :type deployment: Deployment
+        """
+        pass
+
     def provision_node(self, deployment, specs):
         """Provisions a node.
         :param deployment: Deployment to provision for
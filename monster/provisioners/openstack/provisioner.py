@@ -1,28 +1,55 @@
 import logging
-import time
+import threading
 
 import monster.nodes.chef_.node as monster_chef
 import monster.active as active
 import monster.provisioners.base as base
 import monster.clients.openstack as openstack
+import monster.utils.metrics as metrics
 import monster.utils.naming as naming_util
-from monster.utils.access import check_port
+from monster.utils.access import listening, ssh_port
+from monster.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+BUILD_TIMEOUT = 1000
+
+# flavor, image and network indexes shared by the threads provisioning nodes
+catalog = TTLCache(ttl=600)
+
 
 class Provisioner(base.Provisioner):
     """Provisions Chef nodes in OpenStack VMS."""
     def __init__(self):
         self.creds = openstack.Creds()
-
-        openstack_clients = openstack.Clients(self.creds)
-        self.auth_client = openstack_clients.keystoneclient
-        self.compute_client = openstack_clients.novaclient
+        self._clients = {}
+        self._clients_lock = threading.Lock()
 
     def __str__(self):
         return 'openstack'
 
+    @property
+    def auth_client(self):
+        return self._client('keystoneclient')
+
+    @property
+    def compute_client(self):
+        return self._client('novaclient')
+
+    def _client(self, client_name):
+        """Returns a client, authenticating on first use and again once its
+        token is about to expire.
+        :param client_name: name of the openstack.Clients property
+        :type client_name: str
+        """
+        with self._clients_lock:
+            client = self._clients.get(client_name)
+            auth_ref = getattr(client, 'auth_ref', None)
+            if client is None or (auth_ref and auth_ref.will_expire_soon()):
+                client = getattr(openstack.Clients(self.creds), client_name)
+                self._clients[client_name] = client
+            return client
+
     def provision_node(self, deployment, specs):
         """Provisions a chef node using OpenStack.
         :param deployment: ChefDeployment to provision for
@@ -52,21 +79,22 @@ class Provisioner(base.Provisioner):
             server = self.compute_client.servers.create(node_name, image,
                                                         flavor, nics=nics)
             password = server.adminPass
-            for wait_for_state in range(100):
-                server = self.compute_client.servers.get(server.id)
-                if server.status == "ACTIVE":
-                    check_port(server.accessIPv4, 22, timeout=2)
-                    return server, password
-                logger.info("NODE: {:<23} STATUS: {:<8} PROGRESS: {:>3}%"
-                            .format(node_name, server.status, server.progress))
-                time.sleep(10)
-            else:
-                logger.error("Unable to build server for {}. Retrying..."
-                             .format(node_name))
+            try:
+                return self.watcher.wait(server, node_name), password
+            except Exception as e:
+                logger.error("Unable to build server for {0}: {1}. "
+                             "Retrying...".format(node_name, e))
                 server.delete()
         else:
             logger.exception("Server creation failed three times; exiting...")
 
+    @property
+    def watcher(self):
+        """Watcher shared by every provisioner of this kind in the process.
+        :rtype: ServerWatcher
+        """
+        return server_watcher(self)
+
     def destroy_node(self, node):
         """Destroys node from OpenStack.
         :type node: monster.nodes.base.Node
@@ -75,18 +103,49 @@ class Provisioner(base.Provisioner):
 
     def get_flavor(self, flavor):
         desired_flavor = active.config[str(self)]['flavors'][flavor]
-        return next(flavor for flavor in self.compute_client.flavors.list()
-                    if flavor.name == desired_flavor)
+        return self._lookup('flavors', self.compute_client.flavors.list,
+                            'name', desired_flavor)
 
     def get_image(self, image):
         desired_image = active.config[str(self)]['images'][image]
-        return next(image for image in self.compute_client.images.list()
-                    if image.name == desired_image)
+        return self._lookup('images', self.compute_client.images.list,
+                            'name', desired_image)
 
     def get_networks(self):
         desired_networks = active.config[str(self)]['networks']
-        return [{"net-id": network.id} for network in self.neutron.list()
-                if network in desired_networks]
+        networks = self.catalog('networks', self.neutron.list, 'label')
+        return [{"net-id": networks[label].id} for label in desired_networks
+                if label in networks]
+
+    def catalog(self, kind, list_func, attr):
+        """Returns a cached index of a kind of resource.
+        :param kind: name of the kind of resource, e.g. "flavors"
+        :type kind: str
+        :param list_func: function listing every resource of the kind
+        :type list_func: function
+        :param attr: attribute to index the resources by
+        :type attr: str
+        :rtype: dict
+        """
+        return catalog.get(
+            (str(self), kind),
+            lambda: {getattr(item, attr): item for item in list_func()})
+
+    def invalidate_catalog(self, kind=None):
+        """Drops a cached index so that it is listed again on next use.
+        :param kind: name of the kind of resource; defaults to every kind
+        :type kind: str
+        """
+        kinds = [kind] if kind else ['flavors', 'images', 'networks']
+        for kind in kinds:
+            catalog.invalidate((str(self), kind))
+
+    def _lookup(self, kind, list_func, attr, value):
+        try:
+            return self.catalog(kind, list_func, attr)[value]
+        except KeyError:
+            raise Exception("No {0} with {1} {2} in {3}"
+                            .format(kind, attr, value, self))
 
     def power_down(self, node):
         node.run_cmd("echo 1 > /proc/sys/kernel/sysrq; "
@@ -95,3 +154,148 @@ class Provisioner(base.Provisioner):
     def power_up(self, node):
         server = self.compute_client.servers.get(node.uuid)
         server.reboot("hard")
+
+
+class ServerWatcher(object):
+    """Waits for servers to become ready. The status of every server being
+    waited on is checked with a single detailed server listing per
+    interval, rather than a GET per server, and each waiting thread is woken
+    as soon as its server is ACTIVE and accepting SSH connections.
+    """
+    def __init__(self, provisioner, min_interval=2, max_interval=30,
+                 backoff=1.5):
+        """
+        :param provisioner: provisioner whose compute client lists the
+        servers; the client is fetched for each listing, so that it is
+        re-authenticated once its token expires
+        :type provisioner: Provisioner
+        :param min_interval: seconds between listings after a new server
+        starts being waited on
+        :param max_interval: longest number of seconds between listings
+        :param backoff: factor the interval grows by while nothing new is
+        being waited on
+        """
+        self.provisioner = provisioner
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._added = threading.Event()
+        self._thread = None
+
+    def wait(self, server, node_name, timeout=BUILD_TIMEOUT):
+        """Blocks until the server is ready.
+        :param server: server that has been requested
+        :param node_name: name of the node being built on the server
+        :type node_name: str
+        :param timeout: seconds to wait
+        :type timeout: int
+        :return: the server as last listed
+        """
+        waiter = _Waiter(node_name)
+        with self._lock:
+            self._waiters[server.id] = waiter
+            self._added.set()
+            if not self._thread:
+                self._thread = threading.Thread(target=self._watch,
+                                                name="server-watcher")
+                self._thread.daemon = True
+                self._thread.start()
+        try:
+            if not waiter.ready.wait(timeout):
+                raise Exception("Timed out after {0}s".format(timeout))
+        finally:
+            with self._lock:
+                self._waiters.pop(server.id, None)
+        if waiter.error:
+            raise Exception(waiter.error)
+        return waiter.server
+
+    def _watch(self):
+        interval = self.min_interval
+        while True:
+            # cleared before the waiters are read, so that a server added
+            # after the read still wakes the next wait
+            self._added.clear()
+            with self._lock:
+                waiters = self._waiters.items()
+            self._check(waiters)
+            with self._lock:
+                if not self._waiters:
+                    self._thread = None
+                    return
+            if self._added.wait(interval):
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+
+    def _check(self, waiters):
+        metrics.increment('nova_server_polls')
+        try:
+            servers = {server.id: server for server
+                       in self.provisioner.compute_client.servers.list(
+                           detailed=True)}
+        except Exception as e:
+            metrics.increment('nova_server_poll_failures')
+            logger.warning("Unable to list servers: {0}".format(e))
+            return
+        # every active server's SSH port is probed at once, so that one
+        # that is slow to come up does not hold up the others
+        up = listening([servers[server_id].accessIPv4
+                        for server_id, _ in waiters
+                        if server_id in servers and
+                        servers[server_id].status == "ACTIVE"], ssh_port())
+        for server_id, waiter in waiters:
+            server = servers.get(server_id)
+            if server is None:
+                continue
+            if server.status == "ACTIVE":
+                if server.accessIPv4 in up:
+                    self._finish(server_id, server)
+                else:
+                    logger.info("NODE: {:<23} STATUS: {:<8} waiting for SSH"
+                                .format(waiter.node_name, server.status))
+            elif server.status == "ERROR":
+                self._finish(server_id, server,
+                             error="Server went into ERROR state")
+            else:
+                logger.info("NODE: {:<23} STATUS: {:<8} PROGRESS: {:>3}%"
+                            .format(waiter.node_name, server.status,
+                                    server.progress))
+
+    def _finish(self, server_id, server, error=None):
+        with self._lock:
+            waiter = self._waiters.pop(server_id, None)
+        if waiter:
+            waiter.finish(server, error)
+
+
+class _Waiter(object):
+    def __init__(self, node_name):
+        self.node_name = node_name
+        self.ready = threading.Event()
+        self.server = None
+        self.error = None
+
+    def finish(self, server, error=None):
+        self.server = server
+        self.error = error
+        self.ready.set()
+
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def server_watcher(provisioner):
+    """Returns the process-wide watcher for a kind of provisioner, creating
+    it if there is none yet.
+    :type provisioner: Provisioner
+    :rtype: ServerWatcher
+    """
+    name = str(provisioner)
+    with _watchers_lock:
+        if name not in _watchers:
+            _watchers[name] = ServerWatcher(provisioner)
+        return _watchers[name]
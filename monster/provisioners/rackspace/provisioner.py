@@ -1,13 +1,25 @@
+import datetime
 import logging
+import threading
+
 import pyrax
 
 import monster.active as active
+import monster.nodes.chef_.node as monster_chef
 import monster.provisioners.openstack.provisioner as openstack
+import monster.provisioners.rackspace.warm_pool as warm_pool
 import monster.clients.openstack as openstack_client
-from monster.utils.access import check_port
+import monster.utils.naming as naming_util
+from monster.utils.access import check_port, ssh_port
 
 logger = logging.getLogger(__name__)
 
+# seconds before a token expires that it is renewed
+TOKEN_REFRESH_MARGIN = 300
+
+# keeps concurrent builds from each creating the same missing network
+_network_lock = threading.Lock()
+
 
 class Provisioner(openstack.Provisioner):
     """Provisions Chef nodes in Rackspace Cloud Servers VMS."""
@@ -18,50 +30,129 @@ class Provisioner(openstack.Provisioner):
                                             auth_url=rackspace['auth_url'],
                                             region=rackspace['region'],
                                             auth_system=rackspace['plugin'])
-
-        pyrax.set_setting("identity_type", "rackspace")
-        pyrax.set_credentials(username=self.creds.username,
-                              api_key=self.creds.apikey,
-                              region=self.creds.region_name)
-
-        self.compute_client = pyrax.cloudservers
-        self.neutron = pyrax.cloud_networks
+        self._auth_lock = threading.Lock()
+        self._warm = set()
+        self._warm_lock = threading.Lock()
 
     def __str__(self):
         return 'rackspace'
 
+    @property
+    def compute_client(self):
+        self.authenticate()
+        return pyrax.cloudservers
+
+    @property
+    def neutron(self):
+        self.authenticate()
+        return pyrax.cloud_networks
+
+    def authenticate(self):
+        """Authenticates with Rackspace identity unless pyrax already holds
+        a token that is not about to expire.
+        """
+        with self._auth_lock:
+            if not self._token_expiring(pyrax.identity):
+                return
+            logger.debug("Authenticating with Rackspace as {0}"
+                         .format(self.creds.username))
+            pyrax.set_setting("identity_type", "rackspace")
+            pyrax.set_credentials(username=self.creds.username,
+                                  api_key=self.creds.apikey,
+                                  region=self.creds.region_name)
+
+    @staticmethod
+    def _token_expiring(identity):
+        if not getattr(identity, 'authenticated', False):
+            return True
+        expires = getattr(identity, 'expires', None)
+        if not isinstance(expires, datetime.datetime):
+            return False
+        margin = datetime.timedelta(seconds=TOKEN_REFRESH_MARGIN)
+        return (expires.replace(tzinfo=None) - margin <=
+                datetime.datetime.utcnow())
+
     def get_networks(self):
         rackspace = active.config[str(self)]
         desired_networks = rackspace['networks']
         networks = []
         for desired_network in desired_networks:
-            try:
-                obj = next(network for network in self.neutron.list()
-                           if network.label == desired_network)
-            except StopIteration:
-                cidr = rackspace['network'][desired_network]['cidr']
-                obj = self.neutron.create(desired_network, cidr=cidr)
+            obj = self.catalog('networks', self.neutron.list,
+                               'label').get(desired_network)
+            if obj is None:
+                obj = self.create_network(desired_network)
             networks.append({"net-id": obj.id})
         return networks
 
+    def create_network(self, label):
+        """Creates a network unless another build already has.
+        :param label: label of the network in the rackspace config
+        :type label: str
+        """
+        with _network_lock:
+            self.invalidate_catalog('networks')
+            obj = self.catalog('networks', self.neutron.list,
+                               'label').get(label)
+            if obj is None:
+                cidr = active.config[str(self)]['network'][label]['cidr']
+                obj = self.neutron.create(label, cidr=cidr)
+                self.invalidate_catalog('networks')
+            return obj
+
+    def provision_node(self, deployment, specs):
+        """Provisions a chef node, using a server from the warm pool of its
+        OS and flavor if there is one ready. Pools are topped back up
+        separately, by "monster warm-pool refill".
+        :param deployment: ChefDeployment to provision for
+        :type deployment: monster.deployments.base.Deployment
+        :rtype: monster.nodes.chef_.node.Node
+        """
+        flavor = active.config[str(self)]['roles'][specs[0]]
+        server = warm_pool.take(self, deployment.os_name, flavor)
+        if server is None:
+            return super(Provisioner, self).provision_node(deployment, specs)
+
+        node_name = naming_util.name_node(specs[0], deployment)
+        logger.info("Building: {0} from warm server {1}"
+                    .format(node_name, server['name']))
+        warm_pool.rename(self, server, node_name)
+        with self._warm_lock:
+            self._warm.add(node_name)
+        return monster_chef.Node(node_name, ip=server['ip'], user="root",
+                                 password=server['password'],
+                                 uuid=server['id'], deployment=deployment,
+                                 features=specs)
+
     def post_provision(self, node):
         """Tasks to be done after a Rackspace node is provisioned.
         :param node: Node object to be tasked
         :type node: Monster.Node
         """
+        with self._warm_lock:
+            prepared = node.name in self._warm
+            self._warm.discard(node.name)
+        if not prepared:
+            self.prepare(node)
+        if "controller" in node.name:
+            self.hosts(node)
+
+    def prepare(self, node):
+        """Readies a new server for a build, which servers in a warm pool
+        have already been through.
+        :param node: Node object to be tasked
+        :type node: Monster.Node
+        """
         node.mkswap(size=2)
         node.initial_update()
         if "centos" in node.os_name:
             self.rdo(node)
-        if "controller" in node.name:
-            self.hosts(node)
 
     def rdo(self, node):
         logger.info("Installing RDO kernel.")
         kernel = active.config['rcbops']['compute']['kernel']['centos']
         if kernel['version'] not in node.run_cmd("uname -r")['return']:
             node.run_cmd(kernel['install'] + "; reboot now")
-            check_port(node.ipaddress, 22)
+            check_port(node.ipaddress, ssh_port())
 
     def hosts(self, node):
         """Remove /etc/hosts entries; Rabbitmq uses hostnames and doesn't
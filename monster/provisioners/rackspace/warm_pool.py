@@ -0,0 +1,194 @@
+"""Keeps cloud servers provisioned and updated ahead of the builds that
+need them.
+
+Each pool holds servers of one OS and flavor, sized by the rackspace
+warm_pool config, e.g.::
+
+    warm_pool:
+        ubuntu:
+            8GBP: 2
+
+A pool is a redis list of the servers' details, so it is shared by every
+monster process; taking a server pops it from the list, so no two builds
+are given the same one. Builds only take servers: pools are topped back up
+by "monster warm-pool refill", run e.g. from cron between builds so that
+new servers do not compete with a build's own for quota and rate limits.
+Only one process refills a pool at a time.
+"""
+import json
+import logging
+import time
+import uuid
+
+import monster.active as active
+import monster.db as database
+import monster.threading_iface as threading_iface
+from monster.nodes.base import Node
+from monster.utils.access import ssh_cmd
+
+logger = logging.getLogger(__name__)
+
+# seconds a server may wait in a pool before it is too out of date to use
+MAX_AGE = 7 * 24 * 60 * 60
+
+# seconds a refill holds its pool's lock for, in case its process dies
+REFILL_LOCK_TTL = 60 * 60
+
+
+def pool_key(os_name, flavor):
+    """Key of the list of a pool's servers.
+    :type os_name: str
+    :param flavor: name of the flavor in the rackspace config
+    :type flavor: str
+    :rtype: str
+    """
+    return "warm-pool:{0}:{1}".format(os_name, flavor)
+
+
+def pool_size(os_name, flavor):
+    """Returns the number of servers a pool is configured to hold.
+    :rtype: int
+    """
+    config = active.config.get('rackspace', {}).get('warm_pool') or {}
+    return int((config.get(os_name) or {}).get(flavor) or 0)
+
+
+def take(provisioner, os_name, flavor):
+    """Removes a ready server from a pool, destroying any that have waited
+    too long to be used.
+    :type provisioner: monster.provisioners.rackspace.provisioner.Provisioner
+    :return: the server's id, name, ip, password and creation time, or None
+    if the pool is empty
+    :rtype: dict
+    """
+    db = database.get_connection()
+    while True:
+        entry = db.lpop(pool_key(os_name, flavor))
+        if entry is None:
+            return None
+        server = json.loads(entry)
+        if time.time() - server['created'] < MAX_AGE:
+            logger.info("Taking warm server {0}".format(server['name']))
+            return server
+        logger.info("Destroying stale warm server {0}"
+                    .format(server['name']))
+        _destroy(provisioner, server)
+
+
+def refill(provisioner, os_name, flavor):
+    """Adds servers to a pool until it is full, unless another refill of
+    it is running.
+    :type provisioner: monster.provisioners.rackspace.provisioner.Provisioner
+    :return: number of servers added
+    :rtype: int
+    """
+    if not pool_size(os_name, flavor):
+        return 0
+    return _refill(provisioner, os_name, flavor)
+
+
+def refill_all(provisioner):
+    """Tops up every configured pool.
+    :type provisioner: monster.provisioners.rackspace.provisioner.Provisioner
+    :return: number of servers added to each pool, keyed by pool key
+    :rtype: dict
+    """
+    config = active.config.get('rackspace', {}).get('warm_pool') or {}
+    return {pool_key(os_name, flavor): refill(provisioner, os_name, flavor)
+            for os_name, flavors in config.items()
+            for flavor in flavors or {}}
+
+
+def rename(provisioner, server, name):
+    """Renames a server taken from a pool, both in the cloud and on the
+    server itself.
+    :type provisioner: monster.provisioners.rackspace.provisioner.Provisioner
+    :param server: server as returned by take()
+    :type server: dict
+    :param name: new name of the server
+    :type name: str
+    """
+    provisioner.compute_client.servers.get(server['id']).update(name=name)
+    command = ("hostname {new}; echo {new} > /etc/hostname; "
+               "sed -i 's/{old}/{new}/g' /etc/hosts; "
+               "if [ -f /etc/sysconfig/network ]; then "
+               "sed -i 's/^HOSTNAME=.*/HOSTNAME={new}/' "
+               "/etc/sysconfig/network; fi"
+               .format(old=server['name'], new=name))
+    result = ssh_cmd(server['ip'], command, password=server['password'],
+                     hostname=name)
+    if not result['success']:
+        raise Exception("Unable to rename {0} to {1}: {2}"
+                        .format(server['name'], name, result['error']))
+
+
+def _refill(provisioner, os_name, flavor):
+    db = database.get_connection()
+    key = pool_key(os_name, flavor)
+    lock = key + ":refill"
+    if not db.set(lock, 1, nx=True, ex=REFILL_LOCK_TTL):
+        logger.info("Warm pool {0} is already being refilled".format(key))
+        return 0
+    try:
+        missing = pool_size(os_name, flavor) - db.llen(key)
+        if missing <= 0:
+            return 0
+        logger.info("Adding {0} servers to warm pool {1}"
+                    .format(missing, key))
+        servers = _warm_servers(provisioner, os_name, flavor, missing)
+        if servers:
+            db.rpush(key, *[json.dumps(server) for server in servers])
+        return len(servers)
+    finally:
+        db.delete(lock)
+
+
+def _warm_servers(provisioner, os_name, flavor, count):
+    try:
+        return threading_iface.execute(
+            [lambda: _warm(provisioner, os_name, flavor)] * count,
+            fail_fast=False)
+    except threading_iface.ExecutionError as e:
+        logger.error("Unable to prepare every warm server: {0}".format(e))
+        return [server for server in e.results
+                if not isinstance(server, Exception)]
+
+
+def _warm(provisioner, os_name, flavor):
+    """Creates a server and prepares it as for a build."""
+    name = "warm-{0}-{1}-{2}".format(os_name, flavor,
+                                     uuid.uuid4().hex[:8]).lower()
+    image = provisioner.get_image(os_name).id
+    flavor_id = provisioner.get_flavor(flavor).id
+    created = provisioner.get_server(name, image, flavor_id,
+                                     nics=provisioner.get_networks())
+    if not created:
+        raise Exception("Unable to create warm server {0}".format(name))
+    server, password = created
+    owner = _PoolOwner(os_name, str(provisioner))
+    node = Node(name, server.accessIPv4, "root", password, owner,
+                uuid=server.id)
+    try:
+        provisioner.prepare(node)
+    except Exception:
+        server.delete()
+        raise
+    return {'id': server.id, 'name': name, 'ip': server.accessIPv4,
+            'password': password, 'created': time.time()}
+
+
+def _destroy(provisioner, server):
+    try:
+        provisioner.compute_client.servers.delete(server['id'])
+    except Exception as e:
+        logger.error("Unable to destroy warm server {0}: {1}"
+                     .format(server['name'], e))
+
+
+class _PoolOwner(object):
+    """Stands in for the deployment of a node that belongs to a pool."""
+    def __init__(self, os_name, provisioner_name):
+        self.name = "warm-pool"
+        self.os_name = os_name
+        self.product = None
+        self.provisioner_name = provisioner_name
@@ -1,16 +1,24 @@
 import json
 import logging
+import threading
 import time
+from functools import partial
 
 import requests
+from requests.adapters import HTTPAdapter
 
 import monster.nodes.util as node_utils
 import monster.provisioners.base as base
 import monster.active as active
+import monster.threading_iface as threading_iface
+from monster.utils.cache import TTLCache
 
 
 logger = logging.getLogger(__name__)
 
+# most requests made to the Razor API at once
+MAX_REQUESTS = 16
+
 
 class Provisioner(base.Provisioner):
     """Provisions chef nodes in a Razor environment."""
@@ -18,41 +26,68 @@ class Provisioner(base.Provisioner):
     def __init__(self, ip=None):
         self.ipaddress = ip or active.config['secrets']['razor']['ip']
         self.api = RazorAPI(self.ipaddress)
+        self._reserved = {}
+        self._reserved_lock = threading.Lock()
 
     def __str__(self):
         return 'razor'
 
+    def reserve_nodes(self, deployment, specs):
+        """Claims a pool node for every spec at once, for provision_node
+        to hand out.
+        :type deployment: monster.deployments.base.Deployment
+        :type specs: list
+        """
+        nodes = self.claim_nodes(len(specs), deployment.os_name, deployment)
+        with self._reserved_lock:
+            self._reserved.setdefault(deployment.name, []).extend(nodes)
+
+    def release_reservations(self, deployment):
+        """Returns reserved nodes that were not provisioned to the pool.
+        :type deployment: monster.deployments.base.Deployment
+        """
+        with self._reserved_lock:
+            nodes = self._reserved.pop(deployment.name, [])
+        node_utils.release_nodes(nodes)
+
     def provision_node(self, deployment, specs):
         """Provisions a chef node using Razor environment.
         :param deployment: ChefDeployment to provision for
         :type deployment: Deployment
-        :rtype: list
+        :rtype: chef.Node
         """
         logger.info("Provisioning with Razor!")
-        image = deployment.os_name
-        return [self.available_node(image, deployment) for _ in specs]
-
-    def available_node(self, image, deployment):
-        """Provides a free node from chef pool.
+        with self._reserved_lock:
+            reserved = self._reserved.get(deployment.name)
+            if reserved:
+                return reserved.pop(0)
+        return self.claim_nodes(1, deployment.os_name, deployment)[0]
+
+    def claim_nodes(self, count, image, deployment):
+        """Claims free nodes from chef pool.
+        :param count: number of nodes to claim
+        :type count: int
         :param image: name of os image
         :type image: string
-        :param deployment: ChefDeployment to add node to
+        :param deployment: ChefDeployment to add nodes to
         :type deployment: Deployment
-        :rtype: Node
+        :rtype: list (chef.Node)
         """
         # TODO: Should probably search on system name node attributes
         # Avoid specific naming of razor nodes, not portable
-        nodes = node_utils.node_search("name:qa-%s-pool*" % image)
-        for node in nodes:
-            is_default = node.chef_environment == "_default"
-            iface_in_run_list = "recipe[network-interfaces]" in node.run_list
-            if is_default and iface_in_run_list:
-                node.chef_environment = deployment.environment.name
-                node['in_use'] = "provisioning"
-                node.save()
-                return node
-        deployment.destroy()
-        raise Exception("No more nodes!!")
+        return node_utils.claim_nodes("name:qa-%s-pool*" % image, count,
+                                      deployment.environment.name,
+                                      self.is_free)
+
+    @staticmethod
+    def is_free(node):
+        """Whether a pool node is available to be claimed.
+        :type node: chef.Node
+        :rtype: bool
+        """
+        is_default = node.chef_environment == "_default"
+        iface_in_run_list = "recipe[network-interfaces]" in node.run_list
+        return is_default and iface_in_run_list
 
     def power_down(self, node):
         if node.has_feature('controller'):
@@ -78,6 +113,7 @@ class Provisioner(base.Provisioner):
             node['archive'] = {}
             node.chef_environment = "_default"
             node.save()
+            node_utils.release_claim(node.name)
         else:
             # Remove active model if the node is dirty
             active_model = node['razor_metadata']['razor_active_model_uuid']
@@ -105,6 +141,8 @@ class RazorAPI(object):
         self.ip = rzrip
         self.port = rzrport
         self.url = "http://{0}:{1}/razor/api".format(self.ip, self.port)
+        self.session = razor_session()
+        self.cache = TTLCache(ttl=30)
 
     def __repr__(self):
         outl = 'class: {0}'.format(self.__class__.__name__)
@@ -116,7 +154,8 @@ class RazorAPI(object):
 
         # Call the Razor RESTful API to get a list of models
         headers = {'content-type': 'application/json'}
-        request = requests.get('{0}/model'.format(self.url), headers=headers)
+        request = self.session.get('{0}/model'.format(self.url),
+                                   headers=headers)
 
         # Check the status code and return appropriately
         if request.status_code == 200:
@@ -129,7 +168,8 @@ class RazorAPI(object):
 
         # Call the Razor RESTful API to get a list of models
         headers = {'content-type': 'application/json'}
-        request = requests.get('{0}/node'.format(self.url), headers=headers)
+        request = self.session.get('{0}/node'.format(self.url),
+                                   headers=headers)
 
         # Check the status code and return appropriately
         if request.status_code == 200:
@@ -142,8 +182,8 @@ class RazorAPI(object):
 
         # Call the Razor RESTful API to get a list of models
         headers = {'content-type': 'application/json'}
-        request = requests.get('{0}/model/templates'.format(self.url),
-                               headers=headers)
+        request = self.session.get('{0}/model/templates'.format(self.url),
+                                   headers=headers)
 
         # Check the status code and return appropriately
         if request.status_code == 200:
@@ -157,7 +197,8 @@ class RazorAPI(object):
 
         # Call the Razor RESTful API to get a list of models
         headers = {'content-type': 'application/json'}
-        request = requests.get('{0}/model'.format(self.url), headers=headers)
+        request = self.session.get('{0}/model'.format(self.url),
+                                   headers=headers)
 
         # Check the status code and return appropriately
         if request.status_code == 200:
@@ -175,16 +216,16 @@ class RazorAPI(object):
         headers = {'content-type': 'application/json'}
 
         if uuid is None:
-            request = requests.get('{0}/model'.format(self.url),
-                                   headers=headers)
+            request = self.session.get('{0}/model'.format(self.url),
+                                       headers=headers)
             if request.status_code == 200:
                 return json.loads(request.content)
             else:
                 return 'Error: exited with status code: {0}'.format(
                     str(request.status_code))
         else:
-            request = requests.get('{0}/model/{1}'.format(self.url, uuid),
-                                   headers=headers)
+            request = self.session.get(
+                '{0}/model/{1}'.format(self.url, uuid), headers=headers)
             if request.status_code == 200:
                 return self.build_simple_model(json.loads(request.content))
             else:
@@ -215,7 +256,7 @@ class RazorAPI(object):
 
         # make the request to get active models from Razor
         headers = {'content-type': 'application/json'}
-        request = requests.get(url, headers=headers)
+        request = self.session.get(url, headers=headers)
 
         # Check the status code and return appropriately
         if request.status_code == 200:
@@ -230,29 +271,30 @@ class RazorAPI(object):
 
         am_content = self.active_models(filter)
 
-        request = None
         # Check the status code and return appropriately
-        if 'response' in am_content.keys():
-            active_models = {}
-            for response in am_content['response']:
-
-                # get info from razor about the active model
-                headers = {'content-type': 'application/json'}
-                request = requests.get(
-                    '{0}/active_model/{1}'.format(
-                        self.url, response['@uuid']
-                    ),
-                    headers=headers
-                )
-                single_am_content = json.loads(request.content)
-                #print json.dumps(single_am_content, indent=2)
-                active_models[response['@uuid']] = \
-                    self.build_simple_active_model(single_am_content)
-
-            return active_models
-        else:
-            return 'Error: exited with status code: {0}'.format(
-                str(request.status_code))
+        if isinstance(am_content, basestring):
+            return am_content
+        uuids = [response['@uuid'] for response in am_content['response']]
+        # get info from razor about each active model, several at a time
+        models = threading_iface.execute(
+            [partial(self.simple_active_model, uuid) for uuid in uuids],
+            max_workers=min(len(uuids), MAX_REQUESTS) or 1)
+        return dict(zip(uuids, models))
+
+    def simple_active_model(self, am_uuid):
+        """Returns a single active model with an easy to consume JSON,
+        caching it briefly.
+        :param am_uuid: uuid of the active model
+        :type am_uuid: str
+        :rtype: dict
+        """
+        def fetch():
+            request = self.session.get(
+                '{0}/active_model/{1}'.format(self.url, am_uuid))
+            request.raise_for_status()
+            return self.build_simple_active_model(
+                json.loads(request.content))
+        return self.cache.get(('active_model', am_uuid), fetch)
 
     def build_simple_active_model(self, razor_json):
         """Returns an active model JSON simplified from the Razor API json."""
@@ -376,9 +418,10 @@ class RazorAPI(object):
 
         # Call the Razor RESTful API to get a list of models
         headers = {'content-type': 'application/json'}
-        request = requests.delete('{0}/active_model/{1}'
-                                  ''.format(self.url, am_uuid),
-                                  headers=headers)
+        request = self.session.delete('{0}/active_model/{1}'
+                                      ''.format(self.url, am_uuid),
+                                      headers=headers)
+        self.cache.invalidate()
 
         return {'status': request.status_code,
                 'content': json.loads(request.content)}
@@ -395,8 +438,9 @@ class RazorAPI(object):
     def get_active_model_pass(self, am_uuid):
         """ Gets an active model's password. """
         headers = {'content-type': 'application/json'}
-        request = requests.get('{0}/active_model/{1}'
-                               ''.format(self.url, am_uuid), headers=headers)
+        request = self.session.get('{0}/active_model/{1}'
+                                   ''.format(self.url, am_uuid),
+                                   headers=headers)
 
         passwd = ''
         if request.status_code == 200:
@@ -404,3 +448,16 @@ class RazorAPI(object):
             passwd = content_json['response'][0]['@model']['@root_password']
 
         return {'status_code': request.status_code, 'password': passwd}
+
+
+def razor_session():
+    """Returns a session that keeps connections to the Razor API alive,
+    with enough of them pooled for concurrent requests.
+    :rtype: requests.Session
+    """
+    session = requests.Session()
+    session.headers['content-type'] = 'application/json'
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_REQUESTS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
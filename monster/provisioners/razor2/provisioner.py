@@ -1,12 +1,15 @@
 import json
 import logging
-import sys
-
-import requests
+import threading
+from functools import partial
 
 import monster.nodes.util as node_utils
 import monster.provisioners.base as base
 import monster.active as active
+import monster.threading_iface as threading_iface
+from monster.provisioners.razor.provisioner import (MAX_REQUESTS,
+                                                    razor_session)
+from monster.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -17,45 +20,68 @@ class Provisioner(base.Provisioner):
     def __init__(self, url=None):
         self.url = url or active.config['secrets']['razor']['url']
         self.api = RazorAPI2(self.url)
+        self._reserved = {}
+        self._reserved_lock = threading.Lock()
 
     def __str__(self):
         return 'razor2'
 
+    def reserve_nodes(self, deployment, specs):
+        """Claims a pool node for every spec at once, for provision_node
+        to hand out.
+        :type deployment: monster.deployments.base.Deployment
+        :type specs: list
+        """
+        nodes = self.claim_nodes(len(specs), deployment.os_name, deployment)
+        with self._reserved_lock:
+            self._reserved.setdefault(deployment.name, []).extend(nodes)
+
+    def release_reservations(self, deployment):
+        """Returns reserved nodes that were not provisioned to the pool.
+        :type deployment: monster.deployments.base.Deployment
+        """
+        with self._reserved_lock:
+            nodes = self._reserved.pop(deployment.name, [])
+        node_utils.release_nodes(nodes)
+
     def provision_node(self, deployment, specs):
-        """Provisions nodes using Razor environment.
+        """Provisions a chef node using Razor environment.
         :param deployment: ChefDeployment to provision for
         :type deployment: Deployment
-        :rtype: list
+        :rtype: chef.Node
         """
         logger.info("Provisioning with Razor!")
-        image = deployment.os_name
-        self.nodes += [self.available_node(image, deployment)
-                       for _ in specs]
-        return self.nodes
-
-    def available_node(self, image, deployment):
-        """Provides a free node from chef pool.
+        with self._reserved_lock:
+            reserved = self._reserved.get(deployment.name)
+            if reserved:
+                return reserved.pop(0)
+        return self.claim_nodes(1, deployment.os_name, deployment)[0]
+
+    def claim_nodes(self, count, image, deployment):
+        """Claims free nodes from chef pool.
+        :param count: number of nodes to claim
+        :type count: int
         :param image: name of os image
         :type image: string
-        :param deployment: ChefDeployment to add node to
+        :param deployment: ChefDeployment to add nodes to
         :type deployment: Deployment
-        :rtype: Node
+        :rtype: list (chef.Node)
         """
-
         # TODO: Should probably search on system name node attributes
         # Avoid specific naming of razor nodes, not portable
-        nodes = node_utils.node_search("name:node*")
-        for node in nodes:
-            is_default = node.chef_environment == "_default"
-            iface_in_run_list = "recipe[rcbops-qa]" in node.run_list
-            if is_default and iface_in_run_list:
-                node.chef_environment = deployment.environment.name
-                node['in_use'] = "provisioning"
-                node.save()
-                return node
-        deployment.destroy()
-        logger.info("Cannot build, no more available_nodes")
-        sys.exit(1)
+        return node_utils.claim_nodes("name:node*", count,
+                                      deployment.environment.name,
+                                      self.is_free)
+
+    @staticmethod
+    def is_free(node):
+        """Whether a pool node is available to be claimed.
+        :type node: chef.Node
+        :rtype: bool
+        """
+        is_default = node.chef_environment == "_default"
+        iface_in_run_list = "recipe[rcbops-qa]" in node.run_list
+        return is_default and iface_in_run_list
 
     def power_down(self, node):
         if node.has_feature('controller'):
@@ -81,6 +107,7 @@ class Provisioner(base.Provisioner):
             node['archive'] = {}
             node.chef_environment = "_default"
             node.save()
+            node_utils.release_claim(node.name)
         else:
             # Reinstall node if the node is dirty
             razor_node = node.name.split("-")[0]
@@ -104,6 +131,8 @@ class RazorAPI2(object):
     def __init__(self, url=None):
         """Initializer for RazorAPI class."""
         self.url = str(url)
+        self.session = razor_session()
+        self.cache = TTLCache(ttl=30)
 
     def __repr__(self):
         outl = 'class: {0}'.format(self.__class__.__name__)
@@ -113,32 +142,40 @@ class RazorAPI2(object):
 
     def nodes(self):
         """Return all current nodes."""
-        # Call the Razor RESTful API to get a list of nodes
-        headers = {'content-type': 'application/json'}
-        request = requests.get(
-            '{0}/collections/nodes'.format(self.url), headers=headers)
-
-        # Check the status code and return appropriately
-        if request.status_code == 200:
-            return json.loads(request.content)
-        else:
-            return 'Error: exited with status code: {0}'.format(
-                str(request.status_code))
+        return self._get_json('{0}/collections/nodes'.format(self.url))
 
     def node(self, node):
         """Return a given node."""
-
-        # Call the Razor RESTful API to get a node
-        headers = {'content-type': 'application/json'}
-        request = requests.get('{0}/collections/nodes/{1}'.format(
-            self.url, node), headers=headers)
+        return self._get_json('{0}/collections/nodes/{1}'.format(self.url,
+                                                                 node))
+
+    def nodes_detail(self, names):
+        """Return several given nodes, fetched concurrently.
+        :param names: Razor node names
+        :type names: list (str)
+        :rtype: dict
+        """
+        names = list(names)
+        details = threading_iface.execute(
+            [partial(self.node, name) for name in names],
+            max_workers=min(len(names), MAX_REQUESTS) or 1)
+        return dict(zip(names, details))
+
+    def _get_json(self, url):
+        """Call the Razor RESTful API, briefly caching successful responses.
+        """
+        def fetch():
+            request = self.session.get(url)
+            if request.status_code != 200:
+                raise _RequestError(request.status_code)
+            return json.loads(request.content)
 
         # Check the status code and return appropriately
-        if request.status_code == 200:
-            return json.loads(request.content)
-        else:
+        try:
+            return self.cache.get(url, fetch)
+        except _RequestError as e:
             return 'Error: exited with status code: {0}'.format(
-                str(request.status_code))
+                str(e.status_code))
 
     def reinstall_node(self, node):
         """Reinstalls a given node.
@@ -149,8 +186,10 @@ class RazorAPI2(object):
         # Call the Razor RESTful API to get a node
         headers = {'content-type': 'application/json'}
         data = '{{"name": "{0}"}}'.format(node)
-        request = requests.post('{0}/commands/reinstall-node'.format(self.url),
-                                headers=headers, data=data)
+        request = self.session.post(
+            '{0}/commands/reinstall-node'.format(self.url),
+            headers=headers, data=data)
+        self.cache.invalidate()
 
         # Check the status code and return appropriately
         if request.status_code == 202 and 'no changes' not in request.content:
@@ -168,8 +207,10 @@ class RazorAPI2(object):
         # Call the Razor RESTful API to get a node
         headers = {'content-type': 'application/json'}
         data = '{{"name": "{0}"}}'.format(node)
-        request = requests.post('{0}/commands/delete-node'.format(self.url),
-                                headers=headers, data=data)
+        request = self.session.post(
+            '{0}/commands/delete-node'.format(self.url),
+            headers=headers, data=data)
+        self.cache.invalidate()
 
         # Check the status code and return appropriately
         if request.status_code == 202 and 'no changes' not in request.content:
@@ -177,3 +218,9 @@ class RazorAPI2(object):
         else:
             return 'Error: exited with status code: {0}'.format(
                 str(request.status_code))
+
+
+class _RequestError(Exception):
+    def __init__(self, status_code):
+        super(_RequestError, self).__init__(status_code)
+        self.status_code = status_code
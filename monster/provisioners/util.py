@@ -1,23 +1,34 @@
+import importlib
 import logging
-
-import monster.provisioners.openstack.provisioner as openstack
-import monster.provisioners.rackspace.provisioner as rackspace
-import monster.provisioners.razor.provisioner as razor
-import monster.provisioners.razor2.provisioner as razor2
+import threading
 
 logger = logging.getLogger(__name__)
 
+# modules of the provisioners, which are only imported when first used as
+# each pulls in its own client libraries
+PROVISIONERS = {'openstack': 'monster.provisioners.openstack.provisioner',
+                'rackspace': 'monster.provisioners.rackspace.provisioner',
+                'razor': 'monster.provisioners.razor.provisioner',
+                'razor2': 'monster.provisioners.razor2.provisioner'}
+
+_provisioners = {}
+_provisioners_lock = threading.Lock()
+
 
 def get_provisioner(provisioner_name):
-    """Returns an instance of the correct provisioner class.
+    """Returns the process's instance of the correct provisioner class,
+    creating it on first use so that its clients authenticate only once.
     :type provisioner_name: str
     :rtype: monster.provisioners.base.Provisioner
     """
-    provisioner_dict = {'openstack': openstack.Provisioner,
-                        'rackspace': rackspace.Provisioner,
-                        'razor': razor.Provisioner,
-                        'razor2': razor2.Provisioner}
-    try:
-        return provisioner_dict[provisioner_name]()
-    except KeyError:
-        logger.critical("Provisioner {} not found.".format(provisioner_name))
+    with _provisioners_lock:
+        if provisioner_name not in _provisioners:
+            try:
+                module_name = PROVISIONERS[provisioner_name]
+            except KeyError:
+                logger.critical("Provisioner {} not found."
+                                .format(provisioner_name))
+                return None
+            module = importlib.import_module(module_name)
+            _provisioners[provisioner_name] = module.Provisioner()
+        return _provisioners[provisioner_name]
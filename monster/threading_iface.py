@@ -1,18 +1,330 @@
-from futures import ThreadPoolExecutor
-from Queue import Queue
+import threading
+import time
 
+from collections import deque
+from futures import (ThreadPoolExecutor, CancelledError, TimeoutError, wait,
+                     FIRST_COMPLETED)
 
-def execute(func_list):
-    q = Queue()
-    output = []
+import monster.active as active
 
-    def f(func):
-        q.put(func())
+DEFAULT_MAX_WORKERS = 32
 
-    with ThreadPoolExecutor(max_workers=6) as executor:
-        [executor.submit(f, function) for function in func_list]
+# threads shared by every remote command submitted with submit(); commands
+# spend nearly all of their time waiting on the network, so many of them
+# can run at once
+DEFAULT_COMMAND_WORKERS = 256
 
-    while not q.empty():
-        output.append(q.get())
+_command_executor = None
+_command_executor_lock = threading.Lock()
 
-    return output
+
+class ExecutionError(Exception):
+    """Raised when functions executed together fail and the failures were
+    collected rather than raised immediately."""
+    def __init__(self, errors, results):
+        """
+        :param errors: (index, exception) of each function that failed
+        :type errors: list
+        :param results: results in submission order, with the exception in
+        place of each failed function's result
+        :type results: list
+        """
+        self.errors = errors
+        self.results = results
+        super(ExecutionError, self).__init__(
+            "{0} of {1} tasks failed: {2}".format(
+                len(errors), len(results),
+                "; ".join("#{0}: {1!r}".format(index, error)
+                          for index, error in errors)))
+
+
+def max_workers(task_count):
+    """Returns the number of threads to run task_count functions with: one
+    per function, limited by the max_workers build argument or else by the
+    threading max_workers config.
+    :type task_count: int
+    :rtype: int
+    """
+    limit = (_as_int(active.build_args.get('max_workers')) or
+             _as_int(_threading_config().get('max_workers')) or
+             DEFAULT_MAX_WORKERS)
+    return max(1, min(task_count, limit))
+
+
+def task_timeout():
+    """Returns the configured per-function timeout in seconds, if any.
+    :rtype: int
+    """
+    return _as_int(_threading_config().get('task_timeout'))
+
+
+def execute(func_list, max_workers=None, timeout=None, fail_fast=True):
+    """Runs functions concurrently.
+    :param func_list: functions that take no arguments
+    :type func_list: iterable (function)
+    :param max_workers: number of threads; defaults to max_workers()
+    :type max_workers: int
+    :param timeout: seconds each function may run for; defaults to
+    task_timeout()
+    :type timeout: int
+    :param fail_fast: on the first failure cancel the functions that have
+    not started and re-raise it; otherwise run every function and raise an
+    ExecutionError carrying all of the failures
+    :type fail_fast: bool
+    :return: results in the order the functions were given
+    :rtype: list
+    """
+    outcomes = _run(list(func_list), max_workers, timeout, fail_fast)
+    errors = [(index, outcome) for index, outcome in enumerate(outcomes)
+              if isinstance(outcome, Exception)]
+    if errors:
+        raise ExecutionError(errors, outcomes)
+    return outcomes
+
+
+def execute_each(func_dict, max_workers=None, fail_fast=True, timeout=None):
+    """Runs a dict of callables concurrently.
+    :param func_dict: callables keyed by name
+    :type func_dict: dict
+    :param max_workers: number of threads; defaults to max_workers()
+    :type max_workers: int
+    :param fail_fast: re-raise the first exception and cancel the callables
+    that have not started; otherwise the exception is returned in place of
+    that callable's result
+    :type fail_fast: bool
+    :param timeout: seconds each callable may run for; defaults to
+    task_timeout()
+    :type timeout: int
+    :rtype: dict
+    """
+    keys = list(func_dict)
+    outcomes = _run([func_dict[key] for key in keys], max_workers, timeout,
+                    fail_fast)
+    return dict(zip(keys, outcomes))
+
+
+class Task(object):
+    """A function running on the shared command executor. Unlike a plain
+    future it can be stopped while it runs: the function is handed a
+    threading.Event that cancel() sets, which it is expected to check, e.g.
+    by passing it on to ssh_cmd.
+    """
+    def __init__(self, func, name=None, start=True):
+        """
+        :param func: function taking the stop event
+        :type func: function
+        :param name: name the task's result is reported under by gather()
+        :type name: str
+        :param start: submit the function now; otherwise it is submitted by
+        start(), e.g. when gather() has room for it
+        :type start: bool
+        """
+        self.name = name
+        self.func = func
+        self.stop = threading.Event()
+        self.future = None
+        if start:
+            self.start()
+
+    def __repr__(self):
+        return "<Task {0}>".format(self.name)
+
+    def start(self):
+        """Submits the function unless it already has been or the task has
+        been cancelled."""
+        if self.future is None and not self.stop.is_set():
+            self.future = command_executor().submit(self.func, self.stop)
+
+    def cancel(self):
+        """Cancels the task if it has not started and stops it if it has."""
+        self.stop.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def exception(self, timeout=None):
+        return self.future.exception(timeout)
+
+
+def submit(func, name=None):
+    """Starts a function on the shared command executor.
+    :param func: function taking a threading.Event that is set when the task
+    is cancelled
+    :type func: function
+    :param name: name the task's result is reported under by gather()
+    :type name: str
+    :rtype: Task
+    """
+    return Task(func, name)
+
+
+def gather(tasks, timeout=None, fail_fast=True, concurrency=None):
+    """Waits for tasks started with submit(), starting those created with
+    start=False as others finish.
+    :type tasks: iterable (Task)
+    :param timeout: seconds to wait for all of the tasks; those still
+    running are cancelled once it passes
+    :type timeout: int
+    :param fail_fast: on the first failure cancel the other tasks and
+    re-raise it; otherwise the exception is returned in place of that
+    task's result
+    :type fail_fast: bool
+    :param concurrency: number of tasks to have running at once; unstarted
+    tasks are started in order as running ones finish
+    :type concurrency: int
+    :return: results keyed by task name, or in the order the tasks were
+    given if they are unnamed
+    :rtype: dict or list
+    """
+    tasks = list(tasks)
+    futures = {task.future: task for task in tasks if task.future is not None}
+    deadline = time.time() + timeout if timeout else None
+    pending = set(futures)
+    waiting = deque(task for task in tasks if task.future is None)
+    error = None
+    try:
+        _start_waiting(waiting, futures, pending, concurrency)
+        while pending:
+            remaining = deadline - time.time() if deadline else None
+            if remaining is not None and remaining <= 0:
+                error = TimeoutError("{0} of {1} tasks timed out after {2}s"
+                                     .format(len(pending), len(tasks),
+                                             timeout))
+                if fail_fast:
+                    raise error
+                break
+            done, pending = wait(pending, timeout=remaining,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                if fail_fast and not future.cancelled() and \
+                        future.exception():
+                    raise future.exception()
+            _start_waiting(waiting, futures, pending, concurrency)
+    finally:
+        for future in pending:
+            futures[future].cancel()
+        for task in waiting:
+            task.cancel()
+
+    outcomes = [error if task.future in pending or task in waiting
+                else _outcome(task) for task in tasks]
+    if all(task.name is None for task in tasks):
+        return outcomes
+    return {task.name: outcome for task, outcome in zip(tasks, outcomes)}
+
+
+def command_executor():
+    """Returns the executor shared by tasks started with submit(), sized by
+    the threading command_workers config.
+    :rtype: futures.ThreadPoolExecutor
+    """
+    global _command_executor
+    with _command_executor_lock:
+        if _command_executor is None:
+            workers = (_as_int(_threading_config().get('command_workers')) or
+                       DEFAULT_COMMAND_WORKERS)
+            _command_executor = ThreadPoolExecutor(max_workers=workers)
+        return _command_executor
+
+
+def _start_waiting(waiting, futures, pending, concurrency):
+    """Starts waiting tasks until concurrency of them are pending."""
+    while waiting and not (concurrency and len(pending) >= concurrency):
+        task = waiting.popleft()
+        task.start()
+        futures[task.future] = task
+        pending.add(task.future)
+
+
+def _outcome(task):
+    if task.future is None or task.future.cancelled():
+        return CancelledError("{0!r} was cancelled".format(task))
+    return task.exception() or task.result()
+
+
+def _run(funcs, workers, timeout, fail_fast):
+    """Runs funcs on a thread pool, returning each one's result or exception
+    in order. Threads cannot be interrupted, so once a function times out
+    the functions still running are left to finish in the background.
+    """
+    if not funcs:
+        return []
+    workers = workers or max_workers(len(funcs))
+    timeout = timeout or task_timeout()
+    started = {}
+
+    def run(index, func):
+        started[index] = time.time()
+        return func()
+
+    outcomes = [None] * len(funcs)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = {executor.submit(run, index, func): index
+               for index, func in enumerate(funcs)}
+    pending = set(futures)
+    abandoned = False
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=_poll(started, pending,
+                                                        futures, timeout),
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() and fail_fast:
+                    _cancel(pending)
+                    future.result()
+                outcomes[futures[future]] = (future.exception() or
+                                             future.result())
+            for future in _timed_out(started, pending, futures, timeout):
+                pending.discard(future)
+                error = TimeoutError("Task #{0} timed out after {1}s"
+                                     .format(futures[future], timeout))
+                abandoned = True
+                if fail_fast:
+                    _cancel(pending)
+                    raise error
+                outcomes[futures[future]] = error
+    finally:
+        executor.shutdown(wait=not abandoned)
+    return outcomes
+
+
+def _poll(started, pending, futures, timeout):
+    """Seconds to wait before checking the running functions for timeouts.
+    """
+    if not timeout:
+        return None
+    running = [started[futures[future]] for future in pending
+               if futures[future] in started]
+    if not running:
+        return timeout
+    return max(0.1, min(running) + timeout - time.time())
+
+
+def _timed_out(started, pending, futures, timeout):
+    if not timeout:
+        return []
+    now = time.time()
+    return [future for future in pending
+            if futures[future] in started and
+            now - started[futures[future]] > timeout]
+
+
+def _cancel(pending):
+    for future in pending:
+        future.cancel()
+
+
+def _threading_config():
+    return (active.config or {}).get('threading') or {}
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
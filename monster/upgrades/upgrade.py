@@ -28,30 +28,22 @@ class Upgrade(object):
         cmd = ("{0} clean; {0} update; {0} -y install python-warlock "
                "python-swiftclient babel".format(self.pkg_up_cmd))
 
-        for controller in self.deployment.controllers:
-            controller.run_cmd(cmd)
-
-        for compute in self.deployment.computes:
-            compute.run_cmd(cmd)
+        self.deployment.run_on(self.deployment.controllers_and_computes, cmd)
 
     def fix_horizon(self):
         """Fixes a deployment's Horizon."""
         cmd = ("{0} clean; {0} update; {0} -y install openstack-dashboard "
                "python-django-horizon".format(self.pkg_up_cmd))
 
-        for controller in self.deployment.controllers:
-            controller.run_cmd(cmd)
+        self.deployment.run_on(self.deployment.controllers, cmd)
 
     def fix_qemu(self):
         """Fixes a deployment's QEMU."""
         node_commands = ("{0} update; {0} remove qemu-utils -y; "
                          "{0} install qemu-utils -y".format(self.pkg_up_cmd))
 
-        for controller in self.deployment.controllers:
-            controller.run_cmd(node_commands)
-
-        for compute in self.deployment.computes:
-            compute.run_cmd(node_commands)
+        self.deployment.run_on(self.deployment.controllers_and_computes,
+                               node_commands)
 
     def mungerate(self):
         """Runs RCBOPS mungerator for upgrading 4.1.x to 4.2.x or from Grizzly
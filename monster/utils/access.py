@@ -1,18 +1,79 @@
-import cStringIO
+import atexit
+import errno
 import os
+import select
 import socket
 import subprocess
-import sys
+import threading
 import time
 import paramiko
 import logging
 
+from collections import defaultdict, deque
+
+import monster.active as active
+import monster.utils.metrics as metrics
+import monster.utils.timing as timing
+
 
 logger = logging.getLogger(__name__)
 
+# lines of each of a command's stdout and stderr kept in ssh_cmd's result
+DEFAULT_TAIL_LINES = 5000
+
+
+def ssh_port():
+    """Returns the port nodes accept SSH connections on, as set by the ssh
+    port config.
+    :rtype: int
+    """
+    return int(((active.config or {}).get('ssh') or {}).get('port') or 22)
+
+
+def listening(hosts, port, timeout=1):
+    """Returns which hosts accept connections on a port, probing them all
+    at once with non-blocking connects; hosts that are not up yet are
+    simply left out.
+    :type hosts: iterable (str)
+    :type port: int
+    :param timeout: seconds to wait for the connections to be accepted
+    :type timeout: float
+    :rtype: set (str)
+    """
+    up = set()
+    probes = {}
+    for host in hosts:
+        probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        probe.setblocking(0)
+        error = probe.connect_ex((host, port))
+        if error == 0:
+            up.add(host)
+            probe.close()
+        elif error in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+            probes[probe] = host
+        else:
+            probe.close()
+    deadline = time.time() + timeout
+    try:
+        while probes:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            _, connected, _ = select.select([], list(probes), [], remaining)
+            for probe in connected:
+                if not probe.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+                    up.add(probes[probe])
+                probe.close()
+                del probes[probe]
+    finally:
+        for probe in probes:
+            probe.close()
+    return up
+
 
 def check_port(host, port, timeout=2, attempts=100):
     logger.debug("Testing connection to - {0}:{1}".format(host, port))
+    start = time.time()
     for attempt in xrange(attempts):
         try:
             s = socket.create_connection((host, port), timeout)
@@ -26,8 +87,10 @@ def check_port(host, port, timeout=2, attempts=100):
             ssh_up = True
             break
     else:
+        metrics.increment('check_port_failures')
         raise Exception("Connection unsuccessful to {host}:{port}"
                         .format(host=host, port=port))
+    metrics.observe('check_port_wait_seconds', time.time() - start)
     return ssh_up
 
 
@@ -47,6 +110,132 @@ def get_paramiko_ssh_client():
     return ssh
 
 
+class SSHPool(object):
+    """Keeps one authenticated SSH transport per (ip, user) so that repeated
+    commands against a node reuse the connection instead of paying for a new
+    TCP connection, key exchange and password authentication each time.
+    """
+    def __init__(self, idle_check=30):
+        """
+        :param idle_check: seconds a connection may sit idle before it is
+        health-checked on its next use
+        :type idle_check: int
+        """
+        self.idle_check = idle_check
+        self._clients = {}
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self._key_locks = defaultdict(threading.Lock)
+
+    def transport(self, ip, user, password=None, attempts=5,
+                  remote_log_string=""):
+        """Returns a live, authenticated transport for ip and user,
+        connecting if there is none or the pooled one has gone stale.
+        :rtype: paramiko.Transport
+        """
+        key = (ip, user)
+        with self._lock:
+            key_lock = self._key_locks[key]
+        with key_lock:
+            client = self._clients.get(key)
+            if client and not self._healthy(key, client):
+                logger.debug(remote_log_string + "Dropping stale connection")
+                self._discard(key)
+                client = None
+            if not client:
+                client = self._connect(ip, user, password, attempts,
+                                       remote_log_string)
+                self._clients[key] = client
+            self._last_used[key] = time.time()
+            return client.get_transport()
+
+    def open_session(self, ip, user, password=None, attempts=5,
+                     remote_log_string=""):
+        """Opens a new channel on the pooled transport; a transport that
+        has died by the time it fails to open a channel is evicted and
+        replaced once.
+        :rtype: paramiko.Channel
+        """
+        transport = self.transport(ip, user, password, attempts,
+                                   remote_log_string)
+        try:
+            return transport.open_session()
+        except (paramiko.SSHException, EOFError, socket.error):
+            if transport.is_active():
+                raise
+            logger.info(remote_log_string + "Pooled connection failed; "
+                                            "reconnecting...")
+            self.evict(ip, user, transport)
+            return self.transport(ip, user, password, attempts,
+                                  remote_log_string).open_session()
+
+    def evict(self, ip, user, transport=None):
+        """Closes and forgets the connection for ip and user.
+        :param transport: only evict the connection if it is still this
+        transport, rather than one another thread has since reconnected
+        :type transport: paramiko.Transport
+        """
+        key = (ip, user)
+        with self._lock:
+            key_lock = self._key_locks[key]
+        with key_lock:
+            client = self._clients.get(key)
+            if client and (transport is None or
+                           client.get_transport() is transport):
+                self._discard(key)
+
+    def close(self, ip=None):
+        """Closes pooled connections to ip, or all of them.
+        :param ip: address of the node whose connections to close
+        :type ip: str
+        """
+        with self._lock:
+            keys = list(self._clients)
+        for key in keys:
+            if ip is None or key[0] == ip:
+                self.evict(*key)
+
+    def _discard(self, key):
+        """Closes and forgets a connection; the caller holds its key lock.
+        """
+        client = self._clients.pop(key, None)
+        self._last_used.pop(key, None)
+        if client:
+            client.close()
+
+    def _healthy(self, key, client):
+        transport = client.get_transport()
+        if not transport or not transport.is_active():
+            return False
+        if time.time() - self._last_used.get(key, 0) > self.idle_check:
+            try:
+                transport.send_ignore()
+            except (paramiko.SSHException, EOFError, socket.error):
+                return False
+        return True
+
+    def _connect(self, ip, user, password, attempts, remote_log_string):
+        ssh = get_paramiko_ssh_client()
+        for attempt in range(attempts):
+            try:
+                with metrics.timer('ssh_connect_seconds'):
+                    ssh.connect(ip, port=ssh_port(), username=user,
+                                password=password, allow_agent=False)
+                return ssh
+            except (EOFError, socket.error):
+                metrics.increment('ssh_connect_failures')
+                logger.info(remote_log_string + "Error connecting; "
+                                                "retrying...")
+                time.sleep(0.5)
+        logger.error(remote_log_string + "Ran out of connection attempts!")
+        raise paramiko.SSHException("Unable to connect to {0}@{1}"
+                                    .format(user, ip))
+
+
+ssh_pool = SSHPool()
+atexit.register(ssh_pool.close)
+
+
 def scp_from(ip, remote_path, local_path, user, password=None):
     """
     :param remote_path: file to copy
@@ -55,10 +244,12 @@ def scp_from(ip, remote_path, local_path, user, password=None):
     logger.info("SCP: {host}:{path} to {local}"
                 .format(host=ip, path=remote_path, local=local_path))
 
-    ssh = get_paramiko_ssh_client()
-    ssh.connect(ip, username=user, password=password, allow_agent=False)
-    sftp = ssh.open_sftp()
-    sftp.get(remote_path, local_path)
+    transport = ssh_pool.transport(ip, user, password)
+    sftp = paramiko.SFTPClient.from_transport(transport)
+    try:
+        sftp.get(remote_path, local_path)
+    finally:
+        sftp.close()
 
 
 def scp_to(ip, local_path, remote_path, user, password=None):
@@ -69,57 +260,169 @@ def scp_to(ip, local_path, remote_path, user, password=None):
     logger.info("SCP: {local} to {host}:{path}"
                 .format(local=local_path, host=ip, path=remote_path))
 
-    ssh = get_paramiko_ssh_client()
-    ssh.connect(ip, username=user, password=password, allow_agent=False)
-    sftp = ssh.open_sftp()
-    sftp.put(local_path, remote_path)
+    transport = ssh_pool.transport(ip, user, password)
+    sftp = paramiko.SFTPClient.from_transport(transport)
+    try:
+        sftp.put(local_path, remote_path)
+    finally:
+        sftp.close()
 
 
 def ssh_cmd(server_ip, remote_cmd, user='root', password=None, attempts=5,
-            hostname=""):
-    """
+            hostname="", on_line=None, tail=DEFAULT_TAIL_LINES,
+            log_file=None, timeout=None, stop=None, label=None):
+    """Runs a command over a pooled connection to the server. Its stdout
+    and stderr are read together as they arrive, so that neither can fill
+    up and stall the command.
     :param server_ip
     :param user
     :param password
     :param remote_cmd
+    :param on_line: called with ('stdout' or 'stderr', line) for each line
+    of output as it is received
+    :type on_line: function
+    :param tail: number of lines of each stream to keep in the result;
+    None keeps everything
+    :type tail: int
+    :param log_file: path of a file to append all of the output to
+    :type log_file: str
+    :param timeout: seconds the command may run for before its channel is
+    closed
+    :type timeout: int
+    :param stop: event that closes the command's channel when set
+    :type stop: threading.Event
+    :param label: name of the command in the build's profile; defaults to
+    its first word, as the rest may hold secrets such as passwords
+    :type label: str
     :return A map based on pass / fail run info
     """
     remote_log_string = ("IP: %(ip)-17s HOST: %(host)-23s " %
                          {"ip": server_ip, "host": hostname})
 
-    output = cStringIO.StringIO()
-    error = cStringIO.StringIO()
-    ssh = get_paramiko_ssh_client()
-    for attempt in range(attempts):
+    output = _OutputStream('stdout', tail)
+    error = _OutputStream('stderr', tail)
+    label = label or _command_label(remote_cmd)
+    with timing.span(label, 'ssh', hostname or server_ip) as span:
+        channel = ssh_pool.open_session(server_ip, user, password, attempts,
+                                        remote_log_string)
+        logger.info(remote_log_string + "Running: " + remote_cmd)
+        log = None
         try:
-            ssh.connect(server_ip, username=user, password=password,
-                        allow_agent=False)
-            break
-        except (EOFError, socket.error):
-            logger.info(remote_log_string + "Error connecting; retrying...")
-            time.sleep(0.5)
-    else:
-        logger.exception(remote_log_string + "Ran out of connection attempts!")
-    logger.info(remote_log_string + "Running: " + remote_cmd)
-    stdin, stdout, stderr = ssh.exec_command(remote_cmd)
-    stdin.close()
-    for line in stdout:
-        if logger < 10:
-            logger.debug(remote_log_string + line)
-            sys.stdout.write(line)
-        logger.info(remote_log_string + line.strip())
-        output.write(line)
-    for line in stderr:
-        logger.error(remote_log_string + line.strip())
-        error.write(line)
-    exit_status = stdout.channel.recv_exit_status()
+            log = open(log_file, 'a') if log_file else None
+            if log:
+                log.write("$ {0}\n".format(remote_cmd))
+            channel.exec_command(remote_cmd)
+            channel.shutdown_write()
+            deadline = time.time() + timeout if timeout else None
+            for name, line in _read_output(channel, output, error, deadline,
+                                           stop):
+                if name == 'stdout':
+                    logger.info(remote_log_string + line.rstrip())
+                else:
+                    logger.error(remote_log_string + line.rstrip())
+                if log:
+                    log.write(line)
+                if on_line:
+                    on_line(name, line)
+            exit_status = channel.recv_exit_status()
+        except (paramiko.SSHException, EOFError, socket.error):
+            metrics.increment('ssh_command_errors')
+            # other commands may share the connection, so it is only
+            # dropped if it is the connection rather than the channel that
+            # failed
+            transport = channel.get_transport()
+            if not transport.is_active():
+                ssh_pool.evict(server_ip, user, transport)
+            raise
+        finally:
+            channel.close()
+            if log:
+                log.close()
+    metrics.observe('ssh_command_seconds', span.duration,
+                    success=exit_status == 0)
     result = {'success': True if exit_status == 0 else False,
-              'return': output.getvalue(),
+              'return': output.value,
               'exit_status': exit_status,
-              'error': error.getvalue()}
+              'error': error.value,
+              'truncated': output.truncated or error.truncated}
     return result
 
 
+def _read_output(channel, output, error, deadline=None, stop=None,
+                 chunk_size=32768):
+    """Yields (stream name, line) for a running command's output, reading
+    whichever of stdout and stderr has data until the command exits."""
+    while True:
+        if stop is not None and stop.is_set():
+            raise Exception("Command was stopped")
+        if deadline is not None and time.time() > deadline:
+            raise Exception("Command timed out")
+        select.select([channel], [], [], 1.0)
+        received = False
+        if channel.recv_ready():
+            received = True
+            for line in output.feed(channel.recv(chunk_size)):
+                yield output.name, line
+        if channel.recv_stderr_ready():
+            received = True
+            for line in error.feed(channel.recv_stderr(chunk_size)):
+                yield error.name, line
+        if not received and (channel.exit_status_ready() or
+                             channel.eof_received):
+            break
+    for stream in (output, error):
+        for line in stream.flush():
+            yield stream.name, line
+
+
+class _OutputStream(object):
+    """Splits one of a command's output streams into lines, keeping only
+    the last of them."""
+    def __init__(self, name, tail):
+        self.name = name
+        self.lines = deque(maxlen=tail)
+        self.truncated = False
+        self._partial = ""
+
+    def feed(self, data):
+        """Returns the lines completed by data."""
+        lines = (self._partial + data).split("\n")
+        self._partial = lines.pop()
+        return [self._keep(line + "\n") for line in lines]
+
+    def flush(self):
+        """Returns any final line that did not end with a newline."""
+        if not self._partial:
+            return []
+        line, self._partial = self._partial, ""
+        return [self._keep(line)]
+
+    @property
+    def value(self):
+        return "".join(self.lines)
+
+    def _keep(self, line):
+        if self.lines.maxlen is not None and \
+                len(self.lines) == self.lines.maxlen:
+            self.truncated = True
+        self.lines.append(line)
+        return line
+
+
+def _command_label(command):
+    """Returns the program a command runs, skipping environment variables
+    set for it, e.g. "apt-get" for "DEBIAN_FRONTEND=noninteractive apt-get
+    install -y git".
+    :type command: str
+    :rtype: str
+    """
+    words = command.split()
+    for word in words:
+        if "=" not in word:
+            return word
+    return words[0] if words else ""
+
+
 def run_cmd(command):
     """
     :param command
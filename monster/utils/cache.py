@@ -0,0 +1,65 @@
+"""Thread-safe caching of values that are expensive to look up."""
+import threading
+import time
+
+
+class TTLCache(object):
+    """Caches values for a number of seconds. Concurrent lookups of a key
+    that is not cached wait on a single load rather than each loading it.
+    """
+    def __init__(self, ttl=300):
+        """
+        :param ttl: seconds a loaded value is kept for
+        :type ttl: int
+        """
+        self.ttl = ttl
+        self._entries = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """Returns the cached value for key, loading it if it is missing or
+        has expired.
+        :param key: hashable key of the value
+        :param loader: function that takes no arguments and returns the value
+        :type loader: function
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[0] > time.time():
+                    return entry[1]
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # another thread is loading the key; if its load failed the
+            # key is still missing and this thread tries in turn
+            loading.wait()
+
+        try:
+            value = loader()
+            with self._lock:
+                self._entries[key] = (time.time() + self.ttl, value)
+            return value
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+
+    def set(self, key, value):
+        """Caches a value that is already known, e.g. one just written.
+        :param key: hashable key of the value
+        """
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+
+    def invalidate(self, key=None):
+        """Drops a cached value, or every cached value if no key is given.
+        :param key: key of the value to drop
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -0,0 +1,308 @@
+"""Counters and histograms for monster's remote operations.
+
+Metrics are exported by the backend named in the metrics config:
+
+    metrics:
+        backend: prometheus  # or statsd; anything else disables them
+        textfile_dir: /var/lib/node_exporter/textfile_collector
+        statsd_host: localhost
+        statsd_port: 8125
+        prefix: monster
+
+The prometheus backend keeps totals in memory and rewrites a textfile of
+its own process, e.g. monster-mydeployment-1234.prom, for the node
+exporter's textfile collector, at most every FLUSH_INTERVAL seconds and at
+exit. Its metrics carry a deployment label, and the collector sums over
+the files, so concurrent builds do not overwrite each other's totals; the
+files of exited processes are removed after STALE_AGE seconds. The statsd
+backend sends each update as a UDP packet.
+While metrics are disabled an update costs a function call.
+"""
+import atexit
+import errno
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+import monster.active as active
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the prometheus histogram buckets
+BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 1800)
+
+# least number of seconds between rewrites of the prometheus textfile
+FLUSH_INTERVAL = 10
+
+# seconds the textfile of an exited process is kept, so that its final
+# totals are scraped before it is removed
+STALE_AGE = 3600
+
+_backend = None
+_backend_config = None
+_backend_lock = threading.Lock()
+
+
+def increment(name, value=1, **labels):
+    """Adds to a counter.
+    :param name: name of the counter, e.g. "ssh_connect_failures"
+    :type name: str
+    :type value: int
+    :param labels: dimensions of the counter; keep their values few
+    """
+    backend().increment(name, value, labels)
+
+
+def observe(name, value, **labels):
+    """Records a value, e.g. a duration in seconds, in a histogram.
+    :param name: name of the histogram, e.g. "check_port_wait_seconds"
+    :type name: str
+    :type value: float
+    :param labels: dimensions of the histogram; keep their values few
+    """
+    backend().observe(name, value, labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Records the seconds the enclosed block takes in a histogram, whether
+    or not it raises.
+    :type name: str
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        observe(name, time.time() - start, **labels)
+
+
+def backend():
+    """Returns the backend for the active config, replacing the previous
+    one if the config has since been loaded or changed.
+    """
+    global _backend, _backend_config
+    config = (active.config or {}).get('metrics')
+    deployment = (active.build_args or {}).get('name')
+    if _backend is not None and (config, deployment) == _backend_config:
+        return _backend
+    with _backend_lock:
+        if _backend is None or (config, deployment) != _backend_config:
+            if _backend is not None:
+                _backend.flush()
+            _backend = _create_backend(config or {}, deployment)
+            _backend_config = (config, deployment)
+        return _backend
+
+
+def flush():
+    """Writes out any metrics the backend has not yet exported."""
+    if _backend is not None:
+        _backend.flush()
+
+
+atexit.register(flush)
+
+
+def _create_backend(config, deployment=None):
+    kind = config.get('backend')
+    prefix = config.get('prefix') or "monster"
+    if kind == 'prometheus':
+        return PrometheusTextfile(config['textfile_dir'], prefix, deployment)
+    if kind == 'statsd':
+        return Statsd(config.get('statsd_host') or "localhost",
+                      int(config.get('statsd_port') or 8125), prefix)
+    return NullBackend()
+
+
+class NullBackend(object):
+    """Discards every metric."""
+    def increment(self, name, value, labels):
+        pass
+
+    def observe(self, name, value, labels):
+        pass
+
+    def flush(self):
+        pass
+
+
+class PrometheusTextfile(NullBackend):
+    """Totals metrics in memory and writes them in the prometheus text
+    format, to a file of this process in a textfile collector directory."""
+    def __init__(self, directory, prefix, deployment=None):
+        """
+        :param directory: directory the node exporter collects from
+        :type directory: str
+        :param prefix: prefix of the metric and file names
+        :type prefix: str
+        :param deployment: name of the deployment being worked on, added to
+        every metric as a label
+        :type deployment: str
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.deployment = deployment
+        self.path = os.path.join(directory, "{0}-{1}{2}.prom".format(
+            prefix, _sanitize(deployment) + "-" if deployment else "",
+            os.getpid()))
+        self._counters = defaultdict(int)
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._flushed = time.time()
+        self._remove_stale()
+
+    def increment(self, name, value, labels):
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+        self._maybe_flush()
+
+    def observe(self, name, value, labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(BUCKETS), 0, 0]
+            for index, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+        self._maybe_flush()
+
+    def flush(self):
+        text = self.render()
+        try:
+            handle, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(handle, 'w') as f:
+                f.write(text)
+            os.chmod(temp, 0644)
+            os.rename(temp, self.path)
+        except (IOError, OSError) as e:
+            logger.warning("Unable to write metrics to {0}: {1}"
+                           .format(self.path, e))
+
+    def render(self):
+        """Returns the metrics in the prometheus text format.
+        :rtype: str
+        """
+        with self._lock:
+            self._flushed = time.time()
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(buckets), total, count))
+                                for key, (buckets, total, count)
+                                in self._histograms.items())
+        if self.deployment:
+            deployment = (('deployment', self.deployment),)
+            counters = [((name, deployment + labels), value)
+                        for (name, labels), value in counters]
+            histograms = [((name, deployment + labels), histogram)
+                          for (name, labels), histogram in histograms]
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = "{0}_{1}_total".format(self.prefix, name)
+            if metric not in typed:
+                typed.add(metric)
+                lines.append("# TYPE {0} counter".format(metric))
+            lines.append("{0}{1} {2}".format(metric, _format(labels), value))
+        for (name, labels), (buckets, total, count) in histograms:
+            metric = "{0}_{1}".format(self.prefix, name)
+            if metric not in typed:
+                typed.add(metric)
+                lines.append("# TYPE {0} histogram".format(metric))
+            for bound, cumulative in zip(BUCKETS, buckets):
+                lines.append("{0}_bucket{1} {2}".format(
+                    metric, _format(labels + (('le', repr(float(bound))),)),
+                    cumulative))
+            lines.append("{0}_bucket{1} {2}".format(
+                metric, _format(labels + (('le', "+Inf"),)), count))
+            lines.append("{0}_sum{1} {2!r}".format(metric, _format(labels),
+                                                  total))
+            lines.append("{0}_count{1} {2}".format(metric, _format(labels),
+                                                  count))
+        return "\n".join(lines) + "\n"
+
+    def _maybe_flush(self):
+        if time.time() - self._flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def _remove_stale(self):
+        """Removes the textfiles of processes that exited over STALE_AGE
+        seconds ago."""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        cutoff = time.time() - STALE_AGE
+        for name in names:
+            if not (name.startswith(self.prefix + "-") and
+                    name.endswith(".prom")):
+                continue
+            pid = name[:-len(".prom")].rsplit("-", 1)[-1]
+            path = os.path.join(self.directory, name)
+            try:
+                if (pid.isdigit() and not _running(int(pid)) and
+                        os.path.getmtime(path) < cutoff):
+                    os.remove(path)
+            except OSError as e:
+                logger.debug("Unable to remove {0}: {1}".format(path, e))
+
+
+class Statsd(NullBackend):
+    """Sends each metric to a statsd daemon over UDP, ignoring failures;
+    histograms are sent as timers in milliseconds."""
+    def __init__(self, host, port, prefix):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def increment(self, name, value, labels):
+        self._send(name, labels, "{0}|c".format(value))
+
+    def observe(self, name, value, labels):
+        self._send(name, labels, "{0:.3f}|ms".format(value * 1000))
+
+    def _send(self, name, labels, value):
+        metric = ".".join([self.prefix, name] +
+                          [_sanitize(label) for _, label
+                           in _label_key(labels)])
+        try:
+            self._socket.sendto("{0}:{1}".format(metric, value),
+                                self.address)
+        except socket.error:
+            pass
+
+
+def _running(pid):
+    """Returns whether a process exists.
+    :type pid: int
+    :rtype: bool
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{0}="{1}"'.format(
+        key, value.replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels) + "}"
+
+
+def _sanitize(value):
+    return "".join(char if char.isalnum() or char in "-_" else "_"
+                   for char in value)
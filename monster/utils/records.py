@@ -0,0 +1,254 @@
+"""Converts deployments to and from versioned JSON records.
+
+A deployment is stored as three records: the deployment's own attributes,
+one record per node (holding the node's features) and the list of
+deployment features. References between these objects, such as a
+feature's proxy to its deployment, are stored as markers and restored
+when the deployment is loaded; values that have no JSON form are pickled.
+"""
+import base64
+import importlib
+import json
+import logging
+import new
+import types
+import weakref
+
+from lazy import lazy
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+
+
+def deployment_record(deployment):
+    """Returns the record of a deployment's own attributes.
+    :type deployment: monster.deployments.base.Deployment
+    :rtype: str
+    """
+    refs = _References(deployment)
+    state = _encode_state(deployment, refs,
+                          exclude=('nodes', 'features', 'environment'))
+    if deployment.environment is not None:
+        state['environment'] = _encode_object(deployment.environment, refs)
+    return _dumps({'schema': SCHEMA_VERSION,
+                   'class': _class_path(deployment),
+                   'state': state,
+                   'nodes': deployment.node_names})
+
+
+def node_record(deployment, node):
+    """Returns the record of a node and its features.
+    :type deployment: monster.deployments.base.Deployment
+    :type node: monster.nodes.base.Node
+    :rtype: str
+    """
+    refs = _References(deployment)
+    return _dumps({'schema': SCHEMA_VERSION,
+                   'class': _class_path(node),
+                   'state': _encode_state(node, refs, exclude=('features',)),
+                   'features': [_encode_object(feature, refs)
+                                for feature in node.features]})
+
+
+def features_record(deployment):
+    """Returns the record of a deployment's features.
+    :type deployment: monster.deployments.base.Deployment
+    :rtype: str
+    """
+    refs = _References(deployment)
+    return _dumps({'schema': SCHEMA_VERSION,
+                   'features': [_encode_object(feature, refs)
+                                for feature in deployment.features]})
+
+
+def loads(record):
+    """Parses a record, checking that its schema can be read.
+    :type record: str
+    :rtype: dict
+    """
+    record = _to_str(json.loads(record))
+    if record.get('schema') != SCHEMA_VERSION:
+        raise Exception("Unsupported record schema: {0}"
+                        .format(record.get('schema')))
+    return record
+
+
+def load_deployment(deployment, nodes, features):
+    """Rebuilds a deployment from its records.
+    :param deployment: deployment record
+    :type deployment: str
+    :param nodes: node records keyed by node name
+    :type nodes: dict
+    :param features: deployment features record
+    :type features: str
+    :rtype: monster.deployments.base.Deployment
+    """
+    deployment = loads(deployment)
+    features = loads(features)
+    nodes = [loads(nodes[name]) for name in deployment['nodes']]
+
+    # create every node before setting attributes that may refer to them
+    refs = _References(_new(deployment['class']))
+    for name, node in zip(deployment['nodes'], nodes):
+        refs.nodes[name] = _new(node['class'])
+
+    _set_state(refs.deployment, _decode(deployment['state'], refs))
+    refs.environment = getattr(refs.deployment, 'environment', None)
+    refs.deployment.nodes = []
+    for name, node in zip(deployment['nodes'], nodes):
+        obj = refs.nodes[name]
+        _set_state(obj, _decode(node['state'], refs))
+        obj.features = [_decode(feature, refs)
+                        for feature in node['features']]
+        refs.deployment.nodes.append(obj)
+    refs.deployment.features = [_decode(feature, refs)
+                                for feature in features['features']]
+    return refs.deployment
+
+
+class _References(object):
+    """Objects that are stored as references rather than by value."""
+    def __init__(self, deployment):
+        self.deployment = deployment
+        self.environment = getattr(deployment, 'environment', None)
+        self.nodes = {node.name: node
+                      for node in getattr(deployment, 'nodes', [])}
+
+    def find(self, value):
+        """Returns the reference marker for a value, if it is a reference.
+        A proxy's referent cannot be reached directly, but the proxy hands
+        out the referent's own __dict__, which identifies it.
+        """
+        is_proxy = isinstance(value, weakref.ProxyTypes)
+
+        def same(obj):
+            if obj is None:
+                return False
+            if is_proxy:
+                return value.__dict__ is obj.__dict__
+            return value is obj
+
+        if same(self.deployment):
+            ref = ['deployment']
+        elif same(self.environment):
+            ref = ['environment']
+        else:
+            ref = next((['node', name] for name, node in self.nodes.items()
+                        if same(node)), None)
+        if ref is None:
+            return None
+        return {'$ref': ref, 'proxy': is_proxy}
+
+    def resolve(self, marker):
+        ref = marker['$ref']
+        if ref[0] == 'deployment':
+            obj = self.deployment
+        elif ref[0] == 'environment':
+            obj = self.environment
+        else:
+            obj = self.nodes[ref[1]]
+        return weakref.proxy(obj) if marker.get('proxy') else obj
+
+
+def _encode(value, refs):
+    if value is None or isinstance(value, (bool, int, long, float,
+                                           basestring)):
+        return value
+    if isinstance(value, weakref.ProxyTypes) or hasattr(value, '__dict__'):
+        ref = refs.find(value)
+        if ref:
+            return ref
+    if isinstance(value, (list, tuple)):
+        return [_encode(item, refs) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return {'$set': [_encode(item, refs) for item in value]}
+    if type(value) is dict:
+        if all(isinstance(key, basestring) and not key.startswith('$')
+               for key in value):
+            return {key: _encode(item, refs) for key, item in value.items()}
+        return {'$dict': [[_encode(key, refs), _encode(item, refs)]
+                          for key, item in value.items()]}
+    if hasattr(value, '__dict__') and not isinstance(
+            value, (types.FunctionType, types.MethodType, types.ModuleType,
+                    type, types.ClassType)):
+        return _encode_object(value, refs)
+    import dill as pickle
+    logger.debug("Pickling {0!r} for storage".format(value))
+    return {'$pickle': base64.b64encode(pickle.dumps(value))}
+
+
+def _encode_object(obj, refs):
+    return {'$object': _class_path(obj),
+            'state': _encode_state(obj, refs)}
+
+
+def _encode_state(obj, refs, exclude=()):
+    state = (obj.__getstate__() if hasattr(obj, '__getstate__')
+             else obj.__dict__)
+    cls = obj.__class__
+    return {attr: _encode(value, refs) for attr, value in state.items()
+            if attr not in exclude and
+            not isinstance(getattr(cls, attr, None), lazy)}
+
+
+def _decode(value, refs):
+    if isinstance(value, list):
+        return [_decode(item, refs) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if '$ref' in value:
+        return refs.resolve(value)
+    if '$set' in value:
+        return set(_decode(value['$set'], refs))
+    if '$dict' in value:
+        return {_decode(key, refs): _decode(item, refs)
+                for key, item in value['$dict']}
+    if '$pickle' in value:
+        import dill as pickle
+        return pickle.loads(base64.b64decode(value['$pickle']))
+    if '$object' in value:
+        obj = _new(value['$object'])
+        _set_state(obj, _decode(value['state'], refs))
+        return obj
+    return {key: _decode(item, refs) for key, item in value.items()}
+
+
+def _new(class_path):
+    """Creates an instance of a class without initializing it."""
+    module_name, _, class_name = class_path.rpartition('.')
+    cls = getattr(importlib.import_module(module_name), class_name)
+    if isinstance(cls, types.ClassType):
+        return new.instance(cls)
+    return cls.__new__(cls)
+
+
+def _set_state(obj, state):
+    if hasattr(obj, '__setstate__'):
+        obj.__setstate__(state)
+    else:
+        obj.__dict__.update(state)
+
+
+def _class_path(obj):
+    return "{0}.{1}".format(obj.__class__.__module__,
+                            obj.__class__.__name__)
+
+
+def _dumps(record):
+    return json.dumps(record, sort_keys=True)
+
+
+def _to_str(value):
+    """Converts the unicode json returns back to str where possible."""
+    if isinstance(value, unicode):
+        try:
+            return str(value)
+        except UnicodeEncodeError:
+            return value
+    if isinstance(value, list):
+        return [_to_str(item) for item in value]
+    if isinstance(value, dict):
+        return {_to_str(key): _to_str(item) for key, item in value.items()}
+    return value
+
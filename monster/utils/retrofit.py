@@ -25,12 +25,7 @@ class Retrofit(object):
         self._check_os()
         self._check_neutron()
         self._check_brctl()
-
-        for controller in self.deployment.controllers:
-            self._install_repo(controller, branch)
-
-        for compute in self.deployment.computes:
-            self._install_repo(compute, branch)
+        self._install_repo(branch)
 
     def bootstrap(self, iface, lx_bridge, ovs_bridge):
         """Bootstraps a node with retrofit."""
@@ -42,11 +37,8 @@ class Retrofit(object):
                               "".format(iface, lx_bridge, ovs_bridge)]
         bootstrap_command = "; ".join(bootstrap_commands)
 
-        for controller in self.deployment.controllers:
-            controller.run_cmd(bootstrap_command)
-
-        for compute in self.deployment.computes:
-            compute.run_cmd(bootstrap_command)
+        self.deployment.run_on(self.deployment.controllers_and_computes,
+                               bootstrap_command)
 
     def convert(self, iface, lx_bridge, ovs_bridge):
         """Converts a deployment to a separate plane."""
@@ -57,11 +49,8 @@ class Retrofit(object):
                             "".format(iface, lx_bridge, ovs_bridge)]
         convert_command = "; ".join(convert_commands)
 
-        for controller in self.deployment.controllers:
-            controller.run_cmd(convert_command)
-
-        for compute in self.deployment.computes:
-            compute.run_cmd(convert_command)
+        self.deployment.run_on(self.deployment.controllers_and_computes,
+                               convert_command)
 
     def revert(self, iface, lx_bridge, ovs_bridge):
         """Reverts a deployment to a single plane."""
@@ -72,11 +61,8 @@ class Retrofit(object):
                            "".format(iface, lx_bridge, ovs_bridge)]
         revert_command = "; ".join(revert_commands)
 
-        for controller in self.deployment.controllers:
-            controller.run_cmd(revert_command)
-
-        for compute in self.deployment.computes:
-            compute.run_cmd(revert_command)
+        self.deployment.run_on(self.deployment.controllers_and_computes,
+                               revert_command)
 
     def remove_port_from_bridge(self, ovs_bridge, del_port):
         """Removes a port from a bridge for the deployment."""
@@ -88,13 +74,10 @@ class Retrofit(object):
 
         remove_cmd = "ovs-vsctl del-port {0} {1}".format(ovs_bridge, del_port)
 
-        for controller in self.deployment.controllers:
-            controller.run_cmd(remove_cmd)
-
-        for compute in self.deployment.computes:
-            compute.run_cmd(remove_cmd)
+        self.deployment.run_on(self.deployment.controllers_and_computes,
+                               remove_cmd)
 
-    def _install_repo(self, node, branch='master'):
+    def _install_repo(self, branch='master'):
         """Installs the retrofit repository."""
         retro_git = active.config['rcbops']['retrofit']['git']['url']
         branches = active.config['rcbops']['retrofit']['git']['branches']
@@ -110,7 +93,8 @@ class Retrofit(object):
                           "".format(branch, retro_git)]
 
         clone_command = "; ".join(clone_commands)
-        node.run_cmd(clone_command)
+        self.deployment.run_on(self.deployment.controllers_and_computes,
+                               clone_command)
 
     def _check_neutron(self):
         """Check to make sure neutron is in the deployment."""
@@ -130,13 +114,9 @@ class Retrofit(object):
             raise NotImplementedError(error)
 
     def _check_brctl(self):
-        """Checks to see if bridge-util is installed on nodes."""
-        for controller in self.deployment.controllers:
-            installed = controller.check_package('bridge-utils')['success']
-            if not installed:
-                controller.install_package('bridge-utils')
-
-        for compute in self.deployment.computes:
-            installed = compute.check_package('bridge-utils')['success']
-            if not installed:
-                compute.install_package('bridge-utils')
+        """Installs bridge-utils on nodes that do not have it."""
+        self.deployment.run_on(
+            self.deployment.controllers_and_computes,
+            lambda node: "{0} || {1}".format(
+                node.os.check_package_cmd('bridge-utils'),
+                node.os.install_package_cmd('bridge-utils')))
@@ -0,0 +1,146 @@
+"""Runs build steps concurrently, each as soon as the steps it depends on
+have completed."""
+import logging
+import time
+
+from collections import OrderedDict
+from futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+class Task(object):
+    """A named step of work and the names of the steps it waits on."""
+    def __init__(self, name, func, requires=None):
+        self.name = name
+        self.func = func
+        self.requires = set(requires or [])
+        self.start = None
+        self.end = None
+
+    def __repr__(self):
+        return self.name
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+
+class Scheduler(object):
+    """Dependency graph of tasks run on a thread pool."""
+    def __init__(self, max_workers=None):
+        """
+        :param max_workers: number of tasks to run at once; defaults to the
+        number of tasks
+        :type max_workers: int
+        """
+        self.tasks = OrderedDict()
+        self.max_workers = max_workers
+
+    def add(self, name, func, requires=None):
+        """Adds a task.
+        :param name: unique name of the task
+        :type name: str
+        :param func: callable that does the task's work
+        :type func: function
+        :param requires: names of tasks that must complete first
+        :type requires: iterable (str)
+        :rtype: Task
+        """
+        if name in self.tasks:
+            raise KeyError("Task {0} already scheduled".format(name))
+        task = Task(name, func, requires)
+        self.tasks[name] = task
+        return task
+
+    def run(self, completed=None, on_complete=None):
+        """Runs every task once its requirements have completed. When a task
+        fails no further tasks are started; the tasks already running are
+        allowed to finish and the failure is then re-raised.
+        :param completed: names of tasks that completed in an earlier run
+        and are skipped
+        :type completed: iterable (str)
+        :param on_complete: called with each task as it completes
+        :type on_complete: function
+        """
+        for task in self.tasks.values():
+            unknown = task.requires - set(self.tasks)
+            if unknown:
+                raise KeyError("Task {0} requires unknown tasks: {1}"
+                               .format(task, ", ".join(sorted(unknown))))
+
+        completed = set(completed or []) & set(self.tasks)
+        if completed:
+            logger.info("Skipping {0} completed tasks".format(len(completed)))
+        pending = OrderedDict((name, task) for name, task
+                              in self.tasks.items() if name not in completed)
+        running = {}
+        failure = None
+        max_workers = self.max_workers or len(pending) or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                for task in [task for task in pending.values()
+                             if task.requires <= completed]:
+                    del pending[task.name]
+                    running[executor.submit(self._run, task)] = task
+                if not running:
+                    raise Exception("Unsatisfiable task dependencies: {0}"
+                                    .format(", ".join(pending)))
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    if future.exception():
+                        logger.error("Task {0} failed: {1}"
+                                     .format(task, future.exception()))
+                        failure = failure or future
+                        pending.clear()
+                    else:
+                        completed.add(task.name)
+                        if on_complete:
+                            on_complete(task)
+        if failure:
+            failure.result()
+
+    def critical_path(self):
+        """Returns the chain of completed tasks that determined the total
+        run time: the last task to finish, the requirement that finished
+        last before it, and so on back to the start.
+        :rtype: list (Task)
+        """
+        finished = [task for task in self.tasks.values()
+                    if task.end is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda task: task.end)]
+        while True:
+            requirements = [self.tasks[name] for name in path[-1].requires
+                            if self.tasks[name].end is not None]
+            if not requirements:
+                break
+            path.append(max(requirements, key=lambda task: task.end))
+        return list(reversed(path))
+
+    def critical_path_report(self):
+        """Returns the critical path as printable text.
+        :rtype: str
+        """
+        path = self.critical_path()
+        if not path:
+            return "No tasks completed."
+        total = path[-1].end - path[0].start
+        lines = ["{0:<60} {1:>9.1f}s".format(task.name, task.duration)
+                 for task in path]
+        lines.append("{0:<60} {1:>9.1f}s".format("total", total))
+        return "\n".join(lines)
+
+    def _run(self, task):
+        logger.debug("Starting task: {0}".format(task))
+        task.start = time.time()
+        try:
+            return task.func()
+        finally:
+            task.end = time.time()
+            logger.debug("Finished task: {0} ({1:.1f}s)"
+                         .format(task, task.duration))
@@ -1,5 +1,5 @@
 from monster import db_iface as database, active
-from monster.provisioners.rackspace import provisioner as rackspace
+from monster.provisioners.util import get_provisioner
 from monster.utils.access import check_port
 import logging
 
@@ -16,7 +16,7 @@ def check_monster_status():
         logger.info("Database is up!")
 
     try:
-        rackspace.Provisioner()
+        get_provisioner('rackspace').authenticate()
     except Exception:
         logger.warning("Rackspace credentials did not authenticate.")
         raise
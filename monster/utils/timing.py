@@ -0,0 +1,192 @@
+"""Records how long the phases of a build take.
+
+Code wraps its phases in span(); each completed span is kept, up to
+MAX_SPANS of them, for the life of the process so that the provisioning
+done before a deployment is built is profiled along with the build itself.
+Deployment.build stores the spans with the deployment, and report()
+renders them.
+"""
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# most spans kept in a process; later ones are dropped
+MAX_SPANS = 100000
+
+# length in characters of a node's bar in the timeline
+TIMELINE_WIDTH = 40
+
+_spans = []
+_lock = threading.Lock()
+
+
+class Span(object):
+    """A timed phase of work."""
+    def __init__(self, name, kind, node=None):
+        """
+        :param name: what the work is, e.g. a command or build step
+        :type name: str
+        :param kind: category of the work, e.g. "ssh" or "step"
+        :type kind: str
+        :param node: name of the node the work is for, if any
+        :type node: str
+        """
+        self.name = name
+        self.kind = kind
+        self.node = node
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        self.end = None
+
+    def __repr__(self):
+        return "<Span {0} {1}>".format(self.kind, self.name)
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self):
+        return {'name': self.name, 'kind': self.kind, 'node': self.node,
+                'thread': self.thread, 'start': self.start,
+                'end': self.end}
+
+
+@contextmanager
+def span(name, kind, node=None):
+    """Times the enclosed block; the span is yielded so that details only
+    known inside the block, such as a new node's name, can be filled in.
+    :type name: str
+    :type kind: str
+    :type node: str
+    :rtype: Span
+    """
+    current = Span(name, kind, node)
+    try:
+        yield current
+    finally:
+        current.end = time.time()
+        with _lock:
+            if len(_spans) < MAX_SPANS:
+                _spans.append(current)
+
+
+def spans():
+    """Returns the spans completed so far in this process.
+    :rtype: list (dict)
+    """
+    with _lock:
+        return [recorded.to_dict() for recorded in _spans]
+
+
+def reset():
+    """Forgets the spans recorded so far."""
+    with _lock:
+        del _spans[:]
+
+
+def report(profile):
+    """Renders a stored profile as text: a timeline of each node's build,
+    the deployment's phases, the build's critical path, the slowest
+    commands and the time nodes spent running commands versus waiting.
+    :param profile: spans and critical path as stored with a deployment
+    :type profile: dict
+    :rtype: str
+    """
+    recorded = [item for item in profile.get('spans', []) if item['end']]
+    if not recorded:
+        return "No timings recorded."
+    begin = min(item['start'] for item in recorded)
+    finish = max(item['end'] for item in recorded)
+    total = max(finish - begin, 0.001)
+
+    sections = [_timeline(recorded, begin, total),
+                _phases(recorded, begin),
+                _critical_path(profile.get('critical_path', [])),
+                _slowest(recorded),
+                _utilization(recorded, total)]
+    return "\n\n".join(section for section in sections if section)
+
+
+def _timeline(recorded, begin, total):
+    steps = [item for item in recorded
+             if item['node'] and item['kind'] in ('provision', 'step')]
+    lines = ["Timeline ({0:.1f}s)".format(total)]
+    line = "{0:<30} {1:>8} {2:>8}  {3}"
+    lines.append(line.format("node", "start", "end", "").rstrip())
+    for node in sorted(set(item['node'] for item in steps)):
+        items = [item for item in steps if item['node'] == node]
+        start = min(item['start'] for item in items) - begin
+        end = max(item['end'] for item in items) - begin
+        left = int(start / total * TIMELINE_WIDTH)
+        width = max(1, int(round((end - start) / total * TIMELINE_WIDTH)))
+        lines.append(line.format(node, "{0:.1f}s".format(start),
+                                 "{0:.1f}s".format(end),
+                                 " " * left + "#" * width))
+    return "\n".join(lines)
+
+
+def _phases(recorded, begin):
+    phases = sorted((item for item in recorded
+                     if item['kind'] in ('deployment', 'feature')),
+                    key=lambda item: item['start'])
+    if not phases:
+        return ""
+    lines = ["Deployment phases"]
+    lines.extend("{0:>8.1f}s {1:<51} {2:>9.1f}s".format(
+        item['start'] - begin, item['name'], item['end'] - item['start'])
+        for item in phases)
+    return "\n".join(lines)
+
+
+def _critical_path(path):
+    if not path:
+        return ""
+    lines = ["Critical path"]
+    lines.extend("{0:<60} {1:>9.1f}s".format(task['name'], task['duration'])
+                 for task in path)
+    return "\n".join(lines)
+
+
+def _slowest(recorded, count=10):
+    commands = sorted((item for item in recorded if item['kind'] == 'ssh'),
+                      key=lambda item: item['end'] - item['start'],
+                      reverse=True)[:count]
+    if not commands:
+        return ""
+    lines = ["Slowest commands"]
+    lines.extend("{0:>9.1f}s {1:<24} {2}".format(
+        item['end'] - item['start'], item['node'] or "",
+        item['name'][:80]) for item in commands)
+    return "\n".join(lines)
+
+
+def _utilization(recorded, total):
+    nodes = sorted(set(item['node'] for item in recorded if item['node']))
+    if not nodes:
+        return ""
+    line = "{0:<30} {1:>10} {2:>10}"
+    lines = ["Time running commands", line.format("node", "ssh", "idle")]
+    for node in nodes:
+        busy = _covered([(item['start'], item['end']) for item in recorded
+                         if item['node'] == node and item['kind'] == 'ssh'])
+        lines.append(line.format(node, "{0:.1f}s".format(busy),
+                                 "{0:.1f}s".format(max(total - busy, 0))))
+    return "\n".join(lines)
+
+
+def _covered(intervals):
+    """Returns the seconds covered by possibly overlapping intervals."""
+    covered = 0
+    end = None
+    for start, stop in sorted(intervals):
+        if end is None or start > end:
+            covered += stop - start
+            end = stop
+        elif stop > end:
+            covered += stop - end
+            end = stop
+    return covered
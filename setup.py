@@ -12,8 +12,13 @@ setuptools.setup(
     package_data={
         '': ['*.yaml']
     },
+    extras_require={
+        # the fake infrastructure monster-bench builds against
+        'bench': ['fakeredis']
+    },
     entry_points={
         "console_scripts": [
-            "monster = monster.executable:run"
+            "monster = monster.executable:run",
+            "monster-bench = monster.bench.runner:run"
         ]}
 )
@@ -0,0 +1,27 @@
+"""Runs a small build against the fake infrastructure of monster.bench, in
+a fresh interpreter as the harness replaces process-wide state such as the
+redis connection pool.
+"""
+import json
+import subprocess
+import sys
+
+BENCH_SCRIPT = """
+import json
+from monster.bench.harness import Harness
+with Harness() as harness:
+    deployment = harness.build('bench-test', nodes=4,
+                               template='ubuntu-default', branch='master')
+    print(json.dumps({'status': deployment.status,
+                      'nodes': deployment.node_names,
+                      'counts': harness.counts()}))
+"""
+
+
+def test_bench_build():
+    output = subprocess.check_output([sys.executable, '-c', BENCH_SCRIPT])
+    result = json.loads(output.splitlines()[-1])
+    assert result['status'] == "post-build"
+    assert len(result['nodes']) == 4
+    for label, count in result['counts'].items():
+        assert count > 0, "no {0}".format(label)
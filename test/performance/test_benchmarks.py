@@ -0,0 +1,182 @@
+"""Micro-benchmarks of monster's hot paths, run with pytest-benchmark
+against the fake infrastructure of monster.bench.
+
+Baselines are recorded on, and compared on, the same machine, e.g. a build
+farm node. To record one:
+
+    py.test test/performance/test_benchmarks.py \
+        --benchmark-storage=test/performance/baselines \
+        --benchmark-save=baseline
+
+and to fail on regressions against the latest one:
+
+    py.test test/performance/test_benchmarks.py \
+        --benchmark-storage=test/performance/baselines \
+        --benchmark-compare --benchmark-compare-fail=min:25%
+
+Without pytest-benchmark installed the benchmarks are skipped.
+"""
+import os
+import shutil
+from glob import glob
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+import monster.active as active
+import monster.threading_iface as threading
+import monster.utils.naming as naming
+from monster.bench.harness import Harness
+from monster.tests.util import xunit_merge
+from monster.utils.access import ssh_cmd, DEFAULT_TAIL_LINES
+
+# nodes in the deployments stored and fetched by the database benchmarks
+DEPLOYMENT_NODES = 10
+
+# deployments in the index listed by the list_deployments benchmark
+STORED_DEPLOYMENTS = 200
+
+# nodes named by the name_node benchmark, all with the same role
+NAMED_NODES = 2000
+
+TEMPLATE_FILES = sorted(os.path.basename(path) for path in glob(
+    os.path.join(os.path.dirname(active.__file__), 'data', 'templates',
+                 '*.yaml')))
+
+XUNIT_FILES = 50
+XUNIT_CASES = 200
+
+XUNIT_CASE = ('<testcase classname="tempest.api.compute.test_servers" '
+              'name="test_{0}" time="0.5"/>')
+
+
+@pytest.fixture(scope='module')
+def harness():
+    """Fake infrastructure with a built deployment, whose database is a
+    fake redis."""
+    with Harness() as harness:
+        harness.deployment = harness.build('bench', nodes=DEPLOYMENT_NODES)
+        yield harness
+
+
+@pytest.fixture(scope='module')
+def database(harness):
+    import monster.db_iface as database
+    return database
+
+
+@pytest.fixture
+def node(harness):
+    return harness.deployment.nodes[0]
+
+
+def test_ssh_cmd(benchmark, node):
+    result = benchmark(ssh_cmd, node.ipaddress, "true",
+                       password=node.password)
+    assert result['success']
+
+
+def test_ssh_cmd_large_output(benchmark, harness, node):
+    """Output longer than the kept tail, as from a chef-client run."""
+    harness.ssh_server.script(r"^cat /var/log/syslog$", "".join(
+        "Jan  1 00:00:00 node kernel: line {0}\n".format(line)
+        for line in range(20000)))
+    result = benchmark(ssh_cmd, node.ipaddress, "cat /var/log/syslog",
+                       password=node.password)
+    assert result['truncated']
+    assert result['return'].count("\n") == DEFAULT_TAIL_LINES
+
+
+def test_store(benchmark, harness, database):
+    benchmark(database.store, harness.deployment)
+
+
+def test_fetch_deployment(benchmark, harness, database):
+    database.store(harness.deployment)
+    deployment = benchmark(database.fetch_deployment, 'bench')
+    assert len(deployment.nodes) == DEPLOYMENT_NODES
+
+
+def test_list_deployments(benchmark, harness, database):
+    deployment = harness.deployment
+    try:
+        for index in range(STORED_DEPLOYMENTS):
+            deployment.name = "bench-{0}".format(index)
+            database.store(deployment)
+    finally:
+        deployment.name = 'bench'
+    deployments = benchmark(database.list_deployments)
+    assert len(deployments) > STORED_DEPLOYMENTS
+
+
+def test_load_config(benchmark, harness, database):
+    import monster.data.data as data
+    config, template, build_args = (active.config, active.template,
+                                    active.build_args)
+    secret = os.path.join(harness.directory, "secret.yaml")
+    database.db.hmset('bench', {'config': harness.config_name,
+                                'secret': secret, 'branch': "v4.2.1",
+                                'template': "ubuntu-ha-neutron"})
+    try:
+        benchmark(data.load_config, 'bench')
+        assert active.template['name'] == "ha"
+    finally:
+        active.config, active.template, active.build_args = (
+            config, template, build_args)
+
+
+@pytest.mark.parametrize('template_file', TEMPLATE_FILES)
+def test_parse_template(benchmark, monkeypatch, tmpdir, template_file):
+    import monster.data.data as data
+    cache_dir = str(tmpdir.join('cache'))
+    monkeypatch.setattr(data, 'CACHE_DIR', cache_dir)
+    path = os.path.join(os.path.dirname(data.__file__), 'templates',
+                        template_file)
+
+    def clear_cache():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    templates = benchmark.pedantic(data.parse_yaml, args=(path,),
+                                   setup=clear_cache, rounds=10)
+    assert templates
+
+
+def test_name_node(benchmark):
+    class Deployment(object):
+        name = 'bench'
+    deployment = Deployment()
+
+    def name_nodes():
+        active.node_names = set()
+        for _ in range(NAMED_NODES):
+            naming.name_node('compute', deployment)
+
+    benchmark.pedantic(name_nodes, rounds=3)
+    assert len(active.node_names) == NAMED_NODES
+
+
+def test_xunit_merge(benchmark, monkeypatch, tmpdir):
+    monkeypatch.chdir(tmpdir)
+    results = tmpdir.mkdir('results')
+    cases = "".join(XUNIT_CASE.format(case) for case in range(XUNIT_CASES))
+
+    def write_results():
+        for index in range(XUNIT_FILES):
+            results.join("tempest-{0}.xml".format(index)).write(
+                '<testsuite name="tempest" tests="{0}" failures="0" '
+                'errors="0" skip="0">{1}</testsuite>'.format(XUNIT_CASES,
+                                                             cases))
+
+    benchmark.pedantic(xunit_merge, args=(str(results),),
+                       setup=write_results, rounds=5)
+    assert tmpdir.join('results.xunit').check()
+
+
+def test_execute(benchmark):
+    results = benchmark(threading.execute, [lambda: None] * 100)
+    assert len(results) == 100
+
+
+def test_execute_one(benchmark):
+    benchmark(threading.execute, [lambda: None])
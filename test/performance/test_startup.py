@@ -0,0 +1,54 @@
+"""Guards the start up time of the monster command against regressions.
+Python 2 has no -X importtime, so a fresh interpreter reports how long
+importing the CLI took and which modules it loaded. Wall-clock time varies
+too much on shared machines to be checked by default; set
+MONSTER_STARTUP_BUDGET to a number of seconds to check it as well.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# libraries only some subcommands need, which must not be imported just to
+# start the CLI
+HEAVY_MODULES = ['IPython', 'chef', 'cinderclient', 'dill', 'keystoneclient',
+                 'neutronclient', 'novaclient', 'paramiko', 'pyrabbit',
+                 'pyrax', 'tmuxp']
+
+# seconds importing the CLI may take, best of a few runs, if set
+STARTUP_BUDGET = os.environ.get('MONSTER_STARTUP_BUDGET')
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.time()
+import monster.executable
+print(json.dumps({'seconds': time.time() - start,
+                  'modules': sorted(sys.modules)}))
+"""
+
+
+def import_cli():
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT])
+    return json.loads(output.splitlines()[-1])
+
+
+@pytest.fixture(scope='module')
+def startup():
+    return import_cli()
+
+
+@pytest.mark.parametrize('module', HEAVY_MODULES)
+def test_startup_does_not_import(startup, module):
+    loaded = [name for name in startup['modules']
+              if name == module or name.startswith(module + '.')]
+    assert not loaded, "{0} is imported at start up".format(module)
+
+
+@pytest.mark.skipif(not STARTUP_BUDGET,
+                    reason="MONSTER_STARTUP_BUDGET is not set")
+def test_startup_time():
+    seconds = min(import_cli()['seconds'] for _ in range(3))
+    assert seconds < float(STARTUP_BUDGET), (
+        "Importing the CLI took {0:.2f}s".format(seconds))
@@ -0,0 +1,88 @@
+"""Tests the TTL cache used for chef API objects and nodes."""
+import threading
+import time
+
+import pytest
+
+from monster.utils.cache import TTLCache
+
+
+class Loader(object):
+    """Counts the loads of a value."""
+    def __init__(self, value=None, delay=0):
+        self.value = value
+        self.delay = delay
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.loads += 1
+        time.sleep(self.delay)
+        return self.value
+
+
+def test_get_loads_once():
+    cache = TTLCache()
+    loader = Loader('value')
+    assert cache.get('key', loader) == 'value'
+    assert cache.get('key', loader) == 'value'
+    assert loader.loads == 1
+
+
+def test_get_reloads_expired_value(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    cache = TTLCache(ttl=10)
+    loader = Loader('value')
+    cache.get('key', loader)
+    now[0] += 9
+    cache.get('key', loader)
+    assert loader.loads == 1
+    now[0] += 2
+    cache.get('key', loader)
+    assert loader.loads == 2
+
+
+def test_concurrent_gets_share_one_load():
+    cache = TTLCache()
+    loader = Loader('value', delay=0.1)
+    results = []
+    threads = [threading.Thread(
+        target=lambda: results.append(cache.get('key', loader)))
+        for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['value'] * 10
+    assert loader.loads == 1
+
+
+def test_failed_load_is_not_cached():
+    cache = TTLCache()
+
+    def fails():
+        raise ValueError("unavailable")
+
+    with pytest.raises(ValueError):
+        cache.get('key', fails)
+    assert cache.get('key', Loader('value')) == 'value'
+
+
+def test_set_replaces_value():
+    cache = TTLCache()
+    cache.get('key', Loader('old'))
+    cache.set('key', 'new')
+    assert cache.get('key', Loader('loaded')) == 'new'
+
+
+def test_invalidate():
+    cache = TTLCache()
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.invalidate('a')
+    assert cache.get('a', Loader('loaded')) == 'loaded'
+    assert cache.get('b', Loader('loaded')) == 2
+    cache.invalidate()
+    assert cache.get('b', Loader('loaded')) == 'loaded'
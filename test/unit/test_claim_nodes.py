@@ -0,0 +1,144 @@
+"""Tests claiming razor pool nodes with redis locks."""
+import threading
+
+import fakeredis
+import pytest
+
+import monster.nodes.util as node_util
+
+
+class FakeChef(object):
+    """Chef server holding the attributes of pool nodes."""
+    def __init__(self, names):
+        self.nodes = {name: {'chef_environment': "_default", 'in_use': 0}
+                      for name in names}
+        self.lock = threading.Lock()
+
+    def node(self, name, api=None):
+        return FakeNode(self, name)
+
+
+class FakeNode(object):
+    """Copy of a chef node as read from the fake chef server."""
+    def __init__(self, server, name):
+        self.server = server
+        self.name = name
+        self.api = None
+        with server.lock:
+            attributes = dict(server.nodes[name])
+        self.chef_environment = attributes.pop('chef_environment')
+        self.attributes = attributes
+
+    def __getitem__(self, item):
+        return self.attributes[item]
+
+    def __setitem__(self, item, value):
+        self.attributes[item] = value
+
+    def save(self):
+        with self.server.lock:
+            self.server.nodes[self.name] = dict(
+                self.attributes, chef_environment=self.chef_environment)
+
+
+class FakeDatabase(object):
+    def __init__(self):
+        self.connection = fakeredis.FakeStrictRedis(
+            server=fakeredis.FakeServer())
+
+    def get_connection(self):
+        return self.connection
+
+
+@pytest.fixture
+def chef_server(monkeypatch):
+    server = FakeChef(["pool{0}".format(index) for index in range(6)])
+    monkeypatch.setattr(node_util.chef, 'Node', server.node)
+    monkeypatch.setattr(node_util, 'node_search', lambda query, cached: [
+        server.node(name) for name in sorted(server.nodes)])
+    monkeypatch.setattr(node_util, 'invalidate_search', lambda query: None)
+    return server
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(node_util, 'database', database)
+    return database.connection
+
+
+def is_free(node):
+    return node['in_use'] == 0
+
+
+def claim(count, environment="env"):
+    return node_util.claim_nodes("name:pool*", count, environment, is_free)
+
+
+def test_claims_free_nodes(chef_server, database):
+    chef_server.nodes['pool0']['in_use'] = "compute"
+    claimed = claim(2)
+    assert [node.name for node in claimed] == ['pool1', 'pool2']
+    for name in ['pool1', 'pool2']:
+        assert chef_server.nodes[name]['chef_environment'] == "env"
+        assert chef_server.nodes[name]['in_use'] == "provisioning"
+        assert database.get(node_util._claim_key(name)) == "env"
+
+
+def test_skips_locked_nodes(chef_server, database):
+    database.set(node_util._claim_key('pool0'), "other")
+    claimed = claim(1)
+    assert [node.name for node in claimed] == ['pool1']
+
+
+def test_skips_nodes_claimed_since_search(chef_server, database,
+                                          monkeypatch):
+    stale = [chef_server.node(name) for name in sorted(chef_server.nodes)]
+    monkeypatch.setattr(node_util, 'node_search',
+                        lambda query, cached: stale)
+    chef_server.nodes['pool0']['in_use'] = "compute"
+    claimed = claim(1)
+    assert [node.name for node in claimed] == ['pool1']
+    assert database.get(node_util._claim_key('pool0')) is None
+
+
+def test_releases_claimed_nodes_when_too_few_are_free(chef_server,
+                                                      database):
+    for name in ['pool0', 'pool1', 'pool2', 'pool3']:
+        chef_server.nodes[name]['in_use'] = "compute"
+    with pytest.raises(Exception):
+        claim(3)
+    for name in ['pool4', 'pool5']:
+        assert chef_server.nodes[name]['in_use'] == 0
+        assert chef_server.nodes[name]['chef_environment'] == "_default"
+        assert database.get(node_util._claim_key(name)) is None
+
+
+def test_concurrent_claims_do_not_overlap(chef_server, database):
+    claimed = []
+    errors = []
+
+    def claim_two(environment):
+        try:
+            claimed.extend(node.name for node in claim(2, environment))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=claim_two, args=("env{0}".format(
+        index),)) for index in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert sorted(claimed) == sorted(chef_server.nodes)
+
+
+def test_released_claim_can_be_claimed_again(chef_server, database):
+    node = claim(1)[0]
+    node['in_use'] = 0
+    node.chef_environment = "_default"
+    node.save()
+    assert claim(1, "next")[0].name == 'pool1'
+    node_util.release_claim(node.name)
+    assert claim(1, "next")[0].name == node.name
@@ -0,0 +1,188 @@
+"""Tests the order of a deployment's build steps, as declared by its nodes'
+features, and resuming builds from their checkpoints."""
+import threading
+
+import pytest
+
+import monster.deployments.base as deployment_base
+from monster.nodes.base import Node
+
+
+class FakeDatabase(object):
+    """Records the deployments stored and checkpoints added in order."""
+    def __init__(self, checkpoints=None):
+        self.checkpoints = set(checkpoints or [])
+        self.events = []
+
+    def fetch_checkpoints(self, name):
+        return set(self.checkpoints)
+
+    def clear_checkpoints(self, name):
+        self.checkpoints.clear()
+
+    def add_checkpoint(self, name, step):
+        self.checkpoints.add(step)
+        self.events.append(('checkpoint', step))
+
+    def store(self, deployment):
+        self.events.append(('store', deployment.status))
+
+    def store_profile(self, name, profile):
+        pass
+
+
+class StepNode(Node):
+    """Node whose build steps only record that they ran."""
+    def __init__(self, name, deployment, features, failing_step=None,
+                 error=ValueError):
+        super(StepNode, self).__init__(name, "127.0.0.1", "root", "secret",
+                                       deployment)
+        self.add_features(features)
+        self.failing_step = failing_step
+        self.error = error
+
+    def _step(self, step):
+        self.deployment.record((self.name, step))
+        if step == self.failing_step:
+            raise self.error("{0} failed".format(step))
+
+    def prepare(self):
+        self._step('prepare')
+
+    def pre_configure(self):
+        self._step('pre_configure')
+
+    def apply_feature(self):
+        self._step('apply_feature')
+
+    def post_configure(self):
+        self._step('post_configure')
+
+
+class StepDeployment(deployment_base.Deployment):
+    """Deployment whose own build steps only record that they ran."""
+    def __init__(self, name):
+        self.name = name
+        self.status = "provisioning"
+        self.product = "compute"
+        self.provisioner_name = "fake"
+        self.nodes = []
+        self.features = []
+        self.order = []
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return self.name
+
+    def record(self, step):
+        with self._lock:
+            self.order.append(step)
+
+    def update_environment(self):
+        self.record((self.name, 'update_environment'))
+
+    def pre_configure(self):
+        self.record((self.name, 'pre_configure'))
+
+    def post_configure(self):
+        self.record((self.name, 'post_configure'))
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(deployment_base, 'database', database)
+    return database
+
+
+def make_deployment(failing=None, error=ValueError):
+    """Returns a deployment of two controllers and two computes.
+    :param failing: (node name, step) to fail
+    """
+    deployment = StepDeployment('test')
+    for name, features in [('compute1', ['compute']),
+                           ('compute2', ['compute']),
+                           ('controller1', ['controller']),
+                           ('controller2', ['controller'])]:
+        failing_step = failing[1] if failing and failing[0] == name else None
+        deployment.nodes.append(StepNode(name, deployment, features,
+                                         failing_step, error))
+    return deployment
+
+
+def test_build_orders_steps(database):
+    deployment = make_deployment()
+    deployment.build()
+    order = deployment.order
+
+    def before(first, second):
+        return order.index(first) < order.index(second)
+
+    assert order[0] in [('test', 'update_environment')] + [
+        (node.name, 'prepare') for node in deployment.nodes]
+    for node in deployment.nodes:
+        assert before(('test', 'pre_configure'), (node.name, 'pre_configure'))
+        assert before((node.name, 'prepare'), (node.name, 'pre_configure'))
+        assert before((node.name, 'apply_feature'),
+                      (node.name, 'post_configure'))
+    assert before(('controller1', 'apply_feature'),
+                  ('controller2', 'pre_configure'))
+    assert before(('controller1', 'post_configure'),
+                  ('controller2', 'apply_feature'))
+    for compute in ['compute1', 'compute2']:
+        for controller in ['controller1', 'controller2']:
+            assert before((controller, 'post_configure'),
+                          (compute, 'apply_feature'))
+    assert order[-1] == ('test', 'post_configure')
+    assert deployment.status == "post-build"
+
+
+def test_build_stores_deployment_before_each_checkpoint(database):
+    deployment = make_deployment()
+    deployment.build()
+    checkpoints = [index for index, event in enumerate(database.events)
+                   if event[0] == 'checkpoint']
+    assert len(checkpoints) == 2 + 4 * len(deployment.nodes) + 1
+    for index in checkpoints:
+        assert database.events[index - 1][0] == 'store'
+    assert database.events[-1] == ('store', "post-build")
+
+
+def test_resume_skips_completed_steps(database):
+    deployment = make_deployment()
+    database.checkpoints.update(
+        ['test:update_environment', 'test:pre_configure'] +
+        ["controller1:{0}".format(step) for step in Node.build_steps])
+    deployment.build(resume=True)
+    assert ('test', 'update_environment') not in deployment.order
+    assert not [step for step in deployment.order
+                if step[0] == 'controller1']
+    assert ('controller2', 'apply_feature') in deployment.order
+    assert deployment.order[-1] == ('test', 'post_configure')
+
+
+def test_build_without_resume_clears_checkpoints(database):
+    deployment = make_deployment()
+    database.checkpoints.add('test:update_environment')
+    deployment.build()
+    assert ('test', 'update_environment') in deployment.order
+
+
+def test_failed_step_stops_dependent_steps(database):
+    deployment = make_deployment(failing=('controller1', 'apply_feature'))
+    with pytest.raises(ValueError):
+        deployment.build()
+    assert ('controller2', 'apply_feature') not in deployment.order
+    assert ('test', 'post_configure') not in deployment.order
+    assert 'controller1:apply_feature' not in database.checkpoints
+    assert 'controller1:pre_configure' in database.checkpoints
+    assert deployment.status == "build failed"
+    assert database.events[-1] == ('store', "build failed")
+
+
+def test_interrupted_build_is_stored(database):
+    deployment = make_deployment(failing=('compute1', 'prepare'),
+                                 error=KeyboardInterrupt)
+    with pytest.raises(KeyboardInterrupt):
+        deployment.build()
+    assert database.events[-1][0] == 'store'
@@ -0,0 +1,150 @@
+"""Tests storing deployments as JSON records and loading them back,
+including deployments stored as a single pickle by earlier versions."""
+import datetime
+import json
+import weakref
+
+import dill
+import fakeredis
+import pytest
+
+import monster.db_iface as database
+import monster.utils.records as records
+from monster.deployments.base import Deployment
+from monster.nodes.base import Node
+
+
+class Environment(object):
+    def __init__(self, name):
+        self.name = name
+        self.override_attributes = {'deployment': {'name': name}}
+
+
+class DeploymentFeature(object):
+    def __init__(self, deployment):
+        self.deployment = weakref.proxy(deployment)
+        self.settings = {'ports': {80, 443}, 1: "numeric key",
+                         '$special': "marker-like key"}
+
+    def __str__(self):
+        return self.__class__.__name__.lower()
+
+
+class Record(object):
+    """Plain object held by value."""
+    def __init__(self, created):
+        self.created = created
+
+
+class RecordDeployment(Deployment):
+    """Deployment that is set up without a config or template."""
+    def __init__(self, name):
+        self.name = name
+        self.status = "post-build"
+        self.branch = "master"
+        self.product = "compute"
+        self.os_name = "ubuntu"
+        self.provisioner_name = "fake"
+        self.environment = Environment(name)
+        self.nodes = []
+        self.features = [DeploymentFeature(self)]
+        self.record = Record(datetime.datetime(2014, 1, 2, 3, 4, 5))
+
+
+@pytest.fixture
+def deployment():
+    deployment = RecordDeployment('records')
+    for name, features in [('controller1', ['controller']),
+                           ('compute1', ['compute'])]:
+        node = Node(name, "10.0.0.{0}".format(len(deployment.nodes) + 1),
+                    "root", "secret", deployment)
+        node.add_features(features)
+        deployment.nodes.append(node)
+    controller, compute = deployment.nodes
+    controller.feature('controller').number = 1
+    compute.controller = controller
+    return deployment
+
+
+@pytest.fixture
+def db(monkeypatch):
+    connection = fakeredis.FakeStrictRedis(server=fakeredis.FakeServer())
+    monkeypatch.setattr(database, 'db', connection)
+    return connection
+
+
+def round_trip(deployment):
+    return records.load_deployment(
+        records.deployment_record(deployment),
+        {node.name: records.node_record(deployment, node)
+         for node in deployment.nodes},
+        records.features_record(deployment))
+
+
+def check_loaded(loaded):
+    assert isinstance(loaded, RecordDeployment)
+    assert loaded.name == 'records'
+    assert loaded.status == "post-build"
+    assert loaded.environment.override_attributes == {
+        'deployment': {'name': 'records'}}
+    assert loaded.record.created == datetime.datetime(2014, 1, 2, 3, 4, 5)
+    assert loaded.node_names == ['controller1', 'compute1']
+    controller, compute = loaded.nodes
+    assert controller.feature('controller').number == 1
+    assert compute.has_feature('compute')
+    assert compute.controller is controller
+    for node in loaded.nodes:
+        assert isinstance(node.deployment, weakref.ProxyTypes)
+        assert node.deployment.name == 'records'
+        assert node.deployment.nodes[0] is controller
+        for feature in node.features:
+            assert feature.node.name == node.name
+    feature, = loaded.features
+    assert feature.deployment.environment is loaded.environment
+    assert feature.settings == {'ports': {80, 443}, 1: "numeric key",
+                                '$special': "marker-like key"}
+
+
+def test_round_trip(deployment):
+    check_loaded(round_trip(deployment))
+
+
+def test_records_are_json_markers(deployment):
+    node = json.loads(records.node_record(deployment, deployment.nodes[1]))
+    assert node['schema'] == records.SCHEMA_VERSION
+    assert node['state']['deployment'] == {'$ref': ['deployment'],
+                                           'proxy': True}
+    assert node['state']['controller'] == {'$ref': ['node', 'controller1'],
+                                           'proxy': False}
+    feature = json.loads(records.features_record(deployment))['features'][0]
+    assert feature['$object'].endswith('.DeploymentFeature')
+    settings = feature['state']['settings']
+    ports, = [value for key, value in settings['$dict'] if key == 'ports']
+    assert sorted(ports['$set']) == [80, 443]
+    state = json.loads(records.deployment_record(deployment))['state']
+    assert '$pickle' in state['record']['state']['created']
+
+
+def test_rejects_unknown_schema(deployment):
+    record = json.loads(records.deployment_record(deployment))
+    record['schema'] = records.SCHEMA_VERSION + 1
+    with pytest.raises(Exception):
+        records.loads(json.dumps(record))
+
+
+def test_store_and_fetch(deployment, db):
+    database.store(deployment)
+    check_loaded(database.fetch_deployment('records'))
+    assert database.list_deployments()['records']['nodes'] == '2'
+
+
+def test_fetch_converts_legacy_pickle(deployment, db):
+    db.hset('records', database.LEGACY_FIELD, dill.dumps(deployment))
+    check_loaded(database.fetch_deployment('records'))
+    assert db.hget('records', database.LEGACY_FIELD) is None
+    check_loaded(database.fetch_deployment('records'))
+
+
+def test_fetch_missing_deployment(db):
+    with pytest.raises(Exception):
+        database.fetch_deployment('missing')
@@ -0,0 +1,131 @@
+"""Tests the ordering, resumption and failure handling of the build step
+scheduler."""
+import threading
+
+import pytest
+
+from monster.utils.scheduler import Scheduler
+
+
+class Recorder(object):
+    """Makes task functions that record the order in which they run."""
+    def __init__(self):
+        self.order = []
+        self._lock = threading.Lock()
+
+    def task(self, name, error=None):
+        def run():
+            with self._lock:
+                self.order.append(name)
+            if error:
+                raise error
+        return run
+
+
+def test_runs_tasks_after_their_requirements():
+    recorder = Recorder()
+    schedule = Scheduler()
+    schedule.add('c', recorder.task('c'), ['b'])
+    schedule.add('b', recorder.task('b'), ['a'])
+    schedule.add('a', recorder.task('a'))
+    schedule.add('d', recorder.task('d'), ['a', 'c'])
+    schedule.run()
+    assert recorder.order == ['a', 'b', 'c', 'd']
+
+
+def test_runs_independent_tasks_concurrently():
+    started = [threading.Event(), threading.Event()]
+
+    def wait_for_other(index):
+        started[index].set()
+        assert started[1 - index].wait(5), "tasks ran one at a time"
+
+    schedule = Scheduler()
+    schedule.add('first', lambda: wait_for_other(0))
+    schedule.add('second', lambda: wait_for_other(1))
+    schedule.run()
+
+
+def test_rejects_duplicate_task():
+    schedule = Scheduler()
+    schedule.add('a', lambda: None)
+    with pytest.raises(KeyError):
+        schedule.add('a', lambda: None)
+
+
+def test_rejects_unknown_requirement():
+    schedule = Scheduler()
+    schedule.add('a', lambda: None, ['missing'])
+    with pytest.raises(KeyError):
+        schedule.run()
+
+
+def test_detects_cycle():
+    recorder = Recorder()
+    schedule = Scheduler()
+    schedule.add('start', recorder.task('start'))
+    schedule.add('a', recorder.task('a'), ['start', 'b'])
+    schedule.add('b', recorder.task('b'), ['a'])
+    with pytest.raises(Exception) as error:
+        schedule.run()
+    assert "Unsatisfiable" in str(error.value)
+    assert recorder.order == ['start']
+
+
+def test_skips_completed_tasks():
+    recorder = Recorder()
+    checkpoints = []
+    schedule = Scheduler()
+    schedule.add('a', recorder.task('a'))
+    schedule.add('b', recorder.task('b'), ['a'])
+    schedule.add('c', recorder.task('c'), ['b'])
+    schedule.run(completed=['a', 'b', 'unknown'],
+                 on_complete=lambda task: checkpoints.append(task.name))
+    assert recorder.order == ['c']
+    assert checkpoints == ['c']
+
+
+def test_failure_stops_dependent_tasks_and_is_raised():
+    recorder = Recorder()
+    checkpoints = []
+    schedule = Scheduler(max_workers=1)
+    schedule.add('a', recorder.task('a'))
+    schedule.add('fails', recorder.task('fails', ValueError("broken")),
+                  ['a'])
+    schedule.add('after', recorder.task('after'), ['fails'])
+    with pytest.raises(ValueError):
+        schedule.run(on_complete=lambda task: checkpoints.append(task.name))
+    assert 'after' not in recorder.order
+    assert checkpoints == ['a']
+
+
+def test_failure_lets_running_tasks_finish():
+    release = threading.Event()
+    finished = []
+
+    def slow():
+        release.wait(5)
+        finished.append('slow')
+
+    def fails():
+        release.set()
+        raise ValueError("broken")
+
+    schedule = Scheduler()
+    schedule.add('slow', slow)
+    schedule.add('fails', fails)
+    with pytest.raises(ValueError):
+        schedule.run()
+    assert finished == ['slow']
+
+
+def test_critical_path_follows_last_finished_requirements():
+    schedule = Scheduler()
+    schedule.add('a', lambda: None)
+    schedule.add('b', lambda: None)
+    schedule.add('c', lambda: None, ['a', 'b'])
+    schedule.run()
+    schedule.tasks['a'].end = schedule.tasks['b'].end + 1
+    schedule.tasks['c'].end = schedule.tasks['a'].end + 1
+    assert [task.name for task in schedule.critical_path()] == ['a', 'c']
+    assert "total" in schedule.critical_path_report()
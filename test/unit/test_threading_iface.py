@@ -0,0 +1,185 @@
+"""Tests running functions concurrently with threading_iface.execute and
+waiting for command tasks with gather."""
+import threading
+import time
+
+import pytest
+
+import monster.active as active
+import monster.threading_iface as threading_iface
+
+
+@pytest.fixture(autouse=True)
+def config(monkeypatch):
+    monkeypatch.setattr(active, 'config', {})
+    monkeypatch.setattr(active, 'build_args', {})
+
+
+def returns(value, delay=0):
+    def func():
+        time.sleep(delay)
+        return value
+    return func
+
+
+def raises(error):
+    def func(stop=None):
+        raise error
+    return func
+
+
+def test_execute_returns_results_in_order():
+    funcs = [returns(index, delay=0.01 * (5 - index)) for index in range(5)]
+    assert threading_iface.execute(funcs) == range(5)
+
+
+def test_execute_nothing():
+    assert threading_iface.execute([]) == []
+
+
+def test_execute_fail_fast_raises_first_failure():
+    ran = []
+    funcs = [raises(ValueError("broken"))] + [
+        lambda: ran.append(1) or time.sleep(0.05) for _ in range(10)]
+    with pytest.raises(ValueError):
+        threading_iface.execute(funcs, max_workers=1)
+    assert len(ran) < 10
+
+
+def test_execute_collects_failures():
+    error = ValueError("broken")
+    with pytest.raises(threading_iface.ExecutionError) as raised:
+        threading_iface.execute([returns(1), raises(error), returns(3)],
+                                fail_fast=False)
+    assert raised.value.errors == [(1, error)]
+    assert raised.value.results == [1, error, 3]
+
+
+def test_execute_times_out():
+    release = threading.Event()
+    with pytest.raises(threading_iface.TimeoutError):
+        threading_iface.execute([lambda: release.wait(5)], timeout=0.1)
+    release.set()
+
+
+def test_execute_limits_threads_to_max_workers():
+    active.build_args['max_workers'] = 2
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def func():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    threading_iface.execute([func] * 8)
+    assert max(peak) == 2
+
+
+def test_max_workers_prefers_build_argument_to_config():
+    active.config['threading'] = {'max_workers': 4}
+    assert threading_iface.max_workers(10) == 4
+    active.build_args['max_workers'] = "3"
+    assert threading_iface.max_workers(10) == 3
+    assert threading_iface.max_workers(2) == 2
+    assert threading_iface.max_workers(0) == 1
+
+
+def test_execute_each_keys_results():
+    results = threading_iface.execute_each(
+        {'a': returns(1), 'b': raises(ValueError("broken"))},
+        fail_fast=False)
+    assert results['a'] == 1
+    assert isinstance(results['b'], ValueError)
+
+
+def test_gather_keys_results_by_task_name():
+    tasks = [threading_iface.submit(lambda stop, index=index: index,
+                                    name="task{0}".format(index))
+             for index in range(3)]
+    assert threading_iface.gather(tasks) == {'task0': 0, 'task1': 1,
+                                             'task2': 2}
+
+
+def test_gather_fail_fast_stops_running_tasks():
+    stopped = threading.Event()
+
+    def waits(stop):
+        stop.wait(5)
+        stopped.set()
+
+    def fails(stop):
+        time.sleep(0.05)
+        raise ValueError("broken")
+
+    tasks = [threading_iface.submit(waits, name='waits'),
+             threading_iface.submit(fails, name='fails')]
+    with pytest.raises(ValueError):
+        threading_iface.gather(tasks)
+    assert stopped.wait(5)
+
+
+def test_gather_collects_failures():
+    tasks = [threading_iface.submit(lambda stop: 1, name='ok'),
+             threading_iface.submit(raises(ValueError("broken")),
+                                    name='fails')]
+    results = threading_iface.gather(tasks, fail_fast=False)
+    assert results['ok'] == 1
+    assert isinstance(results['fails'], ValueError)
+
+
+def test_gather_times_out_and_cancels():
+    tasks = [threading_iface.submit(lambda stop: stop.wait(5), name='slow')]
+    with pytest.raises(threading_iface.TimeoutError):
+        threading_iface.gather(tasks, timeout=0.1)
+    assert tasks[0].stop.is_set()
+
+
+def test_gather_starts_unstarted_tasks_within_concurrency():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def func(stop):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    tasks = [threading_iface.Task(func, name=str(index), start=False)
+             for index in range(8)]
+    threading_iface.gather(tasks, concurrency=2)
+    assert len(peak) == 8
+    assert max(peak) == 2
+
+
+def test_gather_fail_fast_never_starts_waiting_tasks():
+    started = []
+
+    def func(index):
+        def run(stop):
+            started.append(index)
+            if index == 0:
+                raise ValueError("broken")
+        return run
+
+    tasks = [threading_iface.Task(func(index), name=str(index), start=False)
+             for index in range(5)]
+    with pytest.raises(ValueError):
+        threading_iface.gather(tasks, concurrency=1)
+    assert started == [0]
+    assert all(task.stop.is_set() for task in tasks[1:])
+
+
+def test_cancelled_task_is_not_started():
+    task = threading_iface.Task(lambda stop: 1, start=False)
+    task.cancel()
+    task.start()
+    assert task.future is None
+    assert not task.done()